@@ -0,0 +1,213 @@
+import heapq
+import asyncio
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager, asynccontextmanager
+from tracing import span
+
+# request priorities, lower is served first
+INTERACTIVE = 0
+BACKGROUND = 1
+
+# priority of the code that is currently running, inherited by threads started with tracing.submit and by tasks
+_priority = contextvars.ContextVar("admission_priority", default=INTERACTIVE)
+
+BUSY_MESSAGE = "I'm handling a lot of requests right now, please try again in a moment."
+
+class ServerBusy(Exception):
+    """Raised when a request is shed instead of queued for the model server."""
+
+@contextmanager
+def priority(level):
+    """Run the enclosed model calls with the given priority, e.g. BACKGROUND for re-indexing."""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+def set_priority(level):
+    """Set the priority for the rest of the current thread, e.g. as a thread pool initializer."""
+    _priority.set(level)
+
+class Waiter:
+    """A queued request, woken from a thread or on an event loop when it is granted a slot."""
+
+    def __init__(self, level, loop=None):
+        self.level = level
+        self.loop = loop
+        self.granted = False
+        self.entry = None
+        if loop is None:
+            self.event = threading.Event()
+        else:
+            self.future = loop.create_future()
+
+    def wake(self):
+        self.granted = True
+        if self.loop is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self.set_result)
+
+    def set_result(self):
+        if not self.future.done():
+            self.future.set_result(True)
+
+class ModelLimiter:
+    """Concurrency limit for one model with a priority queue, shared by threads and event loops.
+
+    A released slot is handed directly to the best queued request, so later arrivals cannot
+    overtake it. Interactive requests are shed when max_queue of them are already waiting or
+    after max_wait seconds, background requests wait as long as it takes.
+    """
+
+    def __init__(self, name, max_concurrency, max_queue=16, max_wait=None):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.active = 0
+        self.waiters = []
+        self.sequence = itertools.count()
+        self.lock = threading.Lock()
+        self.stats_counts = {"admitted": 0, "queued": 0, "shed": 0}
+
+    def depth(self, level):
+        return sum(1 for entry in self.waiters if entry[0] <= level)
+
+    def queue_depth(self, level=INTERACTIVE):
+        """Number of queued requests that would be served before a new request of the given priority."""
+        with self.lock:
+            return self.depth(level)
+
+    def enqueue(self, level, loop=None):
+        """Take a free slot and return None, or return a queued Waiter."""
+        with self.lock:
+            if self.active < self.max_concurrency and not self.waiters:
+                self.active += 1
+                self.stats_counts["admitted"] += 1
+                return None
+            if level == INTERACTIVE and self.depth(level) >= self.max_queue:
+                self.stats_counts["shed"] += 1
+                raise ServerBusy(f"{self.name} queue is full")
+            waiter = Waiter(level, loop)
+            waiter.entry = (level, next(self.sequence), waiter)
+            heapq.heappush(self.waiters, waiter.entry)
+            self.stats_counts["queued"] += 1
+            return waiter
+
+    def withdraw(self, waiter):
+        """Remove a waiter that gave up, returns True if it was granted a slot in the meantime."""
+        with self.lock:
+            if waiter.granted:
+                return True
+            self.waiters.remove(waiter.entry)
+            heapq.heapify(self.waiters)
+            return False
+
+    def shed(self, waiter):
+        if self.withdraw(waiter):
+            return
+        with self.lock:
+            self.stats_counts["shed"] += 1
+        raise ServerBusy(f"{self.name} did not get a slot within {self.max_wait} seconds")
+
+    def timeout(self, level):
+        return self.max_wait if level == INTERACTIVE else None
+
+    def acquire(self):
+        level = _priority.get()
+        waiter = self.enqueue(level)
+        if waiter is None:
+            return
+        with span("admission.wait", model=self.name, priority=level):
+            if not waiter.event.wait(self.timeout(level)):
+                self.shed(waiter)
+
+    async def aacquire(self):
+        level = _priority.get()
+        waiter = self.enqueue(level, asyncio.get_running_loop())
+        if waiter is None:
+            return
+        with span("admission.wait", model=self.name, priority=level):
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self.timeout(level))
+            except asyncio.TimeoutError:
+                self.shed(waiter)
+            except asyncio.CancelledError:
+                # a slot granted to a cancelled task goes to the next request
+                if self.withdraw(waiter):
+                    self.release()
+                raise
+
+    def release(self):
+        with self.lock:
+            if self.waiters:
+                # hand the slot over, the number of active requests stays the same
+                heapq.heappop(self.waiters)[2].wake()
+                self.stats_counts["admitted"] += 1
+            else:
+                self.active -= 1
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def aslot(self):
+        await self.aacquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        with self.lock:
+            return {**self.stats_counts, "active": self.active, "waiting": len(self.waiters)}
+
+class AdmissionController:
+    """Per-model limiters from the admission section of config.yaml, keyed by model name.
+
+    Clients of the same model share its limiter whatever they are used for, e.g. the intent,
+    text2sql and chat llms when they all run llama3.1. Models without a limit get default_limit.
+    """
+
+    def __init__(self, config):
+        admission_config = config.get('admission', {})
+        self.enabled = admission_config.get('enabled', False)
+        self.max_queue = admission_config.get('max_queue', 16)
+        self.max_wait = admission_config.get('max_wait')
+        self.limits = admission_config.get('limits', {})
+        self.default_limit = admission_config.get('default_limit', 2)
+        self.limiters = {}
+        self.lock = threading.Lock()
+
+    def limiter(self, model):
+        if not self.enabled:
+            return None
+        with self.lock:
+            if model not in self.limiters:
+                self.limiters[model] = ModelLimiter(
+                    model, self.limits.get(model, self.default_limit), max_queue=self.max_queue, max_wait=self.max_wait
+                )
+            return self.limiters[model]
+
+    def check(self):
+        """Shed a new interactive turn up front if any model queue is already full."""
+        if not self.enabled:
+            return
+        with self.lock:
+            limiters = list(self.limiters.values())
+        for limiter in limiters:
+            if limiter.queue_depth(INTERACTIVE) >= self.max_queue:
+                raise ServerBusy(f"{limiter.name} queue is full")
+
+    def stats(self):
+        with self.lock:
+            return {model: limiter.stats() for model, limiter in self.limiters.items()}
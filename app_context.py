@@ -0,0 +1,60 @@
+import threading
+import yaml
+from concurrent.futures import ThreadPoolExecutor
+from sqldb import SQLDBOperator
+from vectordb import VectorDBOperator
+from vector_sync import VectorSync
+from intent import IntentRecognizer
+from chat_llm import ChatLLM
+from text2sql import TextToSQL
+import tracing
+from ollama_client import get_ollama_clients
+
+class AppContext:
+    """Long-lived operators and LLM clients shared by every chat turn."""
+
+    def __init__(self, config_file='config.yaml', vector_db_type="faiss", config=None, llm=None, embeddings=None):
+        # config, llm and embeddings can be injected, e.g. with the local stand-ins in bench/
+        self.config = config if config is not None else self.load_config(config_file)
+        tracing.configure(self.config)
+
+        # worker pool for overlapping the independent stages of a chat turn
+        self.executor = ThreadPoolExecutor(max_workers=self.config.get('pipeline_workers', 8), thread_name_prefix="pipeline")
+
+        # database operators: one engine and one loaded vector index per process
+        self.db_operator = SQLDBOperator(config=self.config)
+        self.vector_db_operator = VectorDBOperator(self.db_operator, vector_db_type=vector_db_type, config=self.config, embeddings=embeddings)
+        # applies committed item changes to the vector index in the background
+        self.vector_sync = VectorSync(self.db_operator, self.vector_db_operator, self.config)
+        self.vector_sync.start()
+
+        # llm components: prompts and clients are built once, queries are passed per call
+        self.recognizer = IntentRecognizer(config=self.config, llm=llm, json_llm=llm, executor=self.executor,
+                                           embeddings=self.vector_db_operator.embeddings)
+        self.chat_llm = ChatLLM(config=self.config, llm=llm)
+        self.text2sql = TextToSQL(config=self.config, llm=llm, db_manager=self.db_operator)
+        # per-model limits in front of the model server, checked before a chat turn starts
+        self.admission = get_ollama_clients(self.config).admission
+
+    def load_config(self, config_file):
+        with open(config_file, 'r') as file:
+            return yaml.safe_load(file)
+
+
+_app_context = None
+_app_context_lock = threading.Lock()
+
+def get_app_context():
+    """Return the process-wide AppContext, building it on first use."""
+    global _app_context
+    if _app_context is None:
+        with _app_context_lock:
+            if _app_context is None:
+                _app_context = AppContext()
+    return _app_context
+
+def set_app_context(ctx):
+    """Replace the process-wide AppContext, e.g. with one built on local stand-ins."""
+    global _app_context
+    with _app_context_lock:
+        _app_context = ctx
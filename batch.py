@@ -0,0 +1,180 @@
+import os
+import json
+import time
+import logging
+import argparse
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from app_context import get_app_context
+from admission import BACKGROUND, priority, set_priority
+from pipeline import manipulate_database
+
+def read_queries(input_file):
+    """Stream queries from a JSONL file, one {"query": ...} (or "input"/"body") object per line."""
+    with open(input_file, 'r') as file:
+        for line_no, line in enumerate(file):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            query = record.get("query") or record.get("input") or record.get("body")
+            yield {"id": record.get("request_id", record.get("id", line_no)), "query": query}
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+def timed(func, *args):
+    start_t = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start_t
+
+def attempt(record, stage, func, *args):
+    """Run one stage of a record, a failure is kept in record["error"] instead of ending the batch."""
+    try:
+        result, record["timings"][stage] = timed(func, *args)
+        return result
+    except Exception as e:
+        logging.exception(f"Batch {stage} failed for query {record['id']}")
+        record["error"] = f"{stage}: {e!r}"
+        return None
+
+class BatchRunner:
+    """Run a batch of queries through the pipeline stage by stage.
+
+    LLM calls of one stage are sent concurrently through a bounded worker pool,
+    and the query embeddings of a chunk are computed in one embed_documents call
+    and passed to the searches.
+    A record whose stage fails keeps the error and skips the later stages.
+    """
+
+    def __init__(self, ctx, workers=4, skip_writes=True):
+        self.ctx = ctx
+        # batch runs queue behind interactive chat turns for the model server
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch",
+                                           initializer=set_priority, initargs=(BACKGROUND,))
+        # replayed logs would repeat every create, update and delete on the live database
+        self.skip_writes = skip_writes
+
+    def run_intents(self, records):
+        results = self.executor.map(lambda r: attempt(r, "intent", self.ctx.recognizer.get_intents, r["query"]), records)
+        for record, result in zip(records, list(results)):
+            if "error" not in record:
+                task_type, operation_type, info = result
+                record.update(task_type=task_type, operation_type=operation_type, info=info)
+
+    def run_search(self, records):
+        if not records:
+            return
+        vector_db_operator = self.ctx.vector_db_operator
+        # one batched embedding call, the searches below reuse its vectors
+        try:
+            vectors, elapsed = timed(vector_db_operator.embeddings.embed_documents, [r["query"] for r in records])
+        except Exception as e:
+            logging.exception(f"Batch embedding of {len(records)} queries failed")
+            for record in records:
+                record["error"] = f"embedding: {e!r}"
+            return
+        filter = vector_db_operator.get_filter()
+        for record, vector in zip(records, vectors):
+            record["timings"]["embedding"] = elapsed / len(records)
+            if vector_db_operator.config.get('retrieval', {}).get('mode') == "hybrid":
+                record["relevant_ids"] = attempt(record, "search", vector_db_operator.hybrid_search_by_vector, record["query"], vector)
+            else:
+                retrieval = attempt(record, "search", vector_db_operator.search_by_vector, vector, filter)
+                if "error" not in record:
+                    record["relevant_ids"] = vector_db_operator.get_id_by_doc([doc for doc, _ in retrieval])
+
+    def run_database(self, records):
+        # database operations stay sequential so writes are applied in input order,
+        # runs of consecutive creates are written in one transaction
+        creates = []
+        for record in records:
+            if "error" in record:
+                continue
+            if record["operation_type"] == "create" and not self.skip_writes:
+                creates.append(record)
+                continue
+            self.run_creates(creates)
+            creates = []
+            if self.skip_writes and record["operation_type"] != "search":
+                record["sql_response"] = {"status": 1, "message": f"{record['operation_type']} skipped in batch replay"}
+                record["timings"]["database"] = 0.0
+                continue
+            record["sql_response"] = attempt(
+                record, "database", manipulate_database, record["operation_type"], record["task_type"], record["info"],
+                record["relevant_ids"], self.ctx.db_operator
+            )
+        self.run_creates(creates)
+
+    def run_creates(self, records):
+        if not records:
+            return
+        start_t = time.perf_counter()
+        try:
+            sql_response = self.ctx.db_operator.create_items([record["info"] for record in records])
+        except Exception as e:
+            logging.exception(f"Batch create of {len(records)} items failed")
+            for record in records:
+                record["error"] = f"database: {e!r}"
+            return
+        # invalid records are skipped by create_items and fail on their own, the others are written in order
+        errors = sql_response.get("errors", {})
+        rows = iter(sql_response["items"])
+        for i, record in enumerate(records):
+            if i in errors:
+                record["sql_response"] = {"status": 0, "message": errors[i]}
+            elif sql_response["status"] == 1:
+                record["sql_response"] = {"status": 1, "message": f"Created item with ID: {next(rows)['item_id']}"}
+            else:
+                record["sql_response"] = sql_response
+        elapsed = time.perf_counter() - start_t
+        for record in records:
+            record["timings"]["database"] = elapsed / len(records)
+
+    def run_responses(self, records):
+        def respond(r):
+            return attempt(r, "response", self.ctx.chat_llm.generate_response, r["query"], r["operation_type"], r["task_type"], r["sql_response"])
+        records = [r for r in records if "error" not in r]
+        for record, response in zip(records, list(self.executor.map(respond, records))):
+            if "error" not in record:
+                record["response"] = response
+
+    def run(self, records):
+        for record in records:
+            record.update(task_type=None, operation_type=None, info=None, relevant_ids=None, sql_response=None, timings={})
+
+        self.run_intents(records)
+        # only task queries continue through search and database, chat queries go straight to the response
+        task_records = [r for r in records if "error" not in r and r["task_type"] and r["operation_type"]]
+        self.run_search(task_records)
+        self.run_database(task_records)
+        self.run_responses(records)
+        return records
+
+def run_batch(input_file, output_file, workers=4, chunk_size=64, skip_writes=True):
+    runner = BatchRunner(get_app_context(), workers=workers, skip_writes=skip_writes)
+    count = 0
+    start_t = time.perf_counter()
+    with open(output_file, 'w') as out, priority(BACKGROUND):
+        for chunk in chunked(read_queries(input_file), chunk_size):
+            for record in runner.run(chunk):
+                out.write(json.dumps(record, default=str) + "\n")
+            out.flush()
+            count += len(chunk)
+            logging.info(f"Processed {count} queries")
+    print(f"Processed {count} queries in {time.perf_counter() - start_t:.2f}s, results written to {output_file}")
+
+if __name__ == "__main__":
+    os.environ["LANGCHAIN_TRACING_V2"] = "false"
+
+    parser = argparse.ArgumentParser(description="Run a JSONL file of queries through the assistant pipeline.")
+    parser.add_argument("input_file", help="JSONL file with one query per line")
+    parser.add_argument("output_file", help="JSONL file for the results and per-stage timings")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent LLM calls per stage")
+    parser.add_argument("--chunk-size", type=int, default=64, help="queries processed per stage round")
+    parser.add_argument("--apply-writes", action="store_true", help="execute create/update/delete operations, skipped by default")
+    args = parser.parse_args()
+
+    run_batch(args.input_file, args.output_file, args.workers, args.chunk_size, skip_writes=not args.apply_writes)
@@ -0,0 +1,98 @@
+import os
+import random
+import sqlite3
+from datetime import date, timedelta
+
+SCALES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+
+RECURRENCES = [("DAILY", r) for r in (1, 2, 5, 7)] + [("WEEKLY", r) for r in range(1, 8)] + \
+              [("BIWEEKLY", r) for r in range(1, 8)] + [("MONTHLY", r) for r in (1, 10, 15, 28)]
+
+SUBJECTS = ["team", "project", "budget", "design", "client", "yoga", "training", "product", "release", "family",
+            "finance", "marketing", "hiring", "research", "course", "doctor", "travel", "newsletter", "quarterly", "sprint"]
+KINDS = ["meeting", "review", "sync", "class", "reminder", "report", "planning", "check-in", "deadline", "standup"]
+
+SCHEMA = '''
+CREATE TABLE recurrence (
+    recurrence_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    recurrence_pattern TEXT CHECK(recurrence_pattern IN ('DAILY', 'WEEKLY', 'BIWEEKLY', 'MONTHLY')) NOT NULL,
+    recurrence_rule INTEGER NOT NULL,
+    UNIQUE (recurrence_pattern, recurrence_rule)
+);
+CREATE TABLE item (
+    item_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title TEXT DEFAULT NULL,
+    content TEXT NOT NULL,
+    item_type TEXT CHECK(item_type IN ('NOTE', 'EVENT')) NOT NULL DEFAULT 'NOTE',
+    item_status TEXT CHECK(item_status IN ('ACTIVE', 'CANCELLED', 'COMPLETED')) DEFAULT 'ACTIVE',
+    recurrence_id INTEGER DEFAULT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (recurrence_id) REFERENCES recurrence(recurrence_id) ON DELETE SET NULL
+);
+CREATE TABLE schedule (
+    schedule_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    item_id INTEGER NOT NULL,
+    start_date DATE NOT NULL,
+    start_time TIME NOT NULL,
+    end_date DATE NOT NULL,
+    end_time TIME NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (item_id) REFERENCES item(item_id) ON DELETE CASCADE
+);
+'''
+
+def generate_rows(num_items, seed=0, anchor=None):
+    """Yield (item, schedule or None) rows, about 70% events of which 40% recur, dated around anchor (today)."""
+    rng = random.Random(seed)
+    today = anchor or date.today()
+    for item_id in range(1, num_items + 1):
+        subject, kind = rng.choice(SUBJECTS), rng.choice(KINDS)
+        title = f"{subject.title()} {kind}"
+        content = f"{kind} about the {subject} {rng.choice(SUBJECTS)} with {rng.choice(SUBJECTS)} notes #{item_id}"
+        is_event = rng.random() < 0.7
+        recurrence_id = rng.randint(1, len(RECURRENCES)) if is_event and rng.random() < 0.4 else None
+        status = rng.choices(["ACTIVE", "CANCELLED", "COMPLETED"], weights=[8, 1, 1])[0]
+        item = (item_id, title, content, "EVENT" if is_event else "NOTE", status, recurrence_id)
+
+        sched = None
+        if is_event:
+            start = today + timedelta(days=rng.randint(-180, 180))
+            hour = rng.randint(7, 19)
+            sched = (item_id, start.isoformat(), f"{hour:02d}:00:00.000000", start.isoformat(), f"{hour + 1:02d}:00:00.000000")
+        yield item, sched
+
+def dataset_path(workdir, scale, seed=0, anchor=None):
+    """Path of the dataset for a scale, seed and anchor date, datasets built on other days are not reused."""
+    return os.path.join(workdir, f"dataset_{scale}_seed{seed}_{(anchor or date.today()).isoformat()}.db")
+
+def build_dataset(path, scale, seed=0, batch_size=10_000, anchor=None):
+    """Create a synthetic SQLite database at path with the given number of items, reusing an existing one.
+
+    The dates are relative to anchor (today). Benchmarks get their path from dataset_path, so a
+    dataset is only reused on the day it was built and every run has the same dates relative to today.
+    """
+    num_items = SCALES.get(scale, None) or int(scale)
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    conn = sqlite3.connect(path + ".tmp")
+    conn.executescript(SCHEMA)
+    conn.executemany("INSERT INTO recurrence (recurrence_pattern, recurrence_rule) VALUES (?, ?)", RECURRENCES)
+    items, schedules = [], []
+    for item, sched in generate_rows(num_items, seed, anchor):
+        items.append(item)
+        if sched:
+            schedules.append(sched)
+        if len(items) >= batch_size:
+            conn.executemany("INSERT INTO item (item_id, title, content, item_type, item_status, recurrence_id) VALUES (?, ?, ?, ?, ?, ?)", items)
+            conn.executemany("INSERT INTO schedule (item_id, start_date, start_time, end_date, end_time) VALUES (?, ?, ?, ?, ?)", schedules)
+            items, schedules = [], []
+    conn.executemany("INSERT INTO item (item_id, title, content, item_type, item_status, recurrence_id) VALUES (?, ?, ?, ?, ?, ?)", items)
+    conn.executemany("INSERT INTO schedule (item_id, start_date, start_time, end_date, end_time) VALUES (?, ?, ?, ?, ?)", schedules)
+    conn.commit()
+    conn.close()
+    os.replace(path + ".tmp", path)
+    return path
@@ -0,0 +1,95 @@
+import re
+import json
+import time
+import hashlib
+import numpy as np
+from typing import Any, Optional
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.llms import LLM
+
+# keywords used by the canned responses to pick an operation for a query
+OPERATION_KEYWORDS = {
+    "delete": ("delete", "remove", "cancel"),
+    "update": ("update", "change", "move", "reschedule"),
+    "create": ("add", "create", "schedule a", "book", "remind", "set a"),
+}
+SCHEDULE_KEYWORDS = ("meeting", "today", "tomorrow", "week", "month", "am", "pm", "daily", "weekly", "every", "schedule", "class", "standup")
+NOTE_KEYWORDS = ("note", "memo", "list", "remind", "reminder", "task")
+
+def get_query(prompt):
+    """The user query is the last human message of the rendered prompt."""
+    return prompt.rsplit("Human:", 1)[-1].replace("User query:", "").strip()
+
+def classify(query):
+    words = query.lower()
+    if any(re.search(rf"\b{k}\b", words) for k in SCHEDULE_KEYWORDS):
+        task_type = "schedule"
+    elif any(re.search(rf"\b{k}\b", words) for k in NOTE_KEYWORDS):
+        task_type = "note"
+    else:
+        return None, None
+    for operation_type, keywords in OPERATION_KEYWORDS.items():
+        if any(k in words for k in keywords):
+            return task_type, operation_type
+    return task_type, "search"
+
+def canned_response(prompt):
+    """Deterministic answer for each prompt used by the pipeline."""
+    query = get_query(prompt)
+    task_type, operation_type = classify(query)
+    info = {"content": query, "start_date": None, "start_time": None, "end_date": None, "end_time": None,
+            "recurrence_pattern": None, "recurrence_rule": None, "search_time_frame": None}
+    if operation_type == "create" and task_type == "schedule":
+        info.update(start_date="tomorrow", start_time="3 PM", end_date="tomorrow", end_time="4 PM")
+    elif operation_type == "search" and task_type == "schedule":
+        info.update(search_time_frame="next week")
+
+    if "reply with one JSON object" in prompt:
+        return json.dumps({"task_type": task_type, "operation_type": operation_type, "info": info if task_type else None})
+    if "Determine the relevance" in prompt:
+        return task_type or "None"
+    if "operation types" in prompt:
+        return operation_type or "None"
+    if "time information for scheduling" in prompt:
+        return json.dumps(info)
+    if "original description of an event" in prompt:
+        return json.dumps({"content": query})
+    if "SQL expert" in prompt:
+        return "SELECT * FROM item;"
+    return "Sure, this is a canned response from the local stand-in."
+
+class FakeLLM(LLM):
+    """Local stand-in for OllamaLLM with canned answers and a configurable latency."""
+
+    latency: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-ollama"
+
+    def _call(self, prompt: str, stop: Optional[list[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        return canned_response(prompt)
+
+class FakeEmbeddings(Embeddings):
+    """Local stand-in for OllamaEmbeddings with hash-seeded unit vectors."""
+
+    def __init__(self, dim=64, latency=0.0):
+        self.dim = dim
+        self.latency = latency
+        self.calls = 0
+
+    def embed(self, text):
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.dim)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return [self.embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
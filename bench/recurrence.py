@@ -0,0 +1,98 @@
+"""Recurrence benchmark: calendar views of get_items over the synthetic dataset.
+
+Windows within the occurrence_table horizon read the materialized occurrences, the others expand
+recurring items on the fly. Every window runs once with an empty occurrence cache and then
+repeatedly with a warm one. The initial build of the occurrence table and the expansion alone
+on all recurring schedule rows are timed as well.
+
+Usage: python -m bench.recurrence --scale 100k [--repeat 20] [--output results.json]
+"""
+import os
+import copy
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+from functools import partial
+from datetime import date, timedelta
+import yaml
+from bench.datasets import SCALES, build_dataset, dataset_path
+from bench.timing import summarize, measure
+from occurrences import expand
+from sqldb import SQLDBOperator
+
+# search_time_frame values, the window runs from today to the parsed date
+WINDOWS = {"week": "in 7 days", "30_days": "in 30 days", "quarter": "in 3 months", "half_year": "in 6 months", "year": "in 12 months"}
+
+def recurring_rows(db_operator):
+    with db_operator.engine.connect() as connection:
+        return connection.exec_driver_sql(
+            "SELECT recurrence_pattern, recurrence_rule, start_date FROM item "
+            "JOIN schedule USING (item_id) JOIN recurrence USING (recurrence_id)"
+        ).all()
+
+def run_benchmarks(args):
+    workdir = os.path.join(args.workdir, f"recurrence_{args.scale}")
+    shutil.rmtree(workdir, ignore_errors=True)
+    os.makedirs(workdir)
+    dataset = build_dataset(dataset_path(args.workdir, args.scale, args.seed), args.scale, seed=args.seed)
+    db_path = os.path.join(workdir, "items.db")
+    shutil.copy(dataset, db_path)
+
+    with open(args.config, 'r') as file:
+        config = copy.deepcopy(yaml.safe_load(file))
+    config['database']['name'] = db_path[:-len(".db")]
+    config['paths']['logging_file'] = os.path.join(workdir, "application.log")
+    start_t = time.perf_counter()
+    db_operator = SQLDBOperator(config)
+    results = {"build_seconds": time.perf_counter() - start_t}
+    with db_operator.engine.connect() as connection:
+        results["occurrences"] = connection.exec_driver_sql("SELECT COUNT(*) FROM occurrence").scalar()
+    print(f"occurrence table: {results['occurrences']} rows, built in {results['build_seconds']:.2f} s")
+
+    for name, time_frame in WINDOWS.items():
+        view = partial(db_operator.get_items, search_time_frame=time_frame)
+        db_operator.occurrences.invalidate()
+        cold = summarize(measure(view))
+        warm = summarize(measure(view, repeat=args.repeat))
+        rows = len(view()["data"])
+        materialized = db_operator.occurrence_store.covers(*db_operator.get_search_window(time_frame))
+        results[name] = {"rows": rows, "materialized": materialized, "cold": cold, "warm": warm}
+        print(f"get_items {name} ({'materialized' if materialized else 'expanded'}): {rows} rows, "
+              f"cold={cold['p50'] * 1000:.2f} ms warm p50={warm['p50'] * 1000:.2f} ms")
+
+    patterns, rules, anchors = zip(*recurring_rows(db_operator))
+    anchors = [date.fromisoformat(anchor) for anchor in anchors]
+    today = date.today()
+    for days in (31, 183):
+        timings = measure(expand, patterns, rules, anchors, today, today + timedelta(days=days), repeat=args.repeat)
+        results[f"expand_{days}d"] = {"schedules": len(anchors), **summarize(timings)}
+        print(f"expand {len(anchors)} recurring schedules over {days} days: p50={results[f'expand_{days}d']['p50'] * 1000:.2f} ms")
+
+    return {
+        "scale": args.scale,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "parameters": {k: v for k, v in vars(args).items() if k not in ("output", "workdir", "config")},
+        "results": results,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time recurrence expansion for calendar views on synthetic data.")
+    parser.add_argument("--scale", default="100k", help=f"dataset size: {', '.join(SCALES)} or a number of items")
+    parser.add_argument("--repeat", type=int, default=20, help="repetitions of each warm query")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--config", default="config.yaml")
+    parser.add_argument("--workdir", default="bench/data")
+    parser.add_argument("--output", default=None, help="JSON file for the results (default: bench/results/recurrence-<scale>-<time>.json)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    report = run_benchmarks(args)
+    output = args.output or os.path.join("bench", "results", f"recurrence-{args.scale}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f"Results written to {output}")
@@ -0,0 +1,144 @@
+"""Reproducible benchmarks on synthetic data with local LLM and embedding stand-ins.
+
+Usage: python -m bench.run --scale 1k [--llm-latency 0.05] [--output results.json]
+"""
+import os
+import copy
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import yaml
+from sqlalchemy import create_engine
+from migrations import migrate
+from bench.datasets import SCALES, build_dataset, dataset_path
+from bench.fakes import FakeLLM, FakeEmbeddings
+from app_context import AppContext, set_app_context
+from bench.timing import summarize, measure
+
+QUERIES = [
+    "show me my meetings next week",
+    "what is on my schedule this week",
+    "add a budget review meeting tomorrow at 3pm",
+    "delete the yoga class",
+    "update the team sync to 11 am",
+    "show my notes about the design project",
+    "how are you today?",
+]
+
+GET_ITEMS_FILTERS = {
+    "time_frame": {"search_time_frame": "next week"},
+    "content": {"content": "budget review"},
+    "item_ids": {"item_id": list(range(1, 51))},
+    "recurrence": {"recurrence_pattern": "WEEKLY", "recurrence_rule": 3},
+}
+
+def make_config(base_config, workdir, db_path):
+    """Point the database and every output path of the config into the benchmark workdir."""
+    config = copy.deepcopy(base_config)
+    config['database']['name'] = db_path[:-len(".db")]
+    for key, name in [("faiss_db", "faiss_db/"), ("chroma_db", "chroma_db/"), ("reindex_dir", "reindex/"), ("embedding_cache", "embeddings.db"),
+                      ("trace_file", "traces.jsonl"), ("logging_file", "application.log"), ("csv_output", "csv/")]:
+        config['paths'][key] = os.path.join(workdir, name)
+    config.setdefault('tracing', {})['enabled'] = False
+    return config
+
+def prepare_database(db_path):
+    """Migrate the dataset copy and drop the changelog backfill, the benchmark builds the vector index itself."""
+    engine = create_engine(f"sqlite:///{db_path}")
+    migrate(engine)
+    with engine.begin() as connection:
+        connection.exec_driver_sql("DELETE FROM item_changelog")
+    engine.dispose()
+
+def run_benchmarks(args):
+    import main  # imported late, the module builds the Gradio interface
+    os.environ["LANGCHAIN_TRACING_V2"] = "false"
+
+    # fresh working copy of the dataset, the end-to-end run writes to it
+    workdir = os.path.join(args.workdir, args.scale)
+    shutil.rmtree(workdir, ignore_errors=True)
+    os.makedirs(workdir)
+    dataset = build_dataset(dataset_path(args.workdir, args.scale, args.seed), args.scale, seed=args.seed)
+    db_path = os.path.join(workdir, "bench.db")
+    shutil.copy(dataset, db_path)
+    prepare_database(db_path)
+
+    with open(args.config, 'r') as file:
+        config = make_config(yaml.safe_load(file), workdir, db_path)
+    embeddings = FakeEmbeddings(dim=args.dim, latency=args.embed_latency)
+    ctx = AppContext(config=config, llm=FakeLLM(latency=args.llm_latency), embeddings=embeddings)
+    set_app_context(ctx)
+    db_operator, vector_db_operator = ctx.db_operator, ctx.vector_db_operator
+
+    results = {}
+    def record(name, func, *func_args, repeat=1):
+        try:
+            results[name] = summarize(measure(func, *func_args, repeat=repeat))
+        except Exception as e:
+            logging.exception(f"Benchmark {name} failed")
+            results[name] = {"error": repr(e)}
+        print(f"{name}: {results[name]}")
+
+    items = [row for page in db_operator.iter_item_texts(args.batch_size) for row in page]
+    record("create_documents", vector_db_operator.create_documents, items)
+
+    def build_index():
+        for i in range(0, len(items), args.batch_size):
+            vector_db_operator.insert(vector_db_operator.create_documents(items[i:i + args.batch_size]))
+    record("vector_index_build", build_index)
+
+    for query in QUERIES:
+        vector_db_operator.search(query)  # warm up
+    record("vector_search", lambda: [vector_db_operator.search(q) for q in QUERIES], repeat=args.repeat)
+    for name, filters in GET_ITEMS_FILTERS.items():
+        record(f"get_items.{name}", lambda f=filters: db_operator.get_items(**f), repeat=args.repeat)
+
+    durations = []
+    start_t = time.perf_counter()
+    for _ in range(args.repeat):
+        for query in QUERIES:
+            durations += measure(main.main, query)
+    results["end_to_end"] = summarize(durations)
+    results["end_to_end"]["wall_time"] = time.perf_counter() - start_t
+    print(f"end_to_end: {results['end_to_end']}")
+    
+    # lag left by the end-to-end writes, then wait for the index to catch up
+    results["vector_sync"] = ctx.vector_sync.stats()
+    record("vector_sync_drain", ctx.vector_sync.drain)
+
+    # rebuilds the vector index from SQL, run last
+    record("init_vector_db", vector_db_operator.init_vector_db)
+
+    return {
+        "scale": args.scale,
+        "num_items": len(items),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "parameters": {k: v for k, v in vars(args).items() if k not in ("output", "workdir", "config")},
+        "embedding_calls": embeddings.calls,
+        "results": results,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the benchmark suite on synthetic data.")
+    parser.add_argument("--scale", default="1k", help=f"dataset size: {', '.join(SCALES)} or a number of items")
+    parser.add_argument("--repeat", type=int, default=5, help="repetitions of each measurement")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds per fake LLM call")
+    parser.add_argument("--embed-latency", type=float, default=0.0, help="seconds per fake embedding call")
+    parser.add_argument("--dim", type=int, default=64, help="fake embedding dimension")
+    parser.add_argument("--batch-size", type=int, default=10_000, help="documents per vector insert")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--config", default="config.yaml")
+    parser.add_argument("--workdir", default="bench/data")
+    parser.add_argument("--output", default=None, help="JSON file for the results (default: bench/results/<scale>-<time>.json)")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args)
+    output = args.output or os.path.join("bench", "results", f"{args.scale}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f"Results written to {output}")
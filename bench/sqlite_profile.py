@@ -0,0 +1,181 @@
+"""SQLite profile benchmark: default settings and schema against the WAL pragmas and indexes.
+
+Runs the get_items query shapes on two copies of the synthetic dataset, one with sqlite defaults
+and only the FTS migration, one with the sqlite section of config.yaml and every migration. The
+mixed workload measures readers while a writer commits batches of new items.
+
+Usage: python -m bench.sqlite_profile --scale 100k [--readers 4] [--duration 5] [--output results.json]
+"""
+import os
+import copy
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import threading
+import yaml
+from sqlalchemy import create_engine
+from bench.datasets import SCALES, build_dataset, dataset_path
+from bench.timing import summarize, measure
+from migrations import MIGRATIONS, migrate
+from sqldb import SQLDBOperator, apply_pragmas
+
+QUERIES = {
+    "time_frame": {"search_time_frame": "next week"},
+    "item_ids": {"item_id": list(range(1, 51))},
+    "recurrence": {"recurrence_pattern": "WEEKLY", "recurrence_rule": 3},
+    "start_date": {"start_date": "tomorrow"},
+}
+
+def open_variant(path, pragmas, version):
+    """Return the engine and the schema version of a variant database."""
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    apply_pragmas(engine, pragmas)
+    return engine, migrate(engine, target=version)
+
+def make_records(count, offset):
+    return [{
+        "content": f"benchmark event {offset + i}",
+        "start_date": "tomorrow",
+        "start_time": "10 am",
+        "end_date": None,
+        "end_time": "11 am",
+        "recurrence_pattern": "WEEKLY" if i % 3 == 0 else None,
+        "recurrence_rule": 3 if i % 3 == 0 else None,
+    } for i in range(count)]
+
+def query_plan(engine, statement):
+    with engine.connect() as connection:
+        sql = statement.compile(connection, compile_kwargs={"literal_binds": True})
+        return [row[-1] for row in connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")]
+
+def run_reads(engine, statements, repeat):
+    def run(statement):
+        with engine.connect() as connection:
+            connection.execute(statement).fetchall()
+    results = {}
+    for name, statement in statements.items():
+        run(statement)  # warm up the page cache
+        results[name] = summarize(measure(run, statement, repeat=repeat))
+        results[name]["plan"] = query_plan(engine, statement)
+    return results
+
+def run_mixed(engine, db_operator, statement, readers, duration, batch_size):
+    """Readers repeat statement while one writer commits batches, until duration seconds have passed."""
+    stop = threading.Event()
+    read_durations, write_durations, errors = [], [], []
+    lock = threading.Lock()
+
+    def read():
+        while not stop.is_set():
+            start_t = time.perf_counter()
+            try:
+                with engine.connect() as connection:
+                    connection.execute(statement).fetchall()
+            except Exception as e:
+                with lock:
+                    errors.append(repr(e))
+                continue
+            with lock:
+                read_durations.append(time.perf_counter() - start_t)
+
+    def write():
+        offset = 0
+        while not stop.is_set():
+            records = make_records(batch_size, offset)
+            offset += batch_size
+            start_t = time.perf_counter()
+            try:
+                with engine.begin() as connection:
+                    db_operator.write_items(connection, records)
+            except Exception as e:
+                with lock:
+                    errors.append(repr(e))
+                continue
+            write_durations.append(time.perf_counter() - start_t)
+
+    threads = [threading.Thread(target=read) for _ in range(readers)] + [threading.Thread(target=write)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return {
+        "reads": summarize(read_durations),
+        "writes": summarize(write_durations),
+        "rows_written": len(write_durations) * batch_size,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+    }
+
+def run_benchmarks(args):
+    workdir = os.path.join(args.workdir, f"sqlite_{args.scale}")
+    shutil.rmtree(workdir, ignore_errors=True)
+    os.makedirs(workdir)
+    dataset = build_dataset(dataset_path(args.workdir, args.scale, args.seed), args.scale, seed=args.seed)
+
+    with open(args.config, 'r') as file:
+        base_config = yaml.safe_load(file)
+    pragmas = base_config.get('sqlite', {})
+    variants = {
+        # only the full-text index, content search needs it
+        "baseline": ({}, MIGRATIONS[0][0]),
+        "tuned": (pragmas, None),
+    }
+
+    # the operator builds the statements and writes the items, on its own copy of the dataset
+    operator_path = os.path.join(workdir, "operator.db")
+    shutil.copy(dataset, operator_path)
+    config = copy.deepcopy(base_config)
+    config['database']['name'] = operator_path[:-len(".db")]
+    config['paths']['logging_file'] = os.path.join(workdir, "application.log")
+    db_operator = SQLDBOperator(config)
+    # the time frame query on the schedule table, which both variants have, not on the occurrence table
+    db_operator.occurrence_store.horizon = None
+    statements = {query: db_operator.build_items_query(**filters) for query, filters in QUERIES.items()}
+
+    results = {}
+    for name, (variant_pragmas, version) in variants.items():
+        db_path = os.path.join(workdir, f"{name}.db")
+        shutil.copy(dataset, db_path)
+        engine, db_operator.schema_version = open_variant(db_path, variant_pragmas, version)
+        results[name] = {"pragmas": variant_pragmas, "reads": run_reads(engine, statements, args.repeat)}
+        results[name]["mixed"] = run_mixed(engine, db_operator, statements["time_frame"], args.readers, args.duration, args.write_batch)
+        for query, result in results[name]["reads"].items():
+            print(f"{name} get_items.{query}: p50={result['p50'] * 1000:.2f} ms p95={result['p95'] * 1000:.2f} ms")
+        mixed = results[name]["mixed"]
+        print(f"{name} mixed: {mixed['reads']['count']} reads p95={(mixed['reads']['p95'] or 0) * 1000:.2f} ms, "
+              f"{mixed['rows_written']} rows written, {mixed['errors']} errors")
+        engine.dispose()
+
+    return {
+        "scale": args.scale,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "parameters": {k: v for k, v in vars(args).items() if k not in ("output", "workdir", "config")},
+        "results": results,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the default and the tuned SQLite profile on synthetic data.")
+    parser.add_argument("--scale", default="100k", help=f"dataset size: {', '.join(SCALES)} or a number of items")
+    parser.add_argument("--repeat", type=int, default=20, help="repetitions of each read query")
+    parser.add_argument("--readers", type=int, default=4, help="reader threads in the mixed workload")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds of the mixed workload")
+    parser.add_argument("--write-batch", type=int, default=100, help="items per write transaction in the mixed workload")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--config", default="config.yaml")
+    parser.add_argument("--workdir", default="bench/data")
+    parser.add_argument("--output", default=None, help="JSON file for the results (default: bench/results/sqlite-<scale>-<time>.json)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    report = run_benchmarks(args)
+    output = args.output or os.path.join("bench", "results", f"sqlite-{args.scale}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f"Results written to {output}")
@@ -0,0 +1,22 @@
+import time
+from tracing import percentile
+
+def summarize(durations):
+    total = sum(durations)
+    return {
+        "count": len(durations),
+        "total": total,
+        "mean": total / len(durations) if durations else None,
+        "p50": percentile(durations, 50),
+        "p95": percentile(durations, 95),
+        "p99": percentile(durations, 99),
+        "throughput": len(durations) / total if total else None,
+    }
+
+def measure(func, *args, repeat=1):
+    durations = []
+    for _ in range(repeat):
+        start_t = time.perf_counter()
+        func(*args)
+        durations.append(time.perf_counter() - start_t)
+    return durations
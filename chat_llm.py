@@ -1,17 +1,14 @@
 import yaml
 import os 
-from langchain_ollama.llms import OllamaLLM
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from ollama_client import get_ollama_clients
+from tracing import span, traced, current_span, TokenUsageHandler
 
 class ChatLLM:
-    def __init__(self, input_query, operation_type=None, task_type=None, sql_response=None, history=None):
-        self.config = self.load_config('config.yaml')
-        self.llm = OllamaLLM(model=self.config['chat_llm_model'], top_p=0.6)
-        self.input_query = input_query
-        self.operation_type = operation_type
-        self.task_type = task_type
-        self.sql_response = sql_response
-        self.history = history if history is not None else []  # Initialize history if None
+    def __init__(self, config=None, llm=None):
+        # config and llm can be injected so one chat model is shared by all chat turns
+        self.config = config if config is not None else self.load_config('config.yaml')
+        self.llm = llm if llm is not None else get_ollama_clients(self.config).llm(self.config['chat_llm_model'], top_p=0.6, callbacks=[TokenUsageHandler()])
         self.setup_prompts()
     
     def load_config(self, config_file):
@@ -22,68 +19,104 @@ class ChatLLM:
         # chat: normal chat without any specific task
         # success: chat with successful SQL operation
         # fail: chat with failed SQL operation
-        
-        if not self.operation_type or not self.task_type:
-            self.mode = "chat"
-            self.prompt = ChatPromptTemplate.from_messages([
+        # per-turn values are template variables, so the prompts are built only once
+        self.prompts = {
+            "chat": ChatPromptTemplate.from_messages([
                 ("system", self.generate_chat_template()),
                 MessagesPlaceholder(variable_name="chat_history"),
                 ("human", "{input}")
-            ])
-        elif self.sql_response["status"] == 1:
-            self.mode = "success"
-            self.prompt = ChatPromptTemplate.from_messages([
+            ]),
+            "success": ChatPromptTemplate.from_messages([
                 ("system", self.generate_success_template()),
                 MessagesPlaceholder(variable_name="chat_history"),
-                ("human", f"User query: {self.input_query}")
-            ])
-        elif self.sql_response["status"] == 0:
-            self.mode = "fail"
-            self.prompt = ChatPromptTemplate.from_messages([
+                ("human", "User query: {input}")
+            ]),
+            "fail": ChatPromptTemplate.from_messages([
                 ("system", self.generate_fail_template()),
                 MessagesPlaceholder(variable_name="chat_history"),
-                ("human", f"User query: {self.input_query}")
-            ])
+                ("human", "User query: {input}")
+            ]),
+        }
+        self.chains = {mode: prompt | self.llm for mode, prompt in self.prompts.items()}
+    
+    def get_mode(self, operation_type=None, task_type=None, sql_response=None):
+        if not operation_type or not task_type:
+            return "chat"
+        elif sql_response["status"] == 1:
+            return "success"
+        else:
+            return "fail"
         
     def generate_chat_template(self):
-        return f"""
+        return """
         You are now in chat mode. You can chat with user about anything.
         """
     
     def generate_success_template(self):
-        return f"""
+        return """
         You are an assistant to help users manage their notes, events, and schedules.
-        Now you are in {self.task_type} task with {self.operation_type} operation.
-        You have got the following response from the SQL Database: {self.sql_response["message"]}
+        Now you are in {task_type} task with {operation_type} operation.
+        You have got the following response from the SQL Database: {sql_message}
         Reply to user in a brief and human-friendly way.
         """
     
     def generate_fail_template(self):
-        return f"""
+        return """
         You are an assistant to help users manage their schedules and memos.
-        Now you are in {self.task_type} task with {self.operation_type} operation.
-        The SQL operation failed with the following error: {self.sql_response["message"]}
+        Now you are in {task_type} task with {operation_type} operation.
+        The SQL operation failed with the following error: {sql_message}
         Ask user to fix the query based on the error, or provide missing information.
         Ask in a brief and human-friendly way.
         """
     
-    def generate_response(self, input_query):
-        chain = self.prompt | self.llm
-        return chain.invoke({"input": input_query, "chat_history": self.history})
+    def get_inputs(self, input_query, task_type=None, operation_type=None, sql_response=None, history=None):
+        return {
+            "input": input_query,
+            "task_type": task_type,
+            "operation_type": operation_type,
+            "sql_message": sql_response.get("message") if sql_response else None,
+            "chat_history": history if history is not None else [],
+        }
+    
+    def generate_response(self, input_query, operation_type=None, task_type=None, sql_response=None, history=None):
+        mode = self.get_mode(operation_type, task_type, sql_response)
+        with span("llm.chat", mode=mode):
+            return self.chains[mode].invoke(self.get_inputs(input_query, task_type, operation_type, sql_response, history))
+    
+    def stream_response(self, input_query, operation_type=None, task_type=None, sql_response=None, history=None):
+        """Yield the response token chunks as they are generated."""
+        mode = self.get_mode(operation_type, task_type, sql_response)
+        with span("llm.chat.stream", mode=mode) as current:
+            for chunk in self.chains[mode].stream(self.get_inputs(input_query, task_type, operation_type, sql_response, history)):
+                current.add("chunks", 1)
+                yield chunk
+    
+    async def agenerate_response(self, input_query, operation_type=None, task_type=None, sql_response=None, history=None):
+        mode = self.get_mode(operation_type, task_type, sql_response)
+        with span("llm.chat", mode=mode):
+            return await self.chains[mode].ainvoke(self.get_inputs(input_query, task_type, operation_type, sql_response, history))
+    
+    @traced("llm.chat.stream")
+    async def astream_response(self, input_query, operation_type=None, task_type=None, sql_response=None, history=None):
+        """Async stream_response, the span is kept by the decorator as the consumer may resume it from another task."""
+        mode = self.get_mode(operation_type, task_type, sql_response)
+        current_span().set(mode=mode)
+        async for chunk in self.chains[mode].astream(self.get_inputs(input_query, task_type, operation_type, sql_response, history)):
+            current_span().add("chunks", 1)
+            yield chunk
 
 if __name__ == "__main__":
     os.environ["LANGCHAIN_TRACING_V2"] = "false"
     
+    chat_llm = ChatLLM()
+    
     input_query = "Can you update the schedule for the project kickoff?"
-    chat_llm = ChatLLM(input_query, "update", "schedule", {"status": 1, "response": "Updated the schedule for the project kickoff."})
-    print(chat_llm.generate_response("Can you update the schedule for the project kickoff?"))
+    print(chat_llm.generate_response(input_query, "update", "schedule", {"status": 1, "message": "Updated the schedule for the project kickoff."}))
     
     input_query = "Please remove my appointment from the schedule."
-    chat_llm = ChatLLM(input_query, "delete", "schedule", {"status": 0, "message": "Error deleting the appointment."})
-    print(chat_llm.generate_response(input_query))
+    print(chat_llm.generate_response(input_query, "delete", "schedule", {"status": 0, "message": "Error deleting the appointment."}))
     
     input_query = "Are you happy today?"
-    chat_llm = ChatLLM(input_query, None, None, None)
     print(chat_llm.generate_response(input_query))
     
     print("Done")
\ No newline at end of file
@@ -0,0 +1,192 @@
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from array import array
+from collections import OrderedDict
+from langchain_core.embeddings import Embeddings
+from tracing import span
+
+class CachedEmbeddings(Embeddings):
+    """Content-addressed embedding cache wrapped around another Embeddings instance.
+
+    Vectors are keyed by (model, sha256 of text). Lookups go through a bounded
+    in-memory LRU first, then a SQLite table, and only misses reach the model.
+    The SQLite table keeps at most max_stored_entries rows per model, the ones
+    least recently stored or read from it are pruned when new vectors are written.
+    """
+
+    def __init__(self, embeddings, model_name, db_path, max_memory_entries=10000, max_stored_entries=200000):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.max_memory_entries = max_memory_entries
+        self.max_stored_entries = max_stored_entries
+        self.memory = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS embedding (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                used_at REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (model, text_hash)
+            )
+        ''')
+        # caches written before the size bound have no used_at column
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(embedding)")]
+        if "used_at" not in columns:
+            self.conn.execute("ALTER TABLE embedding ADD COLUMN used_at REAL NOT NULL DEFAULT 0")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_embedding_used_at ON embedding (model, used_at)")
+        self.conn.commit()
+        self.stored = self.conn.execute("SELECT COUNT(*) FROM embedding WHERE model = ?", (model_name,)).fetchone()[0]
+
+    def get_key(self, text):
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def remember(self, key, vector):
+        """Put a vector at the front of the in-memory LRU, evicting the oldest entries."""
+        self.memory[key] = vector
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_memory_entries:
+            self.memory.popitem(last=False)
+
+    def lookup(self, keys):
+        """Return the cached vectors for the given keys, misses are left out."""
+        vectors = {}
+        with self.lock:
+            missing = []
+            for key in keys:
+                if key in self.memory:
+                    self.memory.move_to_end(key)
+                    vectors[key] = self.memory[key]
+                else:
+                    missing.append(key)
+
+            # query in chunks to stay below the SQLite bound parameter limit
+            for i in range(0, len(missing), 500):
+                chunk = missing[i:i + 500]
+                placeholders = ", ".join("?" * len(chunk))
+                rows = self.conn.execute(
+                    f"SELECT text_hash, vector FROM embedding WHERE model = ? AND text_hash IN ({placeholders})",
+                    [self.model_name, *chunk]
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f", blob).tolist()
+                    self.remember(key, vector)
+                    vectors[key] = vector
+                if rows:
+                    self.conn.execute(
+                        f"UPDATE embedding SET used_at = ? WHERE model = ? AND text_hash IN ({', '.join('?' * len(rows))})",
+                        [time.time(), self.model_name, *(key for key, _ in rows)]
+                    )
+            # commit the used_at of the rows read from SQLite
+            if len(vectors) > len(keys) - len(missing):
+                self.conn.commit()
+        return vectors
+
+    def store(self, items):
+        """Write (key, vector) pairs to both cache levels."""
+        with self.lock:
+            for key, vector in items:
+                self.remember(key, vector)
+            used_at = time.time()
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embedding (model, text_hash, vector, used_at) VALUES (?, ?, ?, ?)",
+                [(self.model_name, key, array("f", vector).tobytes(), used_at) for key, vector in items]
+            )
+            self.stored += len(items)
+            if self.max_stored_entries and self.stored > self.max_stored_entries:
+                self.prune()
+            self.conn.commit()
+
+    def prune(self):
+        """Delete the least recently used rows of this model beyond max_stored_entries."""
+        self.stored = self.conn.execute("SELECT COUNT(*) FROM embedding WHERE model = ?", (self.model_name,)).fetchone()[0]
+        excess = self.stored - self.max_stored_entries
+        if excess > 0:
+            self.conn.execute(
+                "DELETE FROM embedding WHERE rowid IN (SELECT rowid FROM embedding WHERE model = ? ORDER BY used_at LIMIT ?)",
+                (self.model_name, excess)
+            )
+            self.stored -= excess
+            logging.info(f"Embedding cache: pruned {excess} stored vectors")
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        with span("embedding", texts=len(texts)) as current:
+            vectors, misses = self.embed_with_cache(texts)
+            current.set(hits=len(texts) - misses, misses=misses)
+        return vectors
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        with span("embedding", texts=len(texts)) as current:
+            vectors, misses = await self.aembed_with_cache(texts)
+            current.set(hits=len(texts) - misses, misses=misses)
+        return vectors
+
+    def find_missing(self, texts):
+        """Return the keys of texts, the cached vectors by key and the texts to embed by key."""
+        keys = [self.get_key(text) for text in texts]
+        cached = self.lookup(set(keys))
+
+        # embed each missing text once, in a single batched model call
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        return keys, cached, missing
+
+    def embed_with_cache(self, texts):
+        """Return the vectors for texts and the number of texts that had to be embedded."""
+        keys, cached, missing = self.find_missing(texts)
+        if missing:
+            with span("embedding.model", texts=len(missing)):
+                vectors = self.embeddings.embed_documents(list(missing.values()))
+            self.add_missing(cached, missing, vectors)
+        return self.collect(keys, cached, missing)
+
+    async def aembed_with_cache(self, texts):
+        keys, cached, missing = self.find_missing(texts)
+        if missing:
+            with span("embedding.model", texts=len(missing)):
+                vectors = await self.embeddings.aembed_documents(list(missing.values()))
+            self.add_missing(cached, missing, vectors)
+        return self.collect(keys, cached, missing)
+
+    def add_missing(self, cached, missing, vectors):
+        new_items = list(zip(missing.keys(), vectors))
+        self.store(new_items)
+        cached.update(new_items)
+
+    def collect(self, keys, cached, missing):
+        with self.lock:
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+        logging.info(f"Embedding cache: {len(keys) - len(missing)} hits, {len(missing)} misses")
+        return [cached[key] for key in keys], len(missing)
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return (await self.aembed_documents([text]))[0]
+
+    def stats(self):
+        """Return the hit/miss counters and current cache sizes."""
+        with self.lock:
+            stored = self.conn.execute("SELECT COUNT(*) FROM embedding WHERE model = ?", (self.model_name,)).fetchone()[0]
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "memory_entries": len(self.memory),
+                "stored_entries": stored,
+            }
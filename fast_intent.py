@@ -0,0 +1,132 @@
+import re
+import threading
+import parsedatetime as pdt
+
+# keyword grammars for the operation types in config.yaml, anchored on word boundaries
+OPERATION_PATTERNS = {
+    "create": r"\b(add|create|schedule|book|set up|set a|put|remind me|note down|make a note|new)\b",
+    "delete": r"\b(delete|remove|cancel|drop|erase|clear)\b",
+    "update": r"\b(update|change|move|reschedule|rename|postpone|push back|mark)\b",
+    "search": r"^(show|list|what|when|which|find|search|do i have|display|any|get|tell me)\b|\b(show me|look up|find)\b",
+}
+TASK_PATTERNS = {
+    "schedule": r"\b(meeting|meetings|appointment|appointments|event|events|calendar|schedule|class|standup|call|lunch|dinner|session)\b",
+    "note": r"\b(note|notes|memo|memos|list|todo|to-do|task|tasks|reminder|reminders|idea|ideas)\b",
+}
+TIME_FRAME_PATTERN = r"\b((?:this|next|last|coming|past) (?:week|month|year|weekend)|today|tonight|tomorrow|yesterday|upcoming|recent)\b"
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+FILLER_PATTERN = r"\b(please|can you|could you|i want to|i'd like to|me|my|the|a|an|for|on|at|to|from|every|each)\b"
+
+class RuleBasedIntent:
+    """Deterministic pre-classifier for stereotyped queries, returns intents with a confidence score."""
+
+    def __init__(self, tasks, ops, time_cols):
+        self.tasks = tasks
+        self.ops = ops
+        self.time_cols = time_cols
+        self.operation_patterns = {op: re.compile(p) for op, p in OPERATION_PATTERNS.items() if op in ops}
+        self.task_patterns = {task: re.compile(p) for task, p in TASK_PATTERNS.items() if task in tasks}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.calendars = threading.local()
+
+    def find_time_phrases(self, query):
+        """Return (matched text, flags) for the date/time expressions found by parsedatetime."""
+        # building a Calendar compiles its regexes, keep one per thread
+        cal = getattr(self.calendars, "calendar", None)
+        if cal is None:
+            cal = self.calendars.calendar = pdt.Calendar()
+        matches = cal.nlp(query) or ()
+        phrases = []
+        # flags: 1 = date, 2 = time, 3 = date and time
+        for _, flags, _, _, text in matches:
+            # parsedatetime reads meal names as times, keep them in the event description
+            text = re.sub(r"^(?:(?:breakfast|lunch|dinner)\s+)+(?=\S)", "", text)
+            phrases.append((text, flags))
+        return phrases
+
+    def find_recurrence(self, query):
+        if re.search(r"\b(every day|daily|each day)\b", query):
+            return "DAILY", 1
+        weekday = re.search(r"\b(?:every|each)(?: other)? (" + "|".join(WEEKDAYS) + r")\b", query)
+        if weekday:
+            pattern = "BIWEEKLY" if re.search(r"\b(every other|biweekly|fortnightly)\b", query) else "WEEKLY"
+            return pattern, WEEKDAYS.index(weekday.group(1)) + 1
+        monthly = re.search(r"\b(?:every month|monthly)\b.*?\b(\d{1,2})(?:st|nd|rd|th)\b", query)
+        if monthly:
+            return "MONTHLY", int(monthly.group(1))
+        return None, None
+
+    def extract_content(self, query, phrases):
+        content = query
+        for phrase in phrases:
+            content = content.replace(phrase.lower(), " ")
+        for pattern in self.operation_patterns.values():
+            content = pattern.sub(" ", content)
+        content = re.sub(FILLER_PATTERN, " ", content)
+        return " ".join(re.sub(r"[^\w\s:'-]", " ", content).split())
+
+    def classify(self, input_query):
+        """Return (task_type, operation_type, info, confidence)."""
+        query = " ".join(input_query.lower().split())
+        operations = [op for op, pattern in self.operation_patterns.items() if pattern.search(query)]
+        tasks = [task for task, pattern in self.task_patterns.items() if pattern.search(query)]
+        time_phrases = self.find_time_phrases(query)
+        time_frame = re.search(TIME_FRAME_PATTERN, query)
+        recurrence_pattern, recurrence_rule = self.find_recurrence(query)
+
+        # an explicit date or time makes it a schedule, a note with a date ("reminder at 9 am")
+        # ends up with two task types and is left to the llm
+        inferred = not tasks
+        if (time_phrases or recurrence_pattern) and "schedule" in self.tasks and "schedule" not in tasks:
+            tasks.append("schedule")
+        # "show me my meetings" also matches the generic search verbs of other operations
+        if len(operations) > 1 and "search" in operations and re.match(self.operation_patterns["search"], query):
+            operations = ["search"]
+
+        confidence = 0.0
+        if len(operations) == 1:
+            confidence += 0.45
+        # a task only guessed from a date or time ("what's the weather today?") stays below min_confidence,
+        # the fast path answers only queries that name what they are about
+        if len(tasks) == 1:
+            confidence += 0.1 if inferred else 0.35
+        if len(operations) != 1 or len(tasks) != 1:
+            return None, None, None, confidence
+
+        task_type, operation_type = tasks[0], operations[0]
+        info = {col: None for col in self.time_cols}
+        info["content"] = self.extract_content(query, [p for p, _ in time_phrases] + ([time_frame.group(1)] if time_frame else []))
+        if task_type == "schedule":
+            if operation_type == "search":
+                info["search_time_frame"] = time_frame.group(1) if time_frame else None
+            else:
+                dates = [p for p, flags in time_phrases if flags in (1, 3)]
+                times = [p for p, flags in time_phrases if flags in (2, 3)]
+                info["start_date"] = dates[0] if dates else None
+                info["start_time"] = times[0] if times else None
+                info["end_date"] = dates[1] if len(dates) > 1 else info["start_date"]
+                info["end_time"] = times[1] if len(times) > 1 else None
+                info["recurrence_pattern"], info["recurrence_rule"] = recurrence_pattern, recurrence_rule
+            # new events need a start date, searches and edits only need something to match
+            if operation_type != "create" or info["start_date"] or recurrence_pattern:
+                confidence += 0.2
+        else:
+            confidence += 0.2
+        if not info["content"]:
+            info["content"] = input_query
+        return task_type, operation_type, info, confidence
+
+    def record(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        """Return the fast-path hit counters."""
+        with self.lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
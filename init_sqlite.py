@@ -8,6 +8,21 @@ cursor = conn.cursor()
 
 # drop tables if they exist
 cursor.execute('''
+DROP TABLE IF EXISTS item_fts;
+''')
+cursor.execute('''
+DROP TABLE IF EXISTS item_changelog;
+''')
+cursor.execute('''
+DROP TABLE IF EXISTS occurrence;
+''')
+cursor.execute('''
+DROP TABLE IF EXISTS occurrence_horizon;
+''')
+cursor.execute('''
+DROP TABLE IF EXISTS occurrence_dirty;
+''')
+cursor.execute('''
 DROP TABLE IF EXISTS schedule;
 ''')
 cursor.execute('''
@@ -116,6 +131,9 @@ INSERT INTO schedule (item_id, start_date, start_time, end_date, end_time) VALUE
     (16, "2024-11-15", "09:00:00", "2024-11-15", "10:00:00"); -- Monthly Budget Review
 """)
 
+# the indexes and triggers went with the tables, SQLDBOperator re-applies the migrations on startup
+cursor.execute('PRAGMA user_version = 0')
+
 # Commit changes and close connection
 conn.commit()
 conn.close()
@@ -3,18 +3,51 @@ import os
 import yaml
 import logging
 import json
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import pandas as pd
-from langchain_ollama.llms import OllamaLLM
 from langchain_core.prompts import ChatPromptTemplate
+from ollama_client import get_ollama_clients
+from tracing import span, submit, current_span, TokenUsageHandler
+from fast_intent import RuleBasedIntent
+from intent_cache import IntentCache
 
 class IntentRecognizer:
-    def __init__(self, input_query):
-        self.config = self.load_config('config.yaml')
-        self.llm = OllamaLLM(model=self.config["intent_llm_model"], top_p=0.6)
+    def __init__(self, config=None, llm=None, json_llm=None, executor=None, embeddings=None):
+        # config and llm can be injected so one recognizer is shared by all chat turns
+        self.config = config if config is not None else self.load_config('config.yaml')
+        self.llm = llm if llm is not None else get_ollama_clients(self.config).llm(self.config["intent_llm_model"], top_p=0.6, callbacks=[TokenUsageHandler()])
+        # json mode constrains the combined intent generation to a single JSON object
+        self.json_llm = json_llm if json_llm is not None else get_ollama_clients(self.config).llm(self.config["intent_llm_model"], top_p=0.6, format="json", callbacks=[TokenUsageHandler()])
+        self.intent_mode = self.config.get("intent_mode", "sequential")
+        # optional thread pool, used to run the independent chains concurrently
+        self.executor = executor
         self.tasks = self.config['task_types']
         self.ops = self.config['operation_types']
         self.time_cols = ["content", "start_date", "start_time", "end_date", "end_time", "recurrence_pattern", "recurrence_rule", "search_time_frame"]
-        self.input_query = input_query
+        # rule-based pre-classifier, the llm is only called when its confidence is low
+        fast_path_config = self.config.get("intent_fast_path", {})
+        self.fast_path = RuleBasedIntent(self.tasks, self.ops, self.time_cols) if fast_path_config.get("enabled", False) else None
+        self.fast_path_min_confidence = fast_path_config.get("min_confidence", 0.8)
+        # exact and semantic cache of llm intent results, the semantic tier needs embeddings
+        cache_config = self.config.get("intent_cache", {})
+        self.cache = IntentCache(
+            embeddings=embeddings,
+            max_entries=cache_config.get("max_entries", 1000),
+            ttl_seconds=cache_config.get("ttl_seconds", 3600),
+            similarity_threshold=cache_config.get("similarity_threshold", 0.95)
+        ) if cache_config.get("enabled", False) else None
+        # answer voting for the one-word chains, the samples get their own pool because the
+        # chains themselves may already run on the pipeline executor
+        voting_config = self.config.get("intent_voting", {})
+        self.voting_mode = voting_config.get("mode", "retry")
+        self.voting_samples = voting_config.get("samples", 3)
+        self.voting_executor = ThreadPoolExecutor(
+            max_workers=voting_config.get("max_workers", 16), thread_name_prefix="intent-vote"
+        ) if self.voting_mode == "vote" else None
+        self.voting_stats = {"calls": 0, "samples": 0, "early_exits": 0}
+        self.voting_lock = threading.Lock()
         self.setup_prompts()
 
     def load_config(self, config_file):
@@ -42,6 +75,17 @@ class IntentRecognizer:
             ("human", "{input}")
         ])
         
+        # chains are stateless, build them once and reuse them for every query
+        self.task_chain = self.task_prompt | self.llm
+        self.operation_chain = self.operation_prompt | self.llm
+        self.schedule_chain = self.schedule_prompt | self.llm
+        self.note_chain = self.note_prompt | self.llm
+        
+        self.combined_prompt = ChatPromptTemplate.from_messages([
+            ("system", self.get_combined_template()),
+            ("human", "{input}")
+        ]).partial(task_types=", ".join(self.tasks), operation_types=", ".join(self.ops))
+        self.combined_chain = self.combined_prompt | self.json_llm
         
     def get_task_template(self):
         return f"""
@@ -146,51 +190,166 @@ class IntentRecognizer:
         """
     
     
-    def check_task_relevance(self):
-        chain = self.task_prompt | self.llm
-        return self.extract_valid_answer(chain, valid_set=self.tasks)
+    def get_combined_template(self):
+        return """
+        ### Examples:
+        Query: "Can you book a weekly team meeting every Tuesday from 9 AM to 10:30 AM?"
+        Answer: {{"task_type": "schedule", "operation_type": "create", "info": {{"content": "weekly team meeting", "start_date": "every Tuesday", "start_time": "9 AM", "end_date": "every Tuesday", "end_time": "10:30 AM", "recurrence_pattern": "WEEKLY", "recurrence_rule": 2, "search_time_frame": null}}}}
+        
+        Query: "What meetings did I have last week?"
+        Answer: {{"task_type": "schedule", "operation_type": "search", "info": {{"content": "meetings", "start_date": null, "start_time": null, "end_date": null, "end_time": null, "recurrence_pattern": null, "recurrence_rule": null, "search_time_frame": "last week"}}}}
+        
+        Query: "Please update the status for the group project of my NLP course to completed."
+        Answer: {{"task_type": "note", "operation_type": "update", "info": {{"content": "status for the group project of my NLP course to completed"}}}}
+        
+        Query: "How are you?"
+        Answer: {{"task_type": null, "operation_type": null, "info": null}}
+        
+        ### Instructions:
+        Analyze the user query and reply with one JSON object with the following fields:
+        - "task_type": one of [{task_types}], or null for chat without information.
+          - note: event, memo, or task, and everything that can be noted.
+          - schedule: specific datetime for an event is mentioned.
+        - "operation_type": one of [{operation_types}], or null if no operation is requested.
+        - "info": the details of the event, or null for chat:
+          - "content": the complete original event description in the query, only except the time details.
+          - "start_date", "start_time", "end_date", "end_time": the event date and time specifications, as written in the query.
+          - "recurrence_pattern": `DAILY`, `WEEKLY`, `BIWEEKLY`, `MONTHLY`
+          - "recurrence_rule": the frequency for daily; weekday for weekly, and day of the month for monthly.
+          - "search_time_frame": the time frame for searching events (e.g., "today", "this week", "next month").
+        Use null for every missing value. Reply only the JSON without explanations.
+        
+        ### Your task:
+        Query: {input}
+        Answer:
+        """
+    
+    def check_task_relevance(self, input_query):
+        with span("llm.intent.task_relevance"):
+            return self.extract_valid_answer(self.task_chain, input_query, valid_set=self.tasks)
 
-    def identify_operation_type(self):
-        chain = self.operation_prompt | self.llm
-        return self.extract_valid_answer(chain, valid_set=self.ops)
+    def identify_operation_type(self, input_query):
+        with span("llm.intent.operation_type"):
+            return self.extract_valid_answer(self.operation_chain, input_query, valid_set=self.ops)
     
-    def extract_info(self, task_type=None):
+    def extract_info(self, input_query, task_type=None):
         if task_type == "schedule":
-            chain = self.schedule_prompt | self.llm
-            return self.extract_info_dict(chain.invoke({"input": self.input_query}))
+            with span("llm.intent.extract_info", task_type=task_type):
+                return self.extract_info_dict(self.schedule_chain.invoke({"input": input_query}))
         elif task_type == "note":
-            chain = self.note_prompt | self.llm
-            response = chain.invoke({"input": self.input_query})
+            with span("llm.intent.extract_info", task_type=task_type):
+                response = self.note_chain.invoke({"input": input_query})
             d = self.extract_info_dict(response)
             if d and 'content' in d.keys():
-                return self.extract_info_dict(response)
+                return d
             else:
-                return {"content": self.input_query}
+                return {"content": input_query}
         else:
             return None
     
-    def extract_valid_answer(self, chain, valid_set=None, valid_threshold=1, max_attempts=5):
+    def extract_valid_answer(self, chain, input_query, valid_set=None, valid_threshold=1, max_attempts=5):
         """Extracts a valid answer, ensuring consistency across multiple attempts."""
+        if self.voting_mode == "vote":
+            return self.vote_valid_answer(chain, input_query, valid_set)
         answer_counts = {}
         attempts = 0
         
         while attempts < max_attempts:
-            response = chain.invoke({"input": self.input_query}).strip()
+            with span("llm.invoke", attempt=attempts + 1):
+                response = chain.invoke({"input": input_query}).strip()
             logging.info(f"Response: {response}")
-            words = response.split()
-            valid_answers = set([word for word in words if not valid_set or word in valid_set])
+            answer = self.parse_answer(response, valid_set)
             
-            if len(valid_answers) == 1:
-                answer = valid_answers.pop()
+            if answer is not None:
                 answer_counts[answer] = answer_counts.get(answer, 0) + 1
                 
                 if answer_counts[answer] >= valid_threshold: # Found a valid answer twice
+                    self.record_attempts(attempts + 1)
                     return answer
             
             # Increment attempts
             attempts += 1
 
+        self.record_attempts(attempts)
         return None  # Return None if no consistent valid answer is found after max attempts
+
+    def vote_valid_answer(self, chain, input_query, valid_set=None):
+        """Samples the chain concurrently and returns the majority answer.
+
+        Stops as soon as one answer has a majority of the samples, or no answer can reach
+        one any more, and cancels the samples that have not started yet. Without a majority
+        the valid answer with the most votes wins, and a tie gives no answer.
+        """
+        samples = self.voting_samples
+        majority = samples // 2 + 1
+        answer_counts = {}
+
+        def sample(i):
+            with span("llm.invoke", sample=i + 1):
+                return chain.invoke({"input": input_query}).strip()
+
+        futures = [submit(self.voting_executor, sample, i) for i in range(samples)]
+
+        used = 0
+        try:
+            for future in as_completed(futures):
+                used += 1
+                try:
+                    response = future.result()
+                except Exception as e:
+                    logging.warning(f"Intent sample failed: {e!r}")
+                    response = None
+                logging.info(f"Response: {response}")
+                # "None", unparseable replies and failed samples count as votes for no answer
+                answer = self.parse_answer(response, valid_set) if response is not None else None
+                answer_counts[answer] = answer_counts.get(answer, 0) + 1
+                if answer_counts[answer] >= majority:
+                    break
+                remaining = samples - used
+                if max(answer_counts.values(), default=0) + remaining < majority:
+                    break
+        finally:
+            for future in futures:
+                future.cancel()
+
+        answer = self.pick_answer(answer_counts)
+        self.record_samples(used, samples, answer_counts.get(answer, 0))
+        return answer
+
+    def pick_answer(self, answer_counts):
+        """The valid answer with the most votes, None if there is none or the top answers are tied."""
+        votes = {answer: count for answer, count in answer_counts.items() if answer is not None}
+        if not votes:
+            return None
+        top = max(votes.values())
+        leaders = [answer for answer, count in votes.items() if count == top]
+        return leaders[0] if len(leaders) == 1 else None
+
+    def parse_answer(self, response, valid_set=None):
+        """Returns the single valid label in a response, ignoring case and punctuation."""
+        words = re.findall(r"[\w-]+", response.lower())
+        valid_answers = set(word for word in words if not valid_set or word in valid_set)
+        return valid_answers.pop() if len(valid_answers) == 1 else None
+
+    def record_attempts(self, attempts):
+        current = current_span()
+        if current is not None:
+            current.set(attempts=attempts, retries=attempts - 1)
+
+    def record_samples(self, used, fired, votes):
+        with self.voting_lock:
+            self.voting_stats["calls"] += 1
+            self.voting_stats["samples"] += used
+            self.voting_stats["early_exits"] += used < fired
+        current = current_span()
+        if current is not None:
+            current.set(samples=used, samples_fired=fired, votes=votes)
+
+    def voting_summary(self):
+        """Returns the voting counters and the mean number of samples used per call."""
+        with self.voting_lock:
+            calls = self.voting_stats["calls"]
+            return {**self.voting_stats, "mean_samples": self.voting_stats["samples"] / calls if calls else 0.0}
     
     def extract_info_dict(self, response):
         json_pattern = r"\{.*\}"
@@ -206,24 +365,269 @@ class IntentRecognizer:
             return None
 
 
-    def get_intents(self):
+    def normalize_label(self, value, valid_set):
+        """Map a label from the combined answer to a valid label, None for chat, or False if invalid."""
+        if value is None or str(value).strip().lower() in ("", "none", "null"):
+            return None
+        value = str(value).strip().lower()
+        return value if value in valid_set else False
+    
+    def get_intents(self, input_query, mode=None):
+        # an explicit mode bypasses the fast path and the cache, for A/B comparison of the llm paths
+        if mode is not None:
+            return self.get_intents_llm(input_query, mode)
+        
+        if self.cache is not None:
+            cached = self.cache.get_exact(input_query)
+            if cached is not None:
+                return cached
+        
+        if self.fast_path is not None:
+            with span("intent.fast_path") as current:
+                task_type, operation_type, info, confidence = self.fast_path.classify(input_query)
+                hit = confidence >= self.fast_path_min_confidence
+                self.fast_path.record(hit)
+                current.set(confidence=confidence, hit=hit)
+            if hit:
+                logging.info(f"Fast path: {task_type}, {operation_type}, confidence {confidence:.2f}")
+                return task_type, operation_type, info
+        
+        if self.cache is None:
+            return self.get_intents_llm(input_query)
+        with span("intent.cache.semantic"):
+            labels = self.cache.get_similar(input_query)
+        if labels is not None:
+            # only the labels carry over from a similar query, the info is extracted from this one
+            task_type, operation_type = labels
+            return task_type, operation_type, self.extract_info(input_query, task_type) if operation_type else None
+        result = self.get_intents_llm(input_query)
+        self.cache.put(input_query, result)
+        return result
+    
+    def get_intents_llm(self, input_query, mode=None):
+        # mode can be switched per call to compare the combined and sequential paths
+        mode = mode or self.intent_mode
+        if mode == "combined":
+            return self.get_intents_combined(input_query)
+        return self.get_intents_sequential(input_query)
+    
+    def get_intents_combined(self, input_query):
+        """Get task type, operation type and info in one generation, retrying only the invalid fields."""
+        with span("llm.intent.combined"):
+            response = self.combined_chain.invoke({"input": input_query})
+        logging.info(f"Response: {response}")
+        try:
+            answer = json.loads(response, strict=False)
+        except json.JSONDecodeError:
+            answer = None
+        if not isinstance(answer, dict):
+            # nothing usable, fall back to the sequential chains
+            return self.get_intents_sequential(input_query)
+        
+        # step 1: task relevance
+        task_type = self.normalize_label(answer.get("task_type"), self.tasks)
+        if task_type is False:
+            task_type = self.check_task_relevance(input_query)
+        if not task_type:
+            return None, None, None
+        
+        # step 2: operation type
+        operation_type = self.normalize_label(answer.get("operation_type"), self.ops)
+        if operation_type is False:
+            operation_type = self.identify_operation_type(input_query)
+        if not operation_type:
+            return task_type, None, None
+        
+        # step 3: information
+        info = answer.get("info")
+        if not isinstance(info, dict) or not info.get("content"):
+            return task_type, operation_type, self.extract_info(input_query, task_type)
+        info = {col: info.get(col, None) for col in self.time_cols}
+        return task_type, operation_type, info
+    
+    def get_intents_sequential(self, input_query):
         # step 1: check task relevance
-        task_type = self.check_task_relevance()
+        task_type = self.check_task_relevance(input_query)
         
         # No relevance, skip further steps
         if not task_type:
             return None, None, None  
         
+        if self.executor is not None:
+            # step 2-3: operation type and info only depend on the task type, run them together
+            operation_future = submit(self.executor, self.identify_operation_type, input_query)
+            info_future = submit(self.executor, self.extract_info, input_query, task_type)
+            operation_type = operation_future.result()
+            if not operation_type:
+                info_future.cancel()
+                return task_type, None, None
+            return task_type, operation_type, info_future.result()
+        
         # step 2: identify operation type
-        operation_type = self.identify_operation_type()
+        operation_type = self.identify_operation_type(input_query)
         
         # No operation, skip time info
         if not operation_type:
             return task_type, None, None
         
         # step 3: extract information
-        info = self.extract_info(task_type)
+        info = self.extract_info(input_query, task_type)
         return task_type, operation_type, info
+
+    # async variants of the methods above, used by the async request path in main.py
+    
+    async def acheck_task_relevance(self, input_query):
+        with span("llm.intent.task_relevance"):
+            return await self.aextract_valid_answer(self.task_chain, input_query, valid_set=self.tasks)
+
+    async def aidentify_operation_type(self, input_query):
+        with span("llm.intent.operation_type"):
+            return await self.aextract_valid_answer(self.operation_chain, input_query, valid_set=self.ops)
+    
+    async def aextract_info(self, input_query, task_type=None):
+        if task_type == "schedule":
+            with span("llm.intent.extract_info", task_type=task_type):
+                return self.extract_info_dict(await self.schedule_chain.ainvoke({"input": input_query}))
+        elif task_type == "note":
+            with span("llm.intent.extract_info", task_type=task_type):
+                response = await self.note_chain.ainvoke({"input": input_query})
+            d = self.extract_info_dict(response)
+            if d and 'content' in d.keys():
+                return d
+            else:
+                return {"content": input_query}
+        else:
+            return None
+    
+    async def aextract_valid_answer(self, chain, input_query, valid_set=None, valid_threshold=1, max_attempts=5):
+        if self.voting_mode == "vote":
+            return await self.avote_valid_answer(chain, input_query, valid_set)
+        answer_counts = {}
+        for attempt in range(max_attempts):
+            with span("llm.invoke", attempt=attempt + 1):
+                response = (await chain.ainvoke({"input": input_query})).strip()
+            logging.info(f"Response: {response}")
+            answer = self.parse_answer(response, valid_set)
+            if answer is not None:
+                answer_counts[answer] = answer_counts.get(answer, 0) + 1
+                if answer_counts[answer] >= valid_threshold:
+                    self.record_attempts(attempt + 1)
+                    return answer
+        self.record_attempts(max_attempts)
+        return None
+    
+    async def avote_valid_answer(self, chain, input_query, valid_set=None):
+        """Async vote_valid_answer, the samples are tasks on the event loop instead of pool threads."""
+        samples = self.voting_samples
+        majority = samples // 2 + 1
+        answer_counts = {}
+
+        async def sample(i):
+            with span("llm.invoke", sample=i + 1):
+                return (await chain.ainvoke({"input": input_query})).strip()
+
+        tasks = [asyncio.create_task(sample(i)) for i in range(samples)]
+        used = 0
+        try:
+            for next_response in asyncio.as_completed(tasks):
+                used += 1
+                try:
+                    response = await next_response
+                except Exception as e:
+                    logging.warning(f"Intent sample failed: {e!r}")
+                    response = None
+                logging.info(f"Response: {response}")
+                answer = self.parse_answer(response, valid_set) if response is not None else None
+                answer_counts[answer] = answer_counts.get(answer, 0) + 1
+                if answer_counts[answer] >= majority:
+                    break
+                if max(answer_counts.values()) + samples - used < majority:
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        answer = self.pick_answer(answer_counts)
+        self.record_samples(used, samples, answer_counts.get(answer, 0))
+        return answer
+    
+    async def aget_intents(self, input_query, mode=None):
+        if mode is not None:
+            return await self.aget_intents_llm(input_query, mode)
+        
+        if self.cache is not None:
+            cached = self.cache.get_exact(input_query)
+            if cached is not None:
+                return cached
+        
+        if self.fast_path is not None:
+            with span("intent.fast_path") as current:
+                task_type, operation_type, info, confidence = self.fast_path.classify(input_query)
+                hit = confidence >= self.fast_path_min_confidence
+                self.fast_path.record(hit)
+                current.set(confidence=confidence, hit=hit)
+            if hit:
+                logging.info(f"Fast path: {task_type}, {operation_type}, confidence {confidence:.2f}")
+                return task_type, operation_type, info
+        
+        if self.cache is None:
+            return await self.aget_intents_llm(input_query)
+        with span("intent.cache.semantic"):
+            labels = await self.cache.aget_similar(input_query)
+        if labels is not None:
+            task_type, operation_type = labels
+            return task_type, operation_type, await self.aextract_info(input_query, task_type) if operation_type else None
+        result = await self.aget_intents_llm(input_query)
+        await self.cache.aput(input_query, result)
+        return result
+    
+    async def aget_intents_llm(self, input_query, mode=None):
+        mode = mode or self.intent_mode
+        if mode == "combined":
+            return await self.aget_intents_combined(input_query)
+        return await self.aget_intents_sequential(input_query)
+    
+    async def aget_intents_combined(self, input_query):
+        with span("llm.intent.combined"):
+            response = await self.combined_chain.ainvoke({"input": input_query})
+        logging.info(f"Response: {response}")
+        try:
+            answer = json.loads(response, strict=False)
+        except json.JSONDecodeError:
+            answer = None
+        if not isinstance(answer, dict):
+            return await self.aget_intents_sequential(input_query)
+        
+        task_type = self.normalize_label(answer.get("task_type"), self.tasks)
+        if task_type is False:
+            task_type = await self.acheck_task_relevance(input_query)
+        if not task_type:
+            return None, None, None
+        
+        operation_type = self.normalize_label(answer.get("operation_type"), self.ops)
+        if operation_type is False:
+            operation_type = await self.aidentify_operation_type(input_query)
+        if not operation_type:
+            return task_type, None, None
+        
+        info = answer.get("info")
+        if not isinstance(info, dict) or not info.get("content"):
+            return task_type, operation_type, await self.aextract_info(input_query, task_type)
+        info = {col: info.get(col, None) for col in self.time_cols}
+        return task_type, operation_type, info
+    
+    async def aget_intents_sequential(self, input_query):
+        task_type = await self.acheck_task_relevance(input_query)
+        if not task_type:
+            return None, None, None
+        
+        # step 2-3: operation type and info only depend on the task type, run them together
+        info_task = asyncio.create_task(self.aextract_info(input_query, task_type))
+        operation_type = await self.aidentify_operation_type(input_query)
+        if not operation_type:
+            info_task.cancel()
+            return task_type, None, None
+        return task_type, operation_type, await info_task
             
 
 if __name__ == "__main__":
@@ -237,8 +641,8 @@ if __name__ == "__main__":
     # input_query = "do you love me?"
     # input_query = "i will have a daily standup meeting at 9 AM."
     
-    recognizer = IntentRecognizer(input_query)
-    task_type, operation_type, info = recognizer.get_intents()
+    recognizer = IntentRecognizer()
+    task_type, operation_type, info = recognizer.get_intents(input_query)
 
     print(f"Task Type: {task_type}")
     print(f"Operation Type: {operation_type}")
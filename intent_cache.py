@@ -0,0 +1,165 @@
+import re
+import time
+import threading
+from datetime import date
+from collections import OrderedDict
+import numpy as np
+import faiss
+from fast_intent import OPERATION_PATTERNS
+
+# results of queries with relative dates are only valid on the day they were computed
+RELATIVE_DATE_PATTERN = re.compile(
+    r"\b(today|tonight|tomorrow|yesterday|now|this|next|last|coming|upcoming|recent|ago|in \d+ \w+|"
+    r"monday|tuesday|wednesday|thursday|friday|saturday|sunday|weekend)\b"
+)
+
+class IntentCache:
+    """Two-level cache for intent results.
+
+    The exact tier is keyed on the normalized query text. The semantic tier finds
+    cached queries by embedding cosine similarity in a small dedicated faiss index and
+    returns only their task and operation labels, the info (content, dates) of a similar
+    query would act on the wrong item. "add the dentist tomorrow" and "delete the dentist
+    tomorrow" embed close together, so a semantic hit also needs the same operation verbs
+    of the fast-path grammar, and a query without any only reuses a chat result. Both tiers
+    share TTL and LRU eviction, and day-bound entries expire at midnight.
+    """
+
+    def __init__(self, embeddings=None, max_entries=1000, ttl_seconds=3600, similarity_threshold=0.95):
+        self.embeddings = embeddings
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        # normalized query -> {"id", "result", "created_at", "day", "vector"}
+        self.entries = OrderedDict()
+        self.id_to_query = {}
+        self.next_id = 0
+        self.index = None
+        self.lock = threading.Lock()
+        self.stats_counts = {"exact_hits": 0, "semantic_hits": 0, "misses": 0}
+        self.operation_patterns = {op: re.compile(p) for op, p in OPERATION_PATTERNS.items()}
+
+    def normalize(self, query):
+        return " ".join(re.sub(r"[^\w\s:]", " ", query.lower()).split())
+
+    def find_operations(self, key):
+        """The operation verbs of a normalized query."""
+        return frozenset(op for op, pattern in self.operation_patterns.items() if pattern.search(key))
+
+    def same_operation(self, key, entry):
+        operations = self.find_operations(key)
+        if operations != entry["operations"]:
+            return False
+        return bool(operations) or entry["result"][1] is None
+
+    def is_day_bound(self, query, result):
+        text = query + " " + " ".join(str(v) for v in (result[2] or {}).values() if v)
+        return bool(RELATIVE_DATE_PATTERN.search(text.lower()))
+
+    def is_valid(self, entry):
+        if time.time() - entry["created_at"] > self.ttl_seconds:
+            return False
+        return entry["day"] is None or entry["day"] == date.today()
+
+    def remove(self, key):
+        entry = self.entries.pop(key)
+        self.id_to_query.pop(entry["id"], None)
+        if self.index is not None and entry.get("vector") is not None:
+            self.index.remove_ids(np.array([entry["id"]], dtype="int64"))
+
+    def copy_result(self, result):
+        # callers may modify the info dict, hand out a copy
+        task_type, operation_type, info = result
+        return task_type, operation_type, dict(info) if info else info
+
+    def embed(self, query):
+        vector = np.array([self.embeddings.embed_query(query)], dtype="float32")
+        faiss.normalize_L2(vector)
+        return vector
+
+    async def aembed(self, query):
+        vector = np.array([await self.embeddings.aembed_query(query)], dtype="float32")
+        faiss.normalize_L2(vector)
+        return vector
+
+    def get_exact(self, query):
+        key = self.normalize(query)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if not self.is_valid(entry):
+                self.remove(key)
+                return None
+            self.entries.move_to_end(key)
+            self.stats_counts["exact_hits"] += 1
+            return self.copy_result(entry["result"])
+
+    def get_similar(self, query, vector=None):
+        """Return (task_type, operation_type) of the most similar cached query above the threshold, if any."""
+        if self.embeddings is None or self.index is None or self.index.ntotal == 0:
+            with self.lock:
+                self.stats_counts["misses"] += 1
+            return None
+        query = self.normalize(query)
+        if vector is None:
+            vector = self.embed(query)
+        with self.lock:
+            scores, ids = self.index.search(vector, 1)
+            if ids[0][0] == -1 or scores[0][0] < self.similarity_threshold:
+                self.stats_counts["misses"] += 1
+                return None
+            key = self.id_to_query.get(int(ids[0][0]))
+            entry = self.entries.get(key)
+            if entry is None or not self.is_valid(entry):
+                if entry is not None:
+                    self.remove(key)
+                self.stats_counts["misses"] += 1
+                return None
+            if not self.same_operation(query, entry):
+                self.stats_counts["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats_counts["semantic_hits"] += 1
+            task_type, operation_type, _ = entry["result"]
+            return task_type, operation_type
+
+    async def aget_similar(self, query):
+        if self.embeddings is None or self.index is None or self.index.ntotal == 0:
+            return self.get_similar(query)
+        return self.get_similar(query, vector=await self.aembed(self.normalize(query)))
+
+    def put(self, query, result, vector=None):
+        key = self.normalize(query)
+        if vector is None and self.embeddings is not None:
+            vector = self.embed(key)
+        with self.lock:
+            if key in self.entries:
+                self.remove(key)
+            entry = {
+                "id": self.next_id,
+                "result": result,
+                "created_at": time.time(),
+                "day": date.today() if self.is_day_bound(query, result) else None,
+                "vector": vector,
+                "operations": self.find_operations(key),
+            }
+            self.next_id += 1
+            self.entries[key] = entry
+            self.id_to_query[entry["id"]] = key
+            if vector is not None:
+                if self.index is None:
+                    self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(vector.shape[1]))
+                self.index.add_with_ids(vector, np.array([entry["id"]], dtype="int64"))
+            while len(self.entries) > self.max_entries:
+                self.remove(next(iter(self.entries)))
+
+    async def aput(self, query, result):
+        vector = await self.aembed(self.normalize(query)) if self.embeddings is not None else None
+        self.put(query, result, vector=vector)
+
+    def stats(self):
+        with self.lock:
+            total = sum(self.stats_counts.values())
+            hits = self.stats_counts["exact_hits"] + self.stats_counts["semantic_hits"]
+            return {**self.stats_counts, "entries": len(self.entries), "hit_rate": hits / total if total else 0.0}
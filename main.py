@@ -1,118 +1,121 @@
-import time
 import os
 import gradio as gr
-from sqldb import SQLDBOperator
-from vectordb import VectorDBOperator
-from intent import IntentRecognizer
-from text2sql import TextToSQL
-from chat_llm import ChatLLM
+from app_context import get_app_context
+from pipeline import run_pipeline, generate_response, generate_response_stream, arun_pipeline
+from tracing import traced
+from admission import ServerBusy, BUSY_MESSAGE
 
 os.environ["LANGCHAIN_TRACING_V2"] = "true"
 os.environ["LANGCHAIN_API_KEY"] = "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"
 os.environ["LANGCHAIN_PROJECT"] = "personal-asst"
 
-# decorator for timing
-def timing(func):
-    def wrapper(*args, **kwargs):
-        start_t = time.time()
-        result = func(*args, **kwargs)
-        end_t = time.time()
-        print(f"{func.__name__} finished, time elapsed: {end_t - start_t}")
-        return result
-    return wrapper
-
-@timing
-def get_intent(input_query):
-    recognizer = IntentRecognizer(input_query)
-    task_type, operation_type, info = recognizer.get_intents()
-    return task_type, operation_type, info
-
-@timing
-def semantic_search(input_query, vector_db_operator):
-    retrieval = vector_db_operator.search(input_query)
-    relevant_docs = [record[0] for record in retrieval]
-    relevant_record_id = vector_db_operator.get_id_by_doc(relevant_docs)
-    return relevant_record_id
-
-@timing
-def manipulate_database(operation_type: str, task_type: str, info: dict, relevant_record_id: list, db_operator: SQLDBOperator, vector_db_operator: VectorDBOperator):
-    if operation_type == "insert":
-        new_item = db_operator.create_item(info)
-        new_doc = vector_db_operator.create_documents([new_item])
-        vector_db_operator.insert(new_doc)
-        return {"status": "success", "message": "Item inserted successfully"}
-    else:
-        search_filter = {"item_id": relevant_record_id, **info}
-        if "content" in search_filter:
-            search_filter.pop("content")
-        sql_search_response = db_operator.get_items(**search_filter)
-        match_items = sql_search_response['data']
-        reponsed_items_id = [record['item_id'] for record in match_items]
-        
-        if operation_type == "delete":
-            sql_response = db_operator.delete_items(reponsed_items_id)
-            vector_db_operator.delete(reponsed_items_id)
-            return sql_response
-        elif operation_type == "update":
-            sql_response = db_operator.update_items(reponsed_items_id, info)
-            vector_db_operator.update(reponsed_items_id, info)
-            return sql_response
-        elif operation_type == "search":
-            # convert match_items to a human-readable string
-            match_items_str = "; ".join([", ".join([f"{k}: {v}" for k, v in item.items()]) for item in match_items])
-            sql_search_response["message"] = match_items_str
-            return sql_search_response
-
-@timing
-def generate_response(input_query, operation_type, task_type, sql_response, history=None):
-    chat_llm = ChatLLM(input_query, operation_type, task_type, sql_response, history)
-    response = chat_llm.generate_response(input_query)
-    return response
-
-@timing
+@traced()
 def main(input_query, history=None):
     print("Inferencing...")
+    ctx = get_app_context()
     
-    # initialize db operators
-    db_operator = SQLDBOperator()
-    vector_db_operator = VectorDBOperator(db_operator, vector_db_type="faiss")
-    
-    # step 1: get intent
-    task_type, operation_type, info = get_intent(input_query)
-    if not task_type or not operation_type:
-        # skip 2-3, directly return response
-        return generate_response(input_query, operation_type, task_type, None, history)
-    print(f"Task: {task_type}, Operation: {operation_type}, Info: {info}")
-    print("====================================")
-    
-    # step 2: semantic search
-    relevant_record_id = semantic_search(input_query, vector_db_operator)
-    print(f"Relevant item: {relevant_record_id}")
+    try:
+        # shed the turn right away when the model queues are already full
+        ctx.admission.check()
+        
+        # step 1-3: intent, semantic search and database
+        for event, payload in run_pipeline(input_query):
+            if event == "result":
+                operation_type, task_type, sql_response = payload
+        
+        # step 4: generate response
+        response = generate_response(input_query, operation_type, task_type, sql_response, ctx.chat_llm, history)
+    except ServerBusy as e:
+        print(f"Request shed: {e}")
+        return BUSY_MESSAGE
+    print(response)
     print("====================================")
     
-    # step 3: manipulate Database
-    sql_response = manipulate_database(operation_type, task_type, info, relevant_record_id, db_operator, vector_db_operator)
-    print(f"SQL Response: {sql_response}")
+    return response
+
+@traced()
+def main_stream(input_query, history=None):
+    """Streaming variant of main, yields status updates and then the partial response."""
+    print("Inferencing...")
+    ctx = get_app_context()
+    try:
+        ctx.admission.check()
+        yield "Understanding your request..."
+        
+        # step 1-3: intent, semantic search and database
+        for event, payload in run_pipeline(input_query):
+            if event == "status":
+                yield payload
+            elif event == "result":
+                operation_type, task_type, sql_response = payload
+        
+        # step 4: stream the response, each yield replaces the previous message
+        response = ""
+        for chunk in generate_response_stream(input_query, operation_type, task_type, sql_response, ctx.chat_llm, history):
+            response += chunk
+            yield response
+    except ServerBusy as e:
+        print(f"Request shed: {e}")
+        yield BUSY_MESSAGE
+        return
+    print(response)
     print("====================================")
-    
-    # step 4: generate response
-    response = generate_response(input_query, operation_type, task_type, sql_response, history)
+
+# async request path, see pipeline.py
+
+@traced("main")
+async def amain(input_query, history=None):
+    print("Inferencing...")
+    ctx = get_app_context()
+    try:
+        ctx.admission.check()
+        async for event, payload in arun_pipeline(input_query):
+            if event == "result":
+                operation_type, task_type, sql_response = payload
+        return await ctx.chat_llm.agenerate_response(input_query, operation_type, task_type, sql_response, history)
+    except ServerBusy as e:
+        print(f"Request shed: {e}")
+        return BUSY_MESSAGE
+
+@traced("main_stream")
+async def amain_stream(input_query, history=None):
+    """Async main_stream, yields status updates and then the partial response."""
+    print("Inferencing...")
+    ctx = get_app_context()
+    try:
+        ctx.admission.check()
+        yield "Understanding your request..."
+        
+        async for event, payload in arun_pipeline(input_query):
+            if event == "status":
+                yield payload
+            elif event == "result":
+                operation_type, task_type, sql_response = payload
+        
+        response = ""
+        async for chunk in ctx.chat_llm.astream_response(input_query, operation_type, task_type, sql_response, history):
+            response += chunk
+            yield response
+    except ServerBusy as e:
+        print(f"Request shed: {e}")
+        yield BUSY_MESSAGE
+        return
     print(response)
     print("====================================")
-    
-    return response
 
 # Gradio chat interface
-def gradio_interface(user_input, history):
-    # Get the response from the main function
-    response = main(user_input, history)
-    
-    return response
+async def gradio_interface(user_input, history):
+    # Stream the response from the async pipeline, many conversations share the event loop
+    async for message in amain_stream(user_input, history):
+        yield message
 
 # Create the Gradio interface
-iface = gr.ChatInterface(fn=gradio_interface, type="messages")
+# the handler is async, do not limit gradio to one conversation at a time
+iface = gr.ChatInterface(fn=gradio_interface, type="messages", concurrency_limit=None)
 
 if __name__ == "__main__":
+    # build the shared operators at startup rather than on the first chat turn
+    get_app_context()
     # iface.launch()
     input = "show me recent meetings"
     response = main(input)
@@ -0,0 +1,162 @@
+import logging
+from sqlalchemy import inspect
+
+# versioned schema changes on top of the tables created by init_sqlite.py, the applied version
+# is stored in PRAGMA user_version. statements are idempotent so an interrupted run can be repeated
+MIGRATIONS = [
+    (1, "full-text index over item title and content", [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS item_fts USING fts5(title, content, content='item', content_rowid='item_id')",
+        """
+        CREATE TRIGGER IF NOT EXISTS item_fts_insert AFTER INSERT ON item BEGIN
+            INSERT INTO item_fts(rowid, title, content) VALUES (new.item_id, new.title, new.content);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS item_fts_delete AFTER DELETE ON item BEGIN
+            INSERT INTO item_fts(item_fts, rowid, title, content) VALUES ('delete', old.item_id, old.title, old.content);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS item_fts_update AFTER UPDATE OF title, content ON item BEGIN
+            INSERT INTO item_fts(item_fts, rowid, title, content) VALUES ('delete', old.item_id, old.title, old.content);
+            INSERT INTO item_fts(rowid, title, content) VALUES (new.item_id, new.title, new.content);
+        END
+        """,
+        # index the rows that already exist
+        "INSERT INTO item_fts(item_fts) VALUES ('rebuild')",
+    ]),
+    (2, "indexes for the get_items access paths", [
+        # join from item to schedule, covering every schedule column get_items returns
+        "CREATE INDEX IF NOT EXISTS idx_schedule_item ON schedule(item_id, start_date, start_time, end_date, end_time)",
+        # start_date ranges of search_time_frame, covering so the range scan never reads the table
+        "CREATE INDEX IF NOT EXISTS idx_schedule_start ON schedule(start_date, item_id, start_time, end_date, end_time)",
+        # recurrence pattern/rule filters go through the unique (pattern, rule) index to the items
+        "CREATE INDEX IF NOT EXISTS idx_item_recurrence ON item(recurrence_id)",
+        # planner statistics for the new indexes
+        "ANALYZE",
+    ]),
+    (3, "item changelog for syncing the vector index", [
+        # changed_at in unix seconds, the consumer reports the age of the oldest pending change as lag
+        """
+        CREATE TABLE IF NOT EXISTS item_changelog (
+            change_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            item_id INTEGER NOT NULL,
+            operation TEXT CHECK(operation IN ('INSERT', 'UPDATE', 'DELETE')) NOT NULL,
+            changed_at REAL NOT NULL
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS item_changelog_insert AFTER INSERT ON item BEGIN
+            INSERT INTO item_changelog(item_id, operation, changed_at) VALUES (new.item_id, 'INSERT', (julianday('now') - 2440587.5) * 86400.0);
+        END
+        """,
+        # only the columns the documents are built from
+        """
+        CREATE TRIGGER IF NOT EXISTS item_changelog_update AFTER UPDATE OF title, content ON item BEGIN
+            INSERT INTO item_changelog(item_id, operation, changed_at) VALUES (new.item_id, 'UPDATE', (julianday('now') - 2440587.5) * 86400.0);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS item_changelog_delete AFTER DELETE ON item BEGIN
+            INSERT INTO item_changelog(item_id, operation, changed_at) VALUES (old.item_id, 'DELETE', (julianday('now') - 2440587.5) * 86400.0);
+        END
+        """,
+    ]),
+    (4, "changelog entries for the vector document metadata", [
+        # documents also carry item_type, item_status and the start month of the schedule
+        "DROP TRIGGER IF EXISTS item_changelog_update",
+        """
+        CREATE TRIGGER item_changelog_update AFTER UPDATE OF title, content, item_type, item_status ON item BEGIN
+            INSERT INTO item_changelog(item_id, operation, changed_at) VALUES (new.item_id, 'UPDATE', (julianday('now') - 2440587.5) * 86400.0);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS item_changelog_schedule_insert AFTER INSERT ON schedule BEGIN
+            INSERT INTO item_changelog(item_id, operation, changed_at) VALUES (new.item_id, 'UPDATE', (julianday('now') - 2440587.5) * 86400.0);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS item_changelog_schedule_update AFTER UPDATE OF item_id, start_date ON schedule BEGIN
+            INSERT INTO item_changelog(item_id, operation, changed_at) VALUES (old.item_id, 'UPDATE', (julianday('now') - 2440587.5) * 86400.0);
+            INSERT INTO item_changelog(item_id, operation, changed_at) VALUES (new.item_id, 'UPDATE', (julianday('now') - 2440587.5) * 86400.0);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS item_changelog_schedule_delete AFTER DELETE ON schedule BEGIN
+            INSERT INTO item_changelog(item_id, operation, changed_at) VALUES (old.item_id, 'UPDATE', (julianday('now') - 2440587.5) * 86400.0);
+        END
+        """,
+        # documents indexed before this version only have an item_id, the consumer re-reads every item
+        "INSERT INTO item_changelog(item_id, operation, changed_at) SELECT item_id, 'UPDATE', (julianday('now') - 2440587.5) * 86400.0 FROM item",
+    ]),
+    (5, "materialized occurrences of the schedule rows", [
+        # one row per occurrence over the rolling horizon in occurrence_horizon, times as "YYYY-MM-DD HH:MM:SS"
+        """
+        CREATE TABLE IF NOT EXISTS occurrence (
+            occurrence_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            item_id INTEGER NOT NULL,
+            schedule_id INTEGER NOT NULL,
+            occurrence_start TEXT NOT NULL,
+            occurrence_end TEXT NOT NULL
+        )
+        """,
+        # calendar ranges are scans of this index, covering every column the get_items join needs
+        "CREATE INDEX IF NOT EXISTS idx_occurrence_start ON occurrence(occurrence_start, item_id, schedule_id, occurrence_end)",
+        "CREATE INDEX IF NOT EXISTS idx_occurrence_item ON occurrence(item_id)",
+        "CREATE TABLE IF NOT EXISTS occurrence_horizon (start_date DATE NOT NULL, end_date DATE NOT NULL)",
+        # items whose occurrences must be regenerated, filled by triggers so every writer is covered
+        "CREATE TABLE IF NOT EXISTS occurrence_dirty (item_id INTEGER PRIMARY KEY)",
+        """
+        CREATE TRIGGER IF NOT EXISTS occurrence_dirty_schedule_insert AFTER INSERT ON schedule BEGIN
+            INSERT OR IGNORE INTO occurrence_dirty(item_id) VALUES (new.item_id);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS occurrence_dirty_schedule_update AFTER UPDATE ON schedule BEGIN
+            INSERT OR IGNORE INTO occurrence_dirty(item_id) VALUES (old.item_id);
+            INSERT OR IGNORE INTO occurrence_dirty(item_id) VALUES (new.item_id);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS occurrence_dirty_schedule_delete AFTER DELETE ON schedule BEGIN
+            INSERT OR IGNORE INTO occurrence_dirty(item_id) VALUES (old.item_id);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS occurrence_dirty_item_update AFTER UPDATE OF recurrence_id ON item BEGIN
+            INSERT OR IGNORE INTO occurrence_dirty(item_id) VALUES (new.item_id);
+        END
+        """,
+        # foreign keys are not enforced, the schedule rows of a deleted item stay behind
+        """
+        CREATE TRIGGER IF NOT EXISTS occurrence_dirty_item_delete AFTER DELETE ON item BEGIN
+            INSERT OR IGNORE INTO occurrence_dirty(item_id) VALUES (old.item_id);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS occurrence_dirty_recurrence_update AFTER UPDATE OF recurrence_pattern, recurrence_rule ON recurrence BEGIN
+            INSERT OR IGNORE INTO occurrence_dirty(item_id) SELECT item_id FROM item WHERE recurrence_id = new.recurrence_id;
+        END
+        """,
+    ]),
+]
+
+def get_version(connection):
+    return connection.exec_driver_sql("PRAGMA user_version").scalar()
+
+def migrate(engine, target=None):
+    """Apply the migrations newer than the database version up to target (default: all), returns the resulting version."""
+    with engine.begin() as connection:
+        if 'item' not in inspect(connection).get_table_names():
+            logging.warning("No item table, run init_sqlite.py before migrating")
+            return 0
+        version = get_version(connection)
+        for number, description, statements in MIGRATIONS:
+            if number <= version or (target is not None and number > target):
+                continue
+            for statement in statements:
+                connection.exec_driver_sql(statement)
+            connection.exec_driver_sql(f"PRAGMA user_version = {number}")
+            version = number
+            logging.info(f"Migrated database to version {number}: {description}")
+    return version
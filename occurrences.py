@@ -0,0 +1,276 @@
+import logging
+import threading
+from datetime import date, timedelta
+from collections import OrderedDict
+import numpy as np
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+def to_days(dates):
+    """datetime64[D] array of datetime.date values, through their ordinals (much faster than numpy's date parsing)."""
+    if isinstance(dates, np.ndarray):
+        return dates.astype("datetime64[D]")
+    return (np.array([day.toordinal() for day in dates], dtype="int64") - EPOCH_ORDINAL).astype("datetime64[D]")
+
+def weekday(days):
+    """Weekday of datetime64[D] values, 0 = Monday (1970-01-01 was a Thursday)."""
+    return (days.astype("int64") + 3) % 7
+
+def day_in_month(months, day):
+    """Day `day` of each datetime64[M] month, clamped to the last day (the 30th is February 28/29)."""
+    first = months.astype("datetime64[D]")
+    length = ((months + 1).astype("datetime64[D]") - first).astype("int64")
+    return first + (np.minimum(day, length) - 1)
+
+def spread(starts, counts):
+    """For sequences of the given lengths, return (sequence index, position in the sequence) of every element."""
+    index = np.repeat(np.arange(len(counts)), counts)
+    position = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return index, starts[index] + position
+
+def expand(patterns, rules, anchors, window_start, window_end):
+    """Occurrence dates of every schedule row in [window_start, window_end], computed for all rows at once.
+
+    patterns/rules are the recurrence columns and anchors the schedule start dates. DAILY repeats
+    every `rule` days from the anchor, WEEKLY and BIWEEKLY every one or two weeks on weekday `rule`
+    (1 = Monday), MONTHLY on day `rule` of each month. The first occurrence is the first match on
+    or after the anchor, rows without a pattern occur once on their anchor.
+    Returns (row index, datetime64[D] date) arrays ordered by row and date.
+    """
+    patterns = np.asarray(patterns, dtype=object)
+    rules = np.array([rule or 0 for rule in rules], dtype="int64")
+    anchors = to_days(anchors)
+    lo, hi = np.datetime64(window_start, "D"), np.datetime64(window_end, "D")
+    indexes, dates = [], []
+
+    # daily and weekly rules are arithmetic sequences first + k * step
+    step = np.zeros(len(anchors), dtype="int64")
+    first = anchors.copy()
+    daily = patterns == "DAILY"
+    step[daily] = np.maximum(rules[daily], 1)
+    weekly = (patterns == "WEEKLY") | (patterns == "BIWEEKLY")
+    first[weekly] = anchors[weekly] + (rules[weekly] - 1 - weekday(anchors[weekly])) % 7
+    step[weekly] = np.where(patterns[weekly] == "BIWEEKLY", 14, 7)
+    rows = np.flatnonzero(step)
+    start, size = first[rows].astype("int64"), step[rows]
+    # k runs from the first index on or after lo to the last one on or before hi
+    k0 = np.maximum(-((start - lo.astype("int64")) // size), 0)
+    counts = np.maximum((hi.astype("int64") - start) // size - k0 + 1, 0)
+    index, k = spread(k0, counts)
+    indexes.append(rows[index])
+    dates.append((start[index] + k * size[index]).astype("datetime64[D]"))
+
+    # monthly rules step through months, the day is clamped to the month length
+    rows = np.flatnonzero(patterns == "MONTHLY")
+    day = np.clip(rules[rows], 1, 31)
+    month = anchors[rows].astype("datetime64[M]")
+    month = np.where(day_in_month(month, day) >= anchors[rows], month, month + 1)
+    m0 = np.maximum(month, lo.astype("datetime64[M]"))
+    counts = np.maximum((hi.astype("datetime64[M]") - m0).astype("int64") + 1, 0)
+    index, months = spread(m0, counts)
+    monthly_dates = day_in_month(months, day[index])
+    # the first and last month may only partly overlap the window
+    keep = (monthly_dates >= lo) & (monthly_dates <= hi)
+    indexes.append(rows[index][keep])
+    dates.append(monthly_dates[keep])
+
+    rows = np.flatnonzero((step == 0) & (patterns != "MONTHLY"))
+    rows = rows[(anchors[rows] >= lo) & (anchors[rows] <= hi)]
+    indexes.append(rows)
+    dates.append(anchors[rows])
+
+    indexes, dates = np.concatenate(indexes), np.concatenate(dates)
+    # every row is in one block and each block is in date order, a stable sort on the row is enough
+    order = np.argsort(indexes, kind="stable")
+    return indexes[order], dates[order]
+
+class OccurrenceCache:
+    """Occurrences of schedule rows in a date window, expanded in one vectorized pass over all cache misses.
+
+    Entries are keyed by (item_id, window start, window end) and hold the dates per schedule row,
+    identified by its pattern, rule and dates, so a changed row never matches a stale entry.
+    invalidate() drops the entries of updated or deleted items, the oldest entries are evicted
+    beyond max_entries.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        # (item_id, start, end) -> {row signature: [date, ...]}
+        self.entries = OrderedDict()
+        self.windows = {}
+        self.lock = threading.Lock()
+        self.stats_counts = {"hits": 0, "misses": 0}
+
+    def signature(self, row):
+        return row["recurrence_pattern"], row["recurrence_rule"], row["start_date"], row["end_date"]
+
+    def lookup(self, rows, window):
+        """Return the cached dates of each row, None for misses."""
+        found = []
+        with self.lock:
+            for row in rows:
+                key = (row["item_id"], *window)
+                dates = self.entries.get(key, {}).get(self.signature(row))
+                if dates is not None:
+                    self.entries.move_to_end(key)
+                    self.stats_counts["hits"] += 1
+                else:
+                    self.stats_counts["misses"] += 1
+                found.append(dates)
+        return found
+
+    def store(self, rows, window, dates):
+        with self.lock:
+            for row, row_dates in zip(rows, dates):
+                key = (row["item_id"], *window)
+                self.entries.setdefault(key, {})[self.signature(row)] = row_dates
+                self.entries.move_to_end(key)
+                self.windows.setdefault(row["item_id"], set()).add(window)
+            while len(self.entries) > self.max_entries:
+                (item_id, *evicted), _ = self.entries.popitem(last=False)
+                self.windows[item_id].discard(tuple(evicted))
+                if not self.windows[item_id]:
+                    del self.windows[item_id]
+
+    def invalidate(self, item_ids=None):
+        """Drop the cached occurrences of the given items, or of all items."""
+        with self.lock:
+            if item_ids is None:
+                self.entries.clear()
+                self.windows.clear()
+                return
+            for item_id in item_ids:
+                for window in self.windows.pop(item_id, ()):
+                    self.entries.pop((item_id, *window), None)
+
+    def occurrences(self, rows, window_start, window_end):
+        """Occurrence dates of each get_items row in the window, as lists of datetime.date."""
+        window = (window_start, window_end)
+        found = self.lookup(rows, window)
+        misses = [i for i, dates in enumerate(found) if dates is None]
+        if misses:
+            missing = [rows[i] for i in misses]
+            index, dates = expand([row["recurrence_pattern"] for row in missing], [row["recurrence_rule"] for row in missing],
+                                  [row["start_date"] for row in missing], window_start, window_end)
+            dates = dates.astype(object).tolist()
+            bounds = np.searchsorted(index, np.arange(len(missing) + 1)).tolist()
+            expanded = [dates[bounds[j]:bounds[j + 1]] for j in range(len(missing))]
+            self.store(missing, window, expanded)
+            for i, row_dates in zip(misses, expanded):
+                found[i] = row_dates
+        return found
+
+    def expand_rows(self, rows, window_start, window_end):
+        """Return one copy of each row per occurrence in the window, with start_date and end_date moved to it."""
+        expanded = []
+        for row, dates in zip(rows, self.occurrences(rows, window_start, window_end)):
+            duration = row["end_date"] - row["start_date"] if row["end_date"] else timedelta(0)
+            expanded += [{**row, "start_date": day, "end_date": day + duration} for day in dates]
+        return expanded
+
+    def stats(self):
+        with self.lock:
+            total = self.stats_counts["hits"] + self.stats_counts["misses"]
+            return {**self.stats_counts, "entries": len(self.entries), "hit_rate": self.stats_counts["hits"] / total if total else 0.0}
+
+class OccurrenceStore:
+    """Maintains the materialized occurrence table (migration 5) over a rolling horizon.
+
+    The horizon runs from past_days before today to horizon_days after it and moves forward once a
+    day: occurrences that fell out of it are deleted and only the new days are generated. Triggers
+    queue the items whose schedule or recurrence changed in occurrence_dirty, refresh() regenerates
+    just those. Writers call it in their own transaction, sync() catches up on anything else (a new
+    day, writes from generated sql) and is only needed when is_stale() says so.
+    """
+
+    def __init__(self, past_days=31, horizon_days=180):
+        self.past_days = past_days
+        self.horizon_days = horizon_days
+        # horizon of the table as of the last sync, read without a query by covers()
+        self.horizon = None
+
+    def covers(self, window_start, window_end):
+        return self.horizon is not None and self.horizon[0] <= window_start and window_end <= self.horizon[1]
+
+    @staticmethod
+    def timestamp(day, time):
+        """"YYYY-MM-DD HH:MM:SS" of an occurrence, just the date when the schedule row has no time."""
+        # stored times may carry microseconds, keep HH:MM:SS
+        return f"{day} {time[:8]}" if time else day
+
+    def generate(self, connection, window_start, window_end, dirty_only=False):
+        """Insert the occurrences of all schedule rows, or of the dirty items, between the two dates."""
+        rows = connection.exec_driver_sql(
+            "SELECT schedule.item_id, schedule.schedule_id, recurrence.recurrence_pattern, recurrence.recurrence_rule, "
+            "schedule.start_date, schedule.start_time, schedule.end_date, schedule.end_time "
+            "FROM schedule JOIN item USING (item_id) LEFT JOIN recurrence USING (recurrence_id) "
+            "WHERE schedule.start_date <= ?" + (" AND schedule.item_id IN (SELECT item_id FROM occurrence_dirty)" if dirty_only else ""),
+            (window_end.isoformat(),)
+        ).all()
+        if not rows:
+            return 0
+        item_ids, schedule_ids, patterns, rules, start_dates, start_times, end_dates, end_times = zip(*rows)
+        index, dates = expand(patterns, rules, [date.fromisoformat(day[:10]) for day in start_dates], window_start, window_end)
+        # a missing end date makes a one-day occurrence, as in OccurrenceCache.expand_rows
+        durations = np.array([(date.fromisoformat(end[:10]) - date.fromisoformat(start[:10])).days if end else 0
+                              for start, end in zip(start_dates, end_dates)], dtype="int64")
+        starts = np.datetime_as_string(dates).tolist()
+        ends = np.datetime_as_string(dates + durations[index]).tolist()
+        values = [(item_ids[i], schedule_ids[i], self.timestamp(start, start_times[i]), self.timestamp(end, end_times[i]))
+                  for i, start, end in zip(index.tolist(), starts, ends)]
+        if values:
+            connection.exec_driver_sql(
+                "INSERT INTO occurrence (item_id, schedule_id, occurrence_start, occurrence_end) VALUES (?, ?, ?, ?)", values
+            )
+        return len(values)
+
+    def read_horizon(self, connection):
+        row = connection.exec_driver_sql("SELECT start_date, end_date FROM occurrence_horizon").first()
+        return (date.fromisoformat(row[0]), date.fromisoformat(row[1])) if row else None
+
+    def target(self, today=None):
+        """The configured horizon around today."""
+        today = today or date.today()
+        return today - timedelta(days=self.past_days), today + timedelta(days=self.horizon_days)
+
+    def is_stale(self, connection, today=None):
+        """Whether sync() has anything to do, checked with reads only so readers do not take the write lock."""
+        if self.horizon != self.target(today) and self.read_horizon(connection) != self.target(today):
+            return True
+        return bool(connection.exec_driver_sql("SELECT EXISTS (SELECT 1 FROM occurrence_dirty)").scalar())
+
+    def roll(self, connection, today=None):
+        """Move the horizon to the configured range around today, returns the number of occurrences generated."""
+        start, end = self.target(today)
+        horizon = self.read_horizon(connection)
+        if horizon == (start, end):
+            return 0
+        if horizon is None or start < horizon[0] or end < horizon[1] or start > horizon[1]:
+            # first build, or the configured range changed: regenerate everything
+            connection.exec_driver_sql("DELETE FROM occurrence")
+            generated = self.generate(connection, start, end)
+        else:
+            connection.exec_driver_sql("DELETE FROM occurrence WHERE occurrence_start < ?", (start.isoformat(),))
+            generated = self.generate(connection, horizon[1] + timedelta(days=1), end)
+        connection.exec_driver_sql("DELETE FROM occurrence_horizon")
+        connection.exec_driver_sql("INSERT INTO occurrence_horizon (start_date, end_date) VALUES (?, ?)", (start.isoformat(), end.isoformat()))
+        logging.info(f"Occurrence horizon moved to {start} - {end}, {generated} occurrences generated")
+        return generated
+
+    def refresh(self, connection):
+        """Regenerate the occurrences of the items queued in occurrence_dirty, returns the number of items refreshed."""
+        dirty = connection.exec_driver_sql("SELECT COUNT(*) FROM occurrence_dirty").scalar()
+        if not dirty:
+            return 0
+        connection.exec_driver_sql("DELETE FROM occurrence WHERE item_id IN (SELECT item_id FROM occurrence_dirty)")
+        horizon = self.read_horizon(connection)
+        if horizon is not None:
+            self.generate(connection, *horizon, dirty_only=True)
+        connection.exec_driver_sql("DELETE FROM occurrence_dirty")
+        return dirty
+
+    def sync(self, connection):
+        """Roll the horizon if the day changed and apply pending refreshes, on a connection in a transaction."""
+        self.roll(connection)
+        self.refresh(connection)
+        return self.read_horizon(connection)
@@ -0,0 +1,150 @@
+import time
+import asyncio
+import logging
+import threading
+from contextlib import nullcontext
+import httpx
+from typing import Optional, Union
+from pydantic import PrivateAttr
+from ollama import Client, AsyncClient
+from langchain_ollama import OllamaEmbeddings
+from langchain_ollama.llms import OllamaLLM
+from admission import AdmissionController
+
+# transient model-server answers worth another attempt, e.g. while a model is loading
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+# connection failures, including a keep-alive connection closed by the server
+RETRY_EXCEPTIONS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError)
+
+class RetryTransport(httpx.HTTPTransport):
+    """Pooled transport that retries connection errors and transient statuses with exponential backoff."""
+
+    def __init__(self, max_retries=3, backoff=0.5, **kwargs):
+        super().__init__(**kwargs)
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+    def handle_request(self, request):
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = super().handle_request(request)
+            except RETRY_EXCEPTIONS as e:
+                if attempt == self.max_retries:
+                    raise
+                logging.warning(f"Ollama request failed ({e!r}), retry {attempt + 1}/{self.max_retries}")
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                    return response
+                response.close()
+                logging.warning(f"Ollama returned {response.status_code}, retry {attempt + 1}/{self.max_retries}")
+            time.sleep(self.backoff * 2 ** attempt)
+
+class AsyncRetryTransport(httpx.AsyncHTTPTransport):
+    """Async counterpart of RetryTransport."""
+
+    def __init__(self, max_retries=3, backoff=0.5, **kwargs):
+        super().__init__(**kwargs)
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+    async def handle_async_request(self, request):
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await super().handle_async_request(request)
+            except RETRY_EXCEPTIONS as e:
+                if attempt == self.max_retries:
+                    raise
+                logging.warning(f"Ollama request failed ({e!r}), retry {attempt + 1}/{self.max_retries}")
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                    return response
+                await response.aclose()
+                logging.warning(f"Ollama returned {response.status_code}, retry {attempt + 1}/{self.max_retries}")
+            await asyncio.sleep(self.backoff * 2 ** attempt)
+
+def slot(limiter):
+    return limiter.slot() if limiter is not None else nullcontext()
+
+def aslot(limiter):
+    return limiter.aslot() if limiter is not None else nullcontext()
+
+class AdmittedOllamaLLM(OllamaLLM):
+    """OllamaLLM whose generations hold a slot of a ModelLimiter, for invoke and stream alike."""
+
+    _limiter = PrivateAttr(default=None)
+
+    def _create_generate_stream(self, *args, **kwargs):
+        with slot(self._limiter):
+            yield from super()._create_generate_stream(*args, **kwargs)
+
+    async def _acreate_generate_stream(self, *args, **kwargs):
+        async with aslot(self._limiter):
+            async for part in super()._acreate_generate_stream(*args, **kwargs):
+                yield part
+
+class KeepAliveOllamaEmbeddings(OllamaEmbeddings):
+    """OllamaEmbeddings that passes keep_alive to the server, like OllamaLLM does, and holds a limiter slot per call."""
+
+    keep_alive: Optional[Union[int, str]] = None
+    _limiter = PrivateAttr(default=None)
+
+    def embed_documents(self, texts):
+        with slot(self._limiter):
+            return self._client.embed(self.model, texts, keep_alive=self.keep_alive)["embeddings"]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts):
+        async with aslot(self._limiter):
+            return (await self._async_client.embed(self.model, texts, keep_alive=self.keep_alive))["embeddings"]
+
+    async def aembed_query(self, text):
+        return (await self.aembed_documents([text]))[0]
+
+class OllamaClients:
+    """One pooled keep-alive connection pool to the model server, shared by every LLM and embedding client."""
+
+    def __init__(self, config):
+        ollama_config = config.get('ollama', {})
+        self.base_url = ollama_config.get('base_url')
+        # how long the server keeps a model loaded after a request, e.g. "30m" or -1 for forever
+        self.keep_alive = ollama_config.get('keep_alive', "30m")
+        limits = httpx.Limits(
+            max_connections=ollama_config.get('max_connections', 16),
+            max_keepalive_connections=ollama_config.get('max_keepalive_connections', 16),
+            keepalive_expiry=ollama_config.get('keepalive_expiry', 300)
+        )
+        # generations can take long, the read timeout bounds the time between streamed chunks
+        timeout = httpx.Timeout(ollama_config.get('timeout', 120), connect=ollama_config.get('connect_timeout', 5))
+        retries = dict(max_retries=ollama_config.get('max_retries', 3), backoff=ollama_config.get('retry_backoff', 0.5))
+        self.client = Client(host=self.base_url, timeout=timeout, transport=RetryTransport(limits=limits, **retries))
+        self.async_client = AsyncClient(host=self.base_url, timeout=timeout, transport=AsyncRetryTransport(limits=limits, **retries))
+        # per-model concurrency limits and priority queues in front of the server
+        self.admission = AdmissionController(config)
+
+    def llm(self, model, **kwargs):
+        """Build an llm client, clients of the same model share its admission limiter."""
+        llm = AdmittedOllamaLLM(model=model, base_url=self.base_url, keep_alive=self.keep_alive, **kwargs)
+        llm._client, llm._async_client = self.client, self.async_client
+        llm._limiter = self.admission.limiter(model)
+        return llm
+
+    def embeddings(self, model):
+        embeddings = KeepAliveOllamaEmbeddings(model=model, base_url=self.base_url, keep_alive=self.keep_alive)
+        embeddings._client, embeddings._async_client = self.client, self.async_client
+        embeddings._limiter = self.admission.limiter(model)
+        return embeddings
+
+
+_ollama_clients = None
+_ollama_clients_lock = threading.Lock()
+
+def get_ollama_clients(config):
+    """Return the process-wide OllamaClients, built from the config of the first caller."""
+    global _ollama_clients
+    if _ollama_clients is None:
+        with _ollama_clients_lock:
+            if _ollama_clients is None:
+                _ollama_clients = OllamaClients(config)
+    return _ollama_clients
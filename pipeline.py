@@ -0,0 +1,166 @@
+import asyncio
+from sqldb import SQLDBOperator
+from app_context import get_app_context
+from tracing import traced, submit
+
+# steps of a chat turn, without the Gradio interface of main.py so batch runs can import them
+
+@traced()
+def get_intent(input_query, recognizer):
+    task_type, operation_type, info = recognizer.get_intents(input_query)
+    return task_type, operation_type, info
+
+@traced()
+def semantic_search(input_query, vector_db_operator):
+    if vector_db_operator.config.get('retrieval', {}).get('mode') == "hybrid":
+        return vector_db_operator.hybrid_search(input_query)
+    retrieval = vector_db_operator.search(input_query)
+    relevant_docs = [record[0] for record in retrieval]
+    relevant_record_id = vector_db_operator.get_id_by_doc(relevant_docs)
+    return relevant_record_id
+
+@traced()
+def manipulate_database(operation_type: str, task_type: str, info: dict, relevant_record_id: list, db_operator: SQLDBOperator):
+    # the vector index follows the item table through item_changelog, see vector_sync.py
+    if operation_type == "create":
+        return db_operator.create_items([info])
+    else:
+        search_filter = {"item_id": relevant_record_id, **info}
+        if "content" in search_filter:
+            search_filter.pop("content")
+        sql_search_response = db_operator.get_items(**search_filter)
+        match_items = sql_search_response['data']
+        reponsed_items_id = [record['item_id'] for record in match_items]
+        
+        if operation_type == "delete":
+            return db_operator.delete_items(reponsed_items_id)
+        elif operation_type == "update":
+            return db_operator.update_items(reponsed_items_id, info)
+        elif operation_type == "search":
+            # convert match_items to a human-readable string
+            match_items_str = "; ".join([", ".join([f"{k}: {v}" for k, v in item.items()]) for item in match_items])
+            sql_search_response["message"] = match_items_str
+            return sql_search_response
+
+@traced()
+def generate_response(input_query, operation_type, task_type, sql_response, chat_llm, history=None):
+    response = chat_llm.generate_response(input_query, operation_type, task_type, sql_response, history)
+    return response
+
+@traced()
+def generate_response_stream(input_query, operation_type, task_type, sql_response, chat_llm, history=None):
+    yield from chat_llm.stream_response(input_query, operation_type, task_type, sql_response, history)
+
+def run_pipeline(input_query):
+    """Run steps 1-3 of a chat turn.
+    
+    Yields ("status", message) updates while running, and finally
+    ("result", (operation_type, task_type, sql_response)) for the response step.
+    """
+    # shared operators, built once per process
+    ctx = get_app_context()
+    db_operator = ctx.db_operator
+    vector_db_operator = ctx.vector_db_operator
+    
+    # step 2 (speculative): semantic search only needs the raw query, overlap it with intent recognition
+    search_future = submit(ctx.executor, semantic_search, input_query, vector_db_operator)
+    
+    # step 1: get intent
+    try:
+        task_type, operation_type, info = get_intent(input_query, ctx.recognizer)
+    except Exception:
+        search_future.cancel()
+        raise
+    if not task_type or not operation_type:
+        # chat only, drop the speculative search and skip 2-3
+        search_future.cancel()
+        yield "result", (operation_type, task_type, None)
+        return
+    print(f"Task: {task_type}, Operation: {operation_type}, Info: {info}")
+    print("====================================")
+    yield "status", f"Working on your {task_type} ({operation_type})..."
+    
+    # step 2: semantic search
+    relevant_record_id = search_future.result()
+    print(f"Relevant item: {relevant_record_id}")
+    print("====================================")
+    yield "status", f"Found {len(relevant_record_id)} related item(s), updating your {task_type}..."
+    
+    # step 3: manipulate Database
+    sql_response = manipulate_database(operation_type, task_type, info, relevant_record_id, db_operator)
+    print(f"SQL Response: {sql_response}")
+    print("====================================")
+    
+    yield "result", (operation_type, task_type, sql_response)
+
+# async request path: llm, embedding and sql calls are awaited on the event loop,
+# so concurrent conversations do not each hold a worker thread
+
+@traced("get_intent")
+async def aget_intent(input_query, recognizer):
+    return await recognizer.aget_intents(input_query)
+
+@traced("semantic_search")
+async def asemantic_search(input_query, vector_db_operator):
+    if vector_db_operator.config.get('retrieval', {}).get('mode') == "hybrid":
+        return await vector_db_operator.ahybrid_search(input_query)
+    retrieval = await vector_db_operator.asearch(input_query)
+    relevant_docs = [record[0] for record in retrieval]
+    return vector_db_operator.get_id_by_doc(relevant_docs)
+
+@traced("manipulate_database")
+async def amanipulate_database(operation_type: str, task_type: str, info: dict, relevant_record_id: list, db_operator: SQLDBOperator):
+    if operation_type == "create":
+        return await db_operator.acreate_items([info])
+    else:
+        search_filter = {"item_id": relevant_record_id, **info}
+        if "content" in search_filter:
+            search_filter.pop("content")
+        sql_search_response = await db_operator.aget_items(**search_filter)
+        match_items = sql_search_response['data']
+        reponsed_items_id = [record['item_id'] for record in match_items]
+        
+        if operation_type == "delete":
+            return await db_operator.adelete_items(reponsed_items_id)
+        elif operation_type == "update":
+            return await db_operator.aupdate_items(reponsed_items_id, info)
+        elif operation_type == "search":
+            match_items_str = "; ".join([", ".join([f"{k}: {v}" for k, v in item.items()]) for item in match_items])
+            sql_search_response["message"] = match_items_str
+            return sql_search_response
+
+async def arun_pipeline(input_query):
+    """Async run_pipeline, yields the same ("status", ...) and ("result", ...) events."""
+    ctx = get_app_context()
+    db_operator = ctx.db_operator
+    vector_db_operator = ctx.vector_db_operator
+    
+    # step 2 (speculative): overlap semantic search with intent recognition
+    search_task = asyncio.create_task(asemantic_search(input_query, vector_db_operator))
+    
+    # step 1: get intent
+    try:
+        task_type, operation_type, info = await aget_intent(input_query, ctx.recognizer)
+    except BaseException:
+        search_task.cancel()
+        raise
+    if not task_type or not operation_type:
+        search_task.cancel()
+        yield "result", (operation_type, task_type, None)
+        return
+    print(f"Task: {task_type}, Operation: {operation_type}, Info: {info}")
+    print("====================================")
+    yield "status", f"Working on your {task_type} ({operation_type})..."
+    
+    # step 2: semantic search
+    relevant_record_id = await search_task
+    print(f"Relevant item: {relevant_record_id}")
+    print("====================================")
+    yield "status", f"Found {len(relevant_record_id)} related item(s), updating your {task_type}..."
+    
+    # step 3: manipulate Database
+    sql_response = await amanipulate_database(operation_type, task_type, info, relevant_record_id, db_operator)
+    print(f"SQL Response: {sql_response}")
+    print("====================================")
+    
+    yield "result", (operation_type, task_type, sql_response)
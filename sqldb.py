@@ -1,13 +1,20 @@
+import asyncio
 import logging
+import threading
 import yaml
 import re
 import parsedatetime as pdt
 import pandas as pd
-from datetime import datetime
-from sqlalchemy import create_engine, inspect
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, inspect, event, select, insert, delete, update, or_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy import Column, Integer, String, Text, Date, Time, TIMESTAMP, ForeignKey, UniqueConstraint
 from sqlalchemy.orm import sessionmaker, declarative_base, relationship
-from sqlalchemy.sql import func, text
+from sqlalchemy.sql import func, text, literal_column
+from tracing import start_span, end_span, traced
+from migrations import migrate
+from occurrences import OccurrenceCache, OccurrenceStore
 
 Base = declarative_base()
 
@@ -50,22 +57,99 @@ class schedule(Base):
     
     item = relationship('item', backref='schedules')
 
+class occurrence(Base):
+    __tablename__ = 'occurrence'
+    
+    occurrence_id = Column(Integer, primary_key=True, autoincrement=True)
+    item_id = Column(Integer, ForeignKey('item.item_id'), nullable=False)
+    schedule_id = Column(Integer, ForeignKey('schedule.schedule_id'), nullable=False)
+    occurrence_start = Column(String, nullable=False)  # "YYYY-MM-DD HH:MM:SS"
+    occurrence_end = Column(String, nullable=False)
+
+RECURRENCE_PATTERNS = ("DAILY", "WEEKLY", "BIWEEKLY", "MONTHLY")
+
+# item metadata stored with every vector document and usable as a search filter, as sql expressions
+# on the item table. start_month is the "YYYY-MM" bucket of the earliest scheduled start
+ITEM_METADATA = {
+    "item_type": "item.item_type",
+    "item_status": "item.item_status",
+    "start_month": "(SELECT strftime('%Y-%m', MIN(schedule.start_date)) FROM schedule WHERE schedule.item_id = item.item_id)",
+}
+
+def apply_pragmas(engine, pragmas):
+    """Set the given sqlite pragmas, e.g. the sqlite section of config.yaml, on every new connection of the engine."""
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
 # Define the SQLDBOperator class
 class SQLDBOperator:
-    def __init__(self):
-        self.config = self.load_config('config.yaml')
+    def __init__(self, config=None):
+        self.config = config if config is not None else self.load_config('config.yaml')
         db_config = self.config['database']
         sqlite_url = f"sqlite:///{db_config['name']}.db"  # SQLite connection string
-        self.engine = create_engine(sqlite_url)
+        # the engine is shared by all Gradio worker threads, pooled connections may move between threads
+        self.engine = create_engine(sqlite_url, connect_args={"check_same_thread": False})
         self.Session = sessionmaker(bind=self.engine)
+        # async engine on the same database for the async request path, queries never block the event loop
+        self.async_engine = create_async_engine(f"sqlite+aiosqlite:///{db_config['name']}.db")
+        self.AsyncSession = async_sessionmaker(bind=self.async_engine, expire_on_commit=False)
+        self.calendars = threading.local()
+        # occurrences of the schedule rows, materialized over a rolling horizon. windows outside of it
+        # expand the recurring items on the fly, cached per (item, window)
+        self.occurrence_store = OccurrenceStore(**self.config.get('occurrence_table', {}))
+        self.occurrences = OccurrenceCache(**self.config.get('occurrence_cache', {}))
+        self.occurrence_lock = threading.Lock()
+        for engine in (self.engine, self.async_engine.sync_engine):
+            apply_pragmas(engine, self.config.get('sqlite', {}))
+            self.trace_queries(engine)
 
         logging.basicConfig(filename=self.config['paths']['logging_file'], level=logging.INFO)
+        self.schema_version = migrate(self.engine)
+        self.sync_occurrences()
 
     def load_config(self, file_path):
         with open(file_path, 'r') as file:
             config = yaml.safe_load(file)
         return config
     
+    def sync_occurrences(self):
+        """Bring the occurrence table up to date with today's horizon and any unapplied schedule changes.
+
+        Readers call this before every time frame search, a write transaction is only opened when a
+        read-only check finds a new day or queued changes, which writers normally apply themselves.
+        """
+        if self.schema_version < 5:
+            return
+        with self.engine.connect() as connection:
+            stale = self.occurrence_store.is_stale(connection)
+        if stale:
+            # one syncing thread per process, the others wait and find nothing left to do
+            with self.occurrence_lock, self.engine.begin() as connection:
+                horizon = self.occurrence_store.sync(connection)
+            self.occurrence_store.horizon = horizon
+        else:
+            self.occurrence_store.horizon = self.occurrence_store.target()
+
+    async def async_occurrences(self):
+        if self.schema_version < 5:
+            return
+        async with self.async_engine.connect() as connection:
+            stale = await connection.run_sync(self.occurrence_store.is_stale)
+        if stale:
+            # rare (a new day or writes from generated sql), sync on a thread to share the lock with sync_occurrences
+            await asyncio.to_thread(self.sync_occurrences)
+        else:
+            self.occurrence_store.horizon = self.occurrence_store.target()
+
+    def refresh_occurrences(self, session):
+        """Regenerate the occurrences of the items changed in the session's transaction, before it commits."""
+        if self.schema_version >= 5:
+            self.occurrence_store.refresh(session.connection())
+
     def get_schema(self, table_name):
         """Get the schema of the specified table."""
         inspector = inspect(self.engine)
@@ -84,19 +168,91 @@ class SQLDBOperator:
         inspector = inspect(self.engine)
         return inspector.get_table_names()
     
-    def create_recurrence(self, data):
-        new_recurrence = recurrence(
-            recurrence_pattern=data['recurrence_pattern'],
-            recurrence_rule=data['recurrence_rule']
-        )
-        session = self.Session()
-        session.add(new_recurrence)
-        session.flush()  # get recurrence_id
-        session.commit()
-        return new_recurrence
+    def trace_queries(self, engine):
+        """Record every SQL statement executed by the engine as a span."""
+        @event.listens_for(engine, "before_cursor_execute")
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            context._trace = start_span("sql.query", statement=" ".join(statement.split())[:200], executemany=executemany)
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            current, token = context._trace
+            current.set(rowcount=cursor.rowcount)
+            end_span(current, token)
+
+        @event.listens_for(engine, "handle_error")
+        def handle_error(exception_context):
+            context = exception_context.execution_context
+            if context is not None and hasattr(context, "_trace"):
+                current, token = context._trace
+                end_span(current, token, error=exception_context.original_exception)
+    
+    def build_match_query(self, query, match_all=False):
+        """Turn free text into an FTS5 MATCH expression of quoted terms."""
+        stop_words = {"a", "an", "the", "me", "my", "i", "to", "of", "for", "on", "in", "at", "and", "or",
+                      "is", "are", "show", "what", "can", "you", "please", "all", "with"}
+        terms = [term for term in re.findall(r"\w+", query.lower()) if term not in stop_words]
+        if not terms:
+            return None
+        return (" AND " if match_all else " OR ").join(f'"{term}"' for term in terms)
+    
+    def build_filter_conditions(self, filter):
+        """Turn a metadata filter ({key: value or list of values}) into sql conditions on item and their parameters."""
+        conditions, params = [], {}
+        for key, values in (filter or {}).items():
+            values = values if isinstance(values, (list, tuple, set)) else [values]
+            names = [f"{key}_{i}" for i in range(len(values))]
+            conditions.append(f"{ITEM_METADATA[key]} IN ({', '.join(':' + name for name in names)})")
+            params.update(zip(names, values))
+        return conditions, params
+    
+    def build_keyword_query(self, query, k=None, match_all=False, filter=None):
+        """Return the bm25 ranking statement and its parameters, or None if the query has no terms."""
+        match = self.build_match_query(query, match_all)
+        if not match:
+            return None
+        conditions, params = self.build_filter_conditions(filter)
+        if conditions:
+            sql = ("SELECT item_fts.rowid, bm25(item_fts) AS score FROM item_fts JOIN item ON item.item_id = item_fts.rowid "
+                   f"WHERE item_fts MATCH :match AND {' AND '.join(conditions)} ORDER BY score")
+        else:
+            sql = "SELECT rowid, bm25(item_fts) AS score FROM item_fts WHERE item_fts MATCH :match ORDER BY score"
+        params["match"] = match
+        if k:
+            sql += " LIMIT :k"
+            params["k"] = k
+        return text(sql), params
+    
+    @traced("sql.keyword_search")
+    def keyword_search(self, query, k=None, match_all=False, filter=None):
+        """Return (item_id, bm25 score) pairs ranked best first, lower bm25 is better."""
+        statement = self.build_keyword_query(query, k, match_all, filter)
+        if statement is None:
+            return []
+        with self.engine.connect() as connection:
+            try:
+                return [(row[0], row[1]) for row in connection.execute(*statement)]
+            except Exception as e:
+                logging.error(f"Error in keyword search: {str(e)}")
+                return []
+    
+    @traced("sql.keyword_search")
+    async def akeyword_search(self, query, k=None, match_all=False, filter=None):
+        statement = self.build_keyword_query(query, k, match_all, filter)
+        if statement is None:
+            return []
+        async with self.async_engine.connect() as connection:
+            try:
+                return [(row[0], row[1]) for row in await connection.execute(*statement)]
+            except Exception as e:
+                logging.error(f"Error in keyword search: {str(e)}")
+                return []
     
     def parse_date_time(self, date_time_string):
-        cal = pdt.Calendar()
+        # building a Calendar compiles its regexes, keep one per thread
+        cal = getattr(self.calendars, "calendar", None)
+        if cal is None:
+            cal = self.calendars.calendar = pdt.Calendar()
         now = datetime.now()
         try:
             return cal.parseDT(date_time_string, now)[0]
@@ -104,6 +260,9 @@ class SQLDBOperator:
             logging.error(f"Error parsing date/time: {str(e)}")
             return None
     
+    def get_search_window(self, search_time_frame):
+        return tuple(self.get_time_frame(self.parse_date_time(search_time_frame)))
+
     def get_time_frame(self, dt):
         dt = dt.date()
         now = datetime.now().date()
@@ -112,123 +271,311 @@ class SQLDBOperator:
         else:
             return [dt, now]        
 
+    def recurrence_key(self, data):
+        if not data.get('recurrence_pattern') or data.get('recurrence_rule') is None:
+            return None
+        return data['recurrence_pattern'], int(data['recurrence_rule'])
+
+    def item_values(self, data, recurrence_id=None):
+        return {
+            "title": data['content'],
+            "content": data['content'],
+            "item_type": 'EVENT' if data.get('start_date') else 'NOTE',
+            "recurrence_id": recurrence_id,
+        }
+
+    def schedule_values(self, item_id, data, parse=None):
+        """Schedule row of an event, missing end and time values default to the start."""
+        parse = parse or self.parse_date_time
+        start = parse(data['start_date'])
+        start_time = parse(data['start_time']).time() if data.get('start_time') else start.time()
+        end_date = parse(data['end_date']).date() if data.get('end_date') else start.date()
+        end_time = parse(data['end_time']).time() if data.get('end_time') else start_time
+        return {
+            "item_id": item_id,
+            "start_date": start.date(),
+            "start_time": start_time,
+            "end_date": end_date,
+            "end_time": end_time,
+        }
+
+    def validate_record(self, data, parse):
+        """Raise ValueError or TypeError if a parsed intent cannot be written as an item."""
+        if not isinstance(data, dict):
+            raise TypeError(f"expected the item info as a dict, got {type(data).__name__}")
+        if not data.get('content'):
+            raise ValueError("missing content")
+        key = self.recurrence_key(data)
+        if key is not None and key[0] not in RECURRENCE_PATTERNS:
+            raise ValueError(f"unknown recurrence pattern: {key[0]}")
+        if data.get('start_date'):
+            for col in ('start_date', 'start_time', 'end_date', 'end_time'):
+                if data.get(col) and parse(data[col]) is None:
+                    raise ValueError(f"unreadable {col}: {data[col]}")
+
+    def write_items(self, connection, records):
+        """Insert recurrences, items and schedules for a list of parsed intents on one connection.
+
+        Every record is validated first and invalid ones are skipped, so one malformed intent does
+        not roll back the others. Recurrences are upserted, items are inserted in one executemany
+        with RETURNING, and schedules in one executemany. Returns the rows written to the item table
+        with their ids, and {index in records: error message} of the skipped records.
+        """
+        # imported calendars repeat the same date and time strings, parse each one once
+        parsed = {}
+        def parse(value):
+            if value not in parsed:
+                parsed[value] = self.parse_date_time(value)
+            return parsed[value]
+        errors = {}
+        for i, data in enumerate(records):
+            try:
+                self.validate_record(data, parse)
+            except (ValueError, TypeError) as e:
+                errors[i] = str(e)
+        records = [data for i, data in enumerate(records) if i not in errors]
+        if not records:
+            return [], errors
+
+        pairs = {self.recurrence_key(data) for data in records} - {None}
+        recurrence_ids = {}
+        if pairs:
+            connection.execute(
+                sqlite_insert(recurrence).on_conflict_do_nothing(),
+                [{"recurrence_pattern": pattern, "recurrence_rule": rule} for pattern, rule in pairs]
+            )
+            rows = connection.execute(
+                select(recurrence.recurrence_id, recurrence.recurrence_pattern, recurrence.recurrence_rule)
+                .where(recurrence.recurrence_pattern.in_({pattern for pattern, _ in pairs}))
+            )
+            recurrence_ids = {(pattern, rule): recurrence_id for recurrence_id, pattern, rule in rows}
+        
+        item_rows = [self.item_values(data, recurrence_ids.get(self.recurrence_key(data))) for data in records]
+        item_ids = connection.execute(
+            insert(item).returning(item.item_id, sort_by_parameter_order=True), item_rows
+        ).scalars().all()
+        
+        schedule_rows = [self.schedule_values(item_id, data, parse) for item_id, data in zip(item_ids, records) if data.get('start_date')]
+        if schedule_rows:
+            connection.execute(insert(schedule), schedule_rows)
+            if self.schema_version >= 5:
+                self.occurrence_store.refresh(connection)
+        return [{"item_id": item_id, **row} for item_id, row in zip(item_ids, item_rows)], errors
+
+    def creation_response(self, items, errors):
+        message = f"Created items with IDs: {[row['item_id'] for row in items]}"
+        if errors:
+            logging.warning(f"Skipped invalid records: {errors}")
+            message += f", skipped invalid records: {errors}"
+        return {"status": 1 if items or not errors else 0, "items": items, "errors": errors, "message": message}
+
+    @traced("sql.create_items")
+    def create_items(self, records):
+        """Create items from a list of parsed intents in one transaction.
+
+        The response carries the new item_id, title and content of every item under "items",
+        and {index in records: error message} of the records that were skipped as invalid
+        under "errors". The status is 0 only if no record could be written.
+        """
+        try:
+            with self.engine.begin() as connection:
+                items, errors = self.write_items(connection, records) if records else ([], {})
+            return self.creation_response(items, errors)
+        except Exception as e:
+            logging.error(f"Error creating items: {str(e)}")
+            return {"status": 0, "items": [], "errors": {}, "message": str(e)}
+
+    @traced("sql.create_items")
+    async def acreate_items(self, records):
+        try:
+            async with self.async_engine.begin() as connection:
+                items, errors = await connection.run_sync(self.write_items, records) if records else ([], {})
+            return self.creation_response(items, errors)
+        except Exception as e:
+            logging.error(f"Error creating items: {str(e)}")
+            return {"status": 0, "items": [], "errors": {}, "message": str(e)}
+
     def create_item(self, data):
-        # get the recurrence pattern and rule if they exist
-        recurrence_obj = None
-        if data['recurrence_pattern']:
-            recurrence_obj = self.Session.query(recurrence).filter_by(
-                recurrence_pattern=data['recurrence_pattern'],
-                recurrence_rule=data['recurrence_rule']
-            ).first()
-            if not recurrence_obj:
-                recurrence_obj = self.create_recurrence(data)
+        """Create a single item, see create_items."""
+        return self.create_items([data])
+    
+    ITEM_COLUMNS = [
+        'item_id', 'title', 'content', 'item_status',
+        'start_date', 'start_time', 'end_date', 'end_time',
+        'recurrence_pattern', 'recurrence_rule'
+    ]
+    
+    def build_items_query(self, item_id=None, content_ids=None, start_date=None, start_time=None, end_date=None, end_time=None,
+                          recurrence_pattern=None, recurrence_rule=None, search_time_frame=None):
+        """Build the get_items statement, content is matched through the ids found by the FTS index.
+
+        A search_time_frame within the materialized horizon reads the occurrence table, one row per occurrence.
+        Items without a recurrence are kept by the outer join on recurrence.
+        """
+        window = self.get_search_window(search_time_frame) if search_time_frame else None
+        materialized = window is not None and self.occurrence_store.covers(*window)
+        if materialized:
+            query = select(
+                item.item_id, item.title, item.content, item.item_status,
+                occurrence.occurrence_start, occurrence.occurrence_end,
+                recurrence.recurrence_pattern, recurrence.recurrence_rule
+            ).select_from(occurrence).join(item, occurrence.item_id == item.item_id) \
+                .outerjoin(recurrence, item.recurrence_id == recurrence.recurrence_id)
+            if start_date or start_time or end_date or end_time:
+                query = query.join(schedule, occurrence.schedule_id == schedule.schedule_id)
+        else:
+            # Exclude created_at and updated_at columns
+            query = select(
+                item.item_id, item.title, item.content, item.item_status,
+                schedule.start_date, schedule.start_time, schedule.end_date, schedule.end_time,
+                recurrence.recurrence_pattern, recurrence.recurrence_rule
+            ).select_from(item).join(schedule).outerjoin(recurrence)
         
-        recurrence_id = recurrence_obj.recurrence_id if recurrence_obj else None
-        item_type = 'EVENT' if data['start_date'] else 'NOTE'
+        if item_id:
+            if isinstance(item_id, list):
+                query = query.filter(item.item_id.in_(item_id))
+            else:
+                query = query.filter(item.item_id == item_id)
         
-        new_item = item(
-            title=data['content'],
-            content=data['content'],
-            item_type=item_type,
-            recurrence_id=recurrence_id
-        )
-        session = self.Session()
-        session.add(new_item)
-        session.flush()  # get item_id
+        if content_ids is not None:
+            query = query.filter(item.item_id.in_(content_ids))
         
-        if item_type == 'EVENT':
-            self.create_schedule(new_item.item_id, data)
+        if start_date:
+            start_date = self.parse_date_time(start_date).date()
+            query = query.filter(schedule.start_date == start_date)
         
-        session.commit()
-        return new_item
-
-    def create_schedule(self, item_id, data):
-        start_date = self.parse_date_time(data['start_date'])
-        start_time = self.parse_date_time(data['start_time']) if data['start_time'] else None
-        end_date = self.parse_date_time(data['end_date']) if data['end_date'] else None
-        end_time = self.parse_date_time(data['end_time']) if data['end_time'] else None
+        if start_time:
+            start_time = self.parse_date_time(start_time).time()
+            query = query.filter(schedule.start_time == start_time)
         
-        new_schedule = schedule(
-            item_id=item_id,
-            start_date=start_date,
-            start_time=start_time,
-            end_date=end_date,
-            end_time=end_time
-        )
-        session = self.Session()
-        session.add(new_schedule)
-        session.commit()
+        if end_date:
+            end_date = self.parse_date_time(end_date).date()
+            query = query.filter(schedule.end_date == end_date)
+        
+        if end_time:
+            end_time = self.parse_date_time(end_time).time()
+            query = query.filter(schedule.end_time == end_time)
+        
+        if recurrence_pattern:
+            query = query.filter(recurrence.recurrence_pattern == recurrence_pattern)
+        
+        if recurrence_rule:
+            query = query.filter(recurrence.recurrence_rule == recurrence_rule)
         
-        return new_schedule
+        if materialized:
+            # range scan of idx_occurrence_start, which is already in this order
+            start_date, end_date = window
+            query = query.filter(occurrence.occurrence_start >= start_date.isoformat(),
+                                 occurrence.occurrence_start < (end_date + timedelta(days=1)).isoformat()) \
+                .order_by(occurrence.occurrence_start, occurrence.item_id)
+        elif window:
+            start_date, end_date = window
+            # recurring items that started before the window ends may occur in it, expand_items picks the occurrences
+            query = query.filter(schedule.start_date <= end_date,
+                                 or_(schedule.start_date >= start_date, item.recurrence_id.isnot(None)))
+        return query
+
+    def occurrence_row(self, record):
+        """get_items row from the occurrence query, which has the start and end timestamps instead of the schedule columns."""
+        item_id, title, content, item_status, start, end, recurrence_pattern, recurrence_rule = record
+        # timestamps of schedule rows without a time are just the date, their time stays None
+        start_at, end_at = datetime.fromisoformat(start), datetime.fromisoformat(end)
+        return dict(zip(self.ITEM_COLUMNS, (item_id, title, content, item_status,
+                                            start_at.date(), start_at.time() if len(start) > 10 else None,
+                                            end_at.date(), end_at.time() if len(end) > 10 else None,
+                                            recurrence_pattern, recurrence_rule)))
+
+    def expand_items(self, result, search_time_frame=None):
+        """Rows of a get_items result as dicts, with one row per occurrence in the search window ordered by start."""
+        if 'occurrence_start' in result.keys():
+            # read from the occurrence table, already one row per occurrence
+            return [self.occurrence_row(record) for record in result.all()]
+        data = [dict(zip(self.ITEM_COLUMNS, record)) for record in result.all()]
+        if not search_time_frame:
+            return data
+        data = self.occurrences.expand_rows(data, *self.get_search_window(search_time_frame))
+        data.sort(key=lambda row: (row['start_date'], row['start_time'], row['item_id']))
+        return data
     
+    @traced("sql.get_items")
     def get_items(self, item_id=None, content=None, start_date=None, start_time=None, end_date=None, end_time=None,
                   recurrence_pattern=None, recurrence_rule=None, search_time_frame=None):
         """Retrieve items based on the specified criteria."""
-        session = self.Session()
-        query = session.query(item).join(schedule).join(recurrence)
+        try:
+            if search_time_frame:
+                self.sync_occurrences()
+            # indexed full-text match instead of a LIKE scan
+            content_ids = [record[0] for record in self.keyword_search(content, match_all=True)] if content else None
+            query = self.build_items_query(item_id, content_ids, start_date, start_time, end_date, end_time,
+                                           recurrence_pattern, recurrence_rule, search_time_frame)
+            with self.engine.connect() as connection:
+                data = self.expand_items(connection.execute(query), search_time_frame)
+            return {"status": 1, "data": data}
         
+        except Exception as e:
+            logging.error(f"Error retrieving items: {str(e)}")
+            return {"status": 0, "message": str(e)}
+    
+    @traced("sql.get_items")
+    async def aget_items(self, item_id=None, content=None, start_date=None, start_time=None, end_date=None, end_time=None,
+                         recurrence_pattern=None, recurrence_rule=None, search_time_frame=None):
         try:
-            if item_id:
-                if isinstance(item_id, list):
-                    query = query.filter(item.item_id.in_(item_id))
-                else:
-                    query = query.filter(item.item_id == item_id)
-            
-            if content:
-                query = query.filter(item.content.like(f"%{content}%"))
-            
-            if start_date:
-                start_date = self.parse_date_time(start_date).date()
-                query = query.filter(schedule.start_date == start_date)
-            
-            if start_time:
-                start_time = self.parse_date_time(start_time).time()
-                query = query.filter(schedule.start_time == start_time)
-            
-            if end_date:
-                end_date = self.parse_date_time(end_date).date()
-                query = query.filter(schedule.end_date == end_date)
-            
-            if end_time:
-                end_time = self.parse_date_time(end_time).time()
-                query = query.filter(schedule.end_time == end_time)
-            
-            if recurrence_pattern:
-                query = query.filter(recurrence.recurrence_pattern == recurrence_pattern)
-            
-            if recurrence_rule:
-                query = query.filter(recurrence.recurrence_rule == recurrence_rule)
-            
             if search_time_frame:
-                start_date, end_date = self.get_time_frame(self.parse_date_time(search_time_frame))
-                query = query.filter(schedule.start_date >= start_date, schedule.start_date <= end_date)
-            
-            # Exclude created_at and updated_at columns
-            query = query.with_entities(
-                item.item_id, item.title, item.content, item.item_status,
-                schedule.start_date, schedule.start_time, schedule.end_date, schedule.end_time,
-                recurrence.recurrence_pattern, recurrence.recurrence_rule
-            )
-            
-            result = query.all()
-            columns = [
-                'item_id', 'title', 'content', 'item_status',
-                'start_date', 'start_time', 'end_date', 'end_time',
-                'recurrence_pattern', 'recurrence_rule'
-            ]
-            
-            return {"status": 1, "data": [dict(zip(columns, record)) for record in result]}
+                await self.async_occurrences()
+            content_ids = [record[0] for record in await self.akeyword_search(content, match_all=True)] if content else None
+            query = self.build_items_query(item_id, content_ids, start_date, start_time, end_date, end_time,
+                                           recurrence_pattern, recurrence_rule, search_time_frame)
+            async with self.async_engine.connect() as connection:
+                result = await connection.execute(query)
+            return {"status": 1, "data": self.expand_items(result, search_time_frame)}
         
         except Exception as e:
             logging.error(f"Error retrieving items: {str(e)}")
             return {"status": 0, "message": str(e)}
     
+    def build_item_texts_query(self):
+        """Select the item text and the ITEM_METADATA columns the vector documents are built from."""
+        return select(
+            item.item_id, item.title, item.content,
+            *[literal_column(expression).label(key) for key, expression in ITEM_METADATA.items()]
+        )
+
+    def iter_item_texts(self, batch_size=500, after_id=0):
+        """Yield pages of {item_id, title, content, <metadata>} in item_id order, starting after after_id.
+
+        Keyset pagination on the primary key: every page is a short range query on its own
+        connection, so memory stays flat and writers are not blocked between pages.
+        """
+        while True:
+            with self.engine.connect() as connection:
+                rows = connection.execute(
+                    self.build_item_texts_query().where(item.item_id > after_id).order_by(item.item_id).limit(batch_size)
+                ).mappings().all()
+            if not rows:
+                return
+            yield [dict(row) for row in rows]
+            after_id = rows[-1]["item_id"]
+
+    def get_item_texts(self, item_ids):
+        """Return {item_id, title, content, <metadata>} of the given items, ids that no longer exist are left out."""
+        rows = []
+        # query in chunks to stay below the SQLite bound parameter limit
+        with self.engine.connect() as connection:
+            for i in range(0, len(item_ids), 500):
+                rows += connection.execute(
+                    self.build_item_texts_query().where(item.item_id.in_(item_ids[i:i + 500]))
+                ).mappings().all()
+        return [dict(row) for row in rows]
+
+    @traced("sql.delete_items")
     def delete_items(self, item_ids):
         """Delete items from the database."""
         session = self.Session()
         try:
             session.query(item).filter(item.item_id.in_(item_ids)).delete(synchronize_session=False)
+            self.refresh_occurrences(session)
             session.commit()
+            self.occurrences.invalidate(item_ids)
             return {"status": 1, "message": f"Deleted items with IDs: {item_ids}"}
         except Exception as e:
             session.rollback()
@@ -236,12 +583,15 @@ class SQLDBOperator:
         finally:
             session.close()
             
+    @traced("sql.update_items")
     def update_items(self, item_ids, updates):
         """Update items in the database."""
         session = self.Session()
         try:
             session.query(item).filter(item.item_id.in_(item_ids)).update(updates, synchronize_session=False)
+            self.refresh_occurrences(session)
             session.commit()
+            self.occurrences.invalidate(item_ids)
             return {"status": 1, "message": f"Updated items with IDs: {item_ids}"}
         except Exception as e:
             session.rollback()
@@ -249,6 +599,32 @@ class SQLDBOperator:
         finally:
             session.close()
             
+    @traced("sql.delete_items")
+    async def adelete_items(self, item_ids):
+        async with self.AsyncSession() as session:
+            try:
+                await session.execute(delete(item).where(item.item_id.in_(item_ids)).execution_options(synchronize_session=False))
+                await session.run_sync(self.refresh_occurrences)
+                await session.commit()
+                self.occurrences.invalidate(item_ids)
+                return {"status": 1, "message": f"Deleted items with IDs: {item_ids}"}
+            except Exception as e:
+                await session.rollback()
+                return {"status": 0, "message": str(e)}
+    
+    @traced("sql.update_items")
+    async def aupdate_items(self, item_ids, updates):
+        async with self.AsyncSession() as session:
+            try:
+                await session.execute(update(item).where(item.item_id.in_(item_ids)).values(updates).execution_options(synchronize_session=False))
+                await session.run_sync(self.refresh_occurrences)
+                await session.commit()
+                self.occurrences.invalidate(item_ids)
+                return {"status": 1, "message": f"Updated items with IDs: {item_ids}"}
+            except Exception as e:
+                await session.rollback()
+                return {"status": 0, "message": str(e)}
+            
     def object_as_dict(self, obj):
         """Convert a SQLAlchemy object to a dictionary."""
         return {c.key: getattr(obj, c.key) for c in obj.__table__.columns}
@@ -269,6 +645,9 @@ class SQLDBOperator:
         with self.engine.connect() as connection:
             try:
                 result = connection.execute(text(sql))
+                if operation_type != "search":
+                    # generated sql may change any schedule or recurrence row
+                    self.occurrences.invalidate()
                 if operation_type == "search":
                     column = result.keys()
                     row = result.fetchall()
@@ -291,6 +670,16 @@ if __name__ == '__main__':
     items = sql_operator.get_items(content='meeting', search_time_frame='next week')
     print(items)
     
+    # test create_items
+    records = [
+        {'content': 'weekly team sync', 'start_date': 'next monday', 'start_time': '10 am', 'end_date': None, 'end_time': '11 am',
+         'recurrence_pattern': 'WEEKLY', 'recurrence_rule': 1},
+        {'content': 'groceries list', 'start_date': None, 'start_time': None, 'end_date': None, 'end_time': None,
+         'recurrence_pattern': None, 'recurrence_rule': None},
+    ]
+    result = sql_operator.create_items(records)
+    print(result)
+    
     # test delete_items
     item_ids = [1, 2, 3]
     result = sql_operator.delete_items(item_ids)
@@ -0,0 +1,26 @@
+import copy
+import yaml
+import pytest
+from bench.datasets import build_dataset
+from bench.fakes import FakeEmbeddings
+
+with open("config.yaml", 'r') as file:
+    CONFIG = yaml.safe_load(file)
+
+@pytest.fixture
+def config(tmp_path):
+    """config.yaml with every database, index and log path moved into a temporary directory."""
+    config = copy.deepcopy(CONFIG)
+    config['database']['name'] = str(tmp_path / "items")
+    for key, path in config['paths'].items():
+        config['paths'][key] = str(tmp_path / path)
+    return config
+
+@pytest.fixture
+def embeddings():
+    return FakeEmbeddings(dim=16)
+
+@pytest.fixture
+def items_db(config):
+    """A small synthetic item database at the configured database path."""
+    return build_dataset(config['database']['name'] + ".db", 50, seed=1)
@@ -0,0 +1,25 @@
+import pytest
+from admission import AdmissionController, ServerBusy
+
+def test_clients_of_one_model_share_its_limiter(config):
+    admission = AdmissionController(config)
+    intent, chat = admission.limiter(config['intent_llm_model']), admission.limiter(config['chat_llm_model'])
+    assert intent is chat and intent.max_concurrency == config['admission']['limits'][config['chat_llm_model']]
+    assert admission.limiter(config['embed_model']) is not intent
+    assert admission.limiter("mistral").max_concurrency == config['admission']['default_limit']
+    assert set(admission.stats()) == {config['chat_llm_model'], config['embed_model'], "mistral"}
+
+def test_disabled_admission_has_no_limiters(config):
+    config['admission']['enabled'] = False
+    admission = AdmissionController(config)
+    assert admission.limiter(config['chat_llm_model']) is None
+    admission.check()
+
+def test_full_queue_sheds_new_turns(config):
+    config['admission'].update(limits={"llama3.1": 1}, max_queue=0)
+    admission = AdmissionController(config)
+    limiter = admission.limiter("llama3.1")
+    limiter.acquire()
+    with pytest.raises(ServerBusy):
+        limiter.acquire()
+    assert limiter.stats()["shed"] == 1
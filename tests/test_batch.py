@@ -0,0 +1,62 @@
+import pytest
+import sys
+from types import SimpleNamespace
+from batch import BatchRunner
+from sqldb import SQLDBOperator
+from vectordb import VectorDBOperator
+
+def test_batch_does_not_build_the_gradio_interface():
+    assert "main" not in sys.modules and "gradio" not in sys.modules
+
+def test_invalid_create_fails_alone(config, items_db):
+    runner = BatchRunner(SimpleNamespace(db_operator=SQLDBOperator(config)), workers=1)
+    records = [{"info": info, "timings": {}} for info in (
+        {"content": "call the plumber", "start_date": "tomorrow", "start_time": "9 am"},
+        {"content": "gym", "start_date": "monday", "recurrence_pattern": "WEEKLY", "recurrence_rule": "mondays"},
+        {"content": "packing list", "start_date": None},
+    )]
+    runner.run_creates(records)
+    assert [record["sql_response"]["status"] for record in records] == [1, 0, 1]
+    assert "mondays" in records[1]["sql_response"]["message"]
+    assert records[2]["sql_response"]["message"].startswith("Created item with ID:")
+
+def test_writes_are_skipped_unless_applied(config, items_db):
+    db_operator = SQLDBOperator(config)
+    runner = BatchRunner(SimpleNamespace(db_operator=db_operator), workers=1)
+    records = [{"operation_type": operation_type, "task_type": "note", "info": {"content": "packing list"},
+                "relevant_ids": ["1"], "timings": {}} for operation_type in ("create", "delete")]
+    runner.run_database(records)
+    assert all("skipped" in record["sql_response"]["message"] for record in records)
+    assert db_operator.get_item_texts([1])
+
+class FlakyRecognizer:
+    def get_intents(self, query):
+        query.strip()
+        return None, None, None
+
+class FlakyChat:
+    def generate_response(self, query, operation_type, task_type, sql_response):
+        if query == "busy":
+            raise RuntimeError("server busy")
+        return f"re: {query}"
+
+def test_failed_records_keep_their_error_and_the_rest_finish(config, items_db):
+    runner = BatchRunner(SimpleNamespace(recognizer=FlakyRecognizer(), chat_llm=FlakyChat()), workers=2)
+    # a malformed line without a query fails in the intent stage
+    records = runner.run([{"id": i, "query": query} for i, query in enumerate(["hello", None, "busy", "bye"])])
+    assert [record.get("response") for record in records] == ["re: hello", None, None, "re: bye"]
+    assert records[1]["error"].startswith("intent:") and "server busy" in records[2]["error"]
+    assert "error" not in records[0] and "error" not in records[3]
+
+@pytest.mark.parametrize("mode", ["vector", "hybrid"])
+def test_queries_are_embedded_once_without_the_embedding_cache(config, embeddings, items_db, mode):
+    config['embedding_cache']['enabled'] = False
+    config['retrieval']['mode'] = mode
+    db_operator = SQLDBOperator(config)
+    vector_db_operator = VectorDBOperator(db_operator, "faiss", config, embeddings=embeddings)
+    runner = BatchRunner(SimpleNamespace(vector_db_operator=vector_db_operator), workers=1)
+    records = [{"id": i, "query": query, "timings": {}} for i, query in enumerate(["team meeting", "packing list"])]
+    calls = embeddings.calls
+    runner.run_search(records)
+    assert embeddings.calls == calls + 1
+    assert all("error" not in record and record["relevant_ids"] is not None for record in records)
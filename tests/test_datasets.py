@@ -0,0 +1,13 @@
+from datetime import date, timedelta
+from bench.datasets import dataset_path, generate_rows
+
+def test_dates_are_relative_to_the_anchor():
+    monday, tuesday = date(2024, 3, 4), date(2024, 3, 5)
+    shift = lambda rows: [sched and date.fromisoformat(sched[1]) + timedelta(days=1) for _, sched in rows]
+    assert shift(generate_rows(20, seed=1, anchor=monday)) == \
+        [sched and date.fromisoformat(sched[1]) for _, sched in generate_rows(20, seed=1, anchor=tuesday)]
+
+def test_datasets_are_keyed_by_seed_and_day(tmp_path):
+    paths = {dataset_path(tmp_path, "1k", seed, anchor) for seed in (0, 1) for anchor in (date(2024, 3, 4), date(2024, 3, 5))}
+    assert len(paths) == 4
+    assert dataset_path(tmp_path, "1k") == dataset_path(tmp_path, "1k", 0, date.today())
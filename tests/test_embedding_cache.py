@@ -0,0 +1,28 @@
+import sqlite3
+import itertools
+import embedding_cache
+from embedding_cache import CachedEmbeddings
+
+def stored_keys(cache):
+    return {row[0] for row in cache.conn.execute("SELECT text_hash FROM embedding")}
+
+def test_stored_vectors_are_pruned_least_recently_used_first(tmp_path, embeddings, monkeypatch):
+    clock = itertools.count()
+    monkeypatch.setattr(embedding_cache.time, "time", lambda: next(clock))
+    cache = CachedEmbeddings(embeddings, "fake", str(tmp_path / "embeddings.db"), max_memory_entries=0, max_stored_entries=3)
+    cache.embed_documents(["a", "b", "c"])
+    # reading "a" back from SQLite makes "b" the least recently used
+    cache.embed_query("a")
+    cache.embed_documents(["d", "e"])
+    assert stored_keys(cache) == {cache.get_key(text) for text in ("a", "d", "e")}
+    assert cache.stats()["stored_entries"] == 3
+
+def test_caches_without_used_at_are_upgraded(tmp_path, embeddings):
+    path = str(tmp_path / "embeddings.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE embedding (model TEXT NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL, PRIMARY KEY (model, text_hash))")
+    conn.commit()
+    conn.close()
+    cache = CachedEmbeddings(embeddings, "fake", path)
+    assert cache.embed_query("a") == embeddings.embed("a")
+    assert cache.stats()["stored_entries"] == 1
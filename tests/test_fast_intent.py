@@ -0,0 +1,46 @@
+import pytest
+import fast_intent
+from fast_intent import RuleBasedIntent
+
+TIME_COLS = ["start_date", "start_time", "end_date", "end_time", "recurrence_pattern", "recurrence_rule", "search_time_frame"]
+MIN_CONFIDENCE = 0.8
+
+@pytest.fixture
+def fast_path():
+    return RuleBasedIntent(["schedule", "note"], ["create", "update", "delete", "search"], TIME_COLS)
+
+@pytest.mark.parametrize("query", [
+    "What's the weather today?",
+    "Tell me a joke tomorrow",
+    "What happened yesterday?",
+    "What time is it?",
+    "remind me to buy milk",
+])
+def test_queries_without_a_task_keyword_go_to_the_llm(fast_path, query):
+    assert fast_path.classify(query)[3] < MIN_CONFIDENCE
+
+@pytest.mark.parametrize("query, task_type, operation_type", [
+    ("show me my meetings next week", "schedule", "search"),
+    ("add a meeting with Sam tomorrow at 3pm", "schedule", "create"),
+    ("move my meeting to 4pm", "schedule", "update"),
+    ("delete the standup", "schedule", "delete"),
+    ("create a note buy eggs", "note", "create"),
+    ("find notes about budget", "note", "search"),
+])
+def test_stereotyped_queries_take_the_fast_path(fast_path, query, task_type, operation_type):
+    result = fast_path.classify(query)
+    assert result[:2] == (task_type, operation_type)
+    assert result[3] >= MIN_CONFIDENCE
+
+def test_search_keeps_the_time_frame(fast_path):
+    _, _, info, _ = fast_path.classify("show me my meetings next week")
+    assert info["search_time_frame"] == "next week"
+
+def test_calendar_is_built_once_per_thread(monkeypatch):
+    built = []
+    calendar = fast_intent.pdt.Calendar
+    monkeypatch.setattr(fast_intent.pdt, "Calendar", lambda: built.append(1) or calendar())
+    fast_path = RuleBasedIntent(["schedule", "note"], ["create", "update", "delete", "search"], TIME_COLS)
+    fast_path.classify("add a meeting tomorrow at 9 am")
+    fast_path.classify("delete the meeting on friday")
+    assert len(built) == 1
@@ -0,0 +1,67 @@
+from datetime import date, timedelta
+import intent_cache
+from intent_cache import IntentCache
+from intent import IntentRecognizer
+from bench.fakes import FakeLLM
+
+class SameVectorEmbeddings:
+    """Embeds every query to the same vector, so any two queries are similar."""
+
+    def embed_query(self, text):
+        return [1.0, 0.0, 0.0, 0.0]
+
+class Tomorrow(date):
+    @classmethod
+    def today(cls):
+        return date.today() + timedelta(days=1)
+
+DELETE_DENTIST = ("schedule", "delete", {"content": "dentist", "start_date": None})
+
+def test_relative_dates_are_bound_to_the_day(monkeypatch):
+    cache = IntentCache()
+    cache.put("what do I have tomorrow", ("schedule", "search", {"content": "plans", "search_time_frame": "tomorrow"}))
+    cache.put("delete the dentist appointment", DELETE_DENTIST)
+    assert cache.get_exact("What do I have tomorrow?") is not None
+
+    monkeypatch.setattr(intent_cache, "date", Tomorrow)
+    assert cache.get_exact("what do I have tomorrow") is None
+    assert cache.get_exact("delete the dentist appointment") == DELETE_DENTIST
+
+def test_day_binding_also_looks_at_the_extracted_info():
+    cache = IntentCache()
+    assert cache.is_day_bound("add the dentist", ("schedule", "create", {"start_date": "next friday"}))
+    assert not cache.is_day_bound("add the dentist", ("schedule", "create", {"start_date": "2024-05-03"}))
+
+def test_semantic_hit_returns_only_the_labels():
+    cache = IntentCache(embeddings=SameVectorEmbeddings())
+    cache.put("delete the dentist appointment", DELETE_DENTIST)
+    assert cache.get_similar("delete the gym session") == ("schedule", "delete")
+    assert cache.stats()["semantic_hits"] == 1
+
+def test_semantic_hit_needs_the_same_operation_verbs():
+    cache = IntentCache(embeddings=SameVectorEmbeddings())
+    cache.put("delete the dentist appointment tomorrow", DELETE_DENTIST)
+    assert cache.get_similar("add the dentist appointment tomorrow") is None
+    assert cache.get_similar("the dentist appointment tomorrow") is None
+    assert cache.stats()["semantic_hits"] == 0
+
+    # without any verbs only a chat result is reused
+    cache = IntentCache(embeddings=SameVectorEmbeddings())
+    cache.put("how are you doing", (None, None, None))
+    assert cache.get_similar("how are you") == (None, None)
+
+def test_exact_hits_hand_out_copies():
+    cache = IntentCache()
+    cache.put("delete the dentist appointment", DELETE_DENTIST)
+    cache.get_exact("delete the dentist appointment")[2]["content"] = "changed"
+    assert cache.get_exact("delete the dentist appointment") == DELETE_DENTIST
+
+def test_intent_reextracts_info_on_a_semantic_hit(config):
+    config['intent_fast_path']['enabled'] = False
+    recognizer = IntentRecognizer(config, llm=FakeLLM(), json_llm=FakeLLM(), embeddings=SameVectorEmbeddings())
+    assert recognizer.get_intents("remove the budget meeting")[2]["content"] == "remove the budget meeting"
+
+    task_type, operation_type, info = recognizer.get_intents("remove the design meeting")
+    assert recognizer.cache.stats()["semantic_hits"] == 1
+    assert (task_type, operation_type) == ("schedule", "delete")
+    assert info["content"] == "remove the design meeting"
@@ -0,0 +1,48 @@
+import asyncio
+import threading
+import pytest
+from intent import IntentRecognizer
+from bench.fakes import FakeLLM
+
+OPS = {"create", "delete", "update", "search"}
+
+class ScriptedChain:
+    """Answers the samples in order, an exception in the script is raised instead."""
+
+    def __init__(self, *answers):
+        self.answers = list(answers)
+        self.lock = threading.Lock()
+
+    def next_answer(self):
+        with self.lock:
+            answer = self.answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    def invoke(self, inputs):
+        return self.next_answer()
+
+    async def ainvoke(self, inputs):
+        return self.next_answer()
+
+@pytest.fixture
+def recognizer(config):
+    config['intent_voting'] = {"mode": "vote", "samples": 3, "max_workers": 1}
+    return IntentRecognizer(config, llm=FakeLLM(), json_llm=FakeLLM())
+
+@pytest.mark.parametrize("answers, expected", [
+    (("create", TimeoutError("read timed out"), "create"), "create"),
+    ((TimeoutError("read timed out"), "maybe", "delete"), None),
+    (("maybe", "delete", "delete"), "delete"),
+    (("maybe", "create", "delete"), None),
+    ((RuntimeError("server busy"), "create", "delete"), None),
+])
+def test_vote(recognizer, answers, expected):
+    assert recognizer.vote_valid_answer(ScriptedChain(*answers), "query", OPS) == expected
+    assert asyncio.run(recognizer.avote_valid_answer(ScriptedChain(*answers), "query", OPS)) == expected
+
+def test_pick_answer_ignores_unparseable_votes(recognizer):
+    assert recognizer.pick_answer({None: 2, "create": 1}) == "create"
+    assert recognizer.pick_answer({"create": 1, "delete": 1}) is None
+    assert recognizer.pick_answer({None: 3}) is None
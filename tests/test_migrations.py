@@ -0,0 +1,41 @@
+from sqlalchemy import create_engine
+from migrations import MIGRATIONS, migrate, get_version
+from bench.datasets import build_dataset
+
+def schema(engine):
+    with engine.connect() as connection:
+        return connection.exec_driver_sql("SELECT type, name, sql FROM sqlite_master ORDER BY type, name").all()
+
+def test_migrate_twice_is_a_no_op(items_db):
+    engine = create_engine(f"sqlite:///{items_db}")
+    latest = MIGRATIONS[-1][0]
+    assert migrate(engine) == latest
+    migrated = schema(engine)
+    assert migrate(engine) == latest
+    assert schema(engine) == migrated
+
+def test_statements_can_be_repeated(items_db):
+    engine = create_engine(f"sqlite:///{items_db}")
+    migrate(engine)
+    migrated = schema(engine)
+    # as after an interrupted run that applied the statements but not the version
+    with engine.begin() as connection:
+        connection.exec_driver_sql("PRAGMA user_version = 0")
+    assert migrate(engine) == MIGRATIONS[-1][0]
+    assert schema(engine) == migrated
+    with engine.begin() as connection:
+        assert get_version(connection) == MIGRATIONS[-1][0]
+        connection.exec_driver_sql("INSERT INTO item_fts(item_fts) VALUES ('integrity-check')")
+        fts_rows = connection.exec_driver_sql("SELECT COUNT(*) FROM item_fts WHERE item_fts MATCH 'notes'").scalar()
+        assert fts_rows == connection.exec_driver_sql("SELECT COUNT(*) FROM item").scalar()
+
+def test_migrate_stepwise_matches_migrate_all(tmp_path, items_db):
+    stepwise = create_engine(f"sqlite:///{items_db}")
+    for number, _, _ in MIGRATIONS:
+        assert migrate(stepwise, target=number) == number
+    at_once = create_engine(f"sqlite:///{build_dataset(str(tmp_path / 'at_once.db'), 50, seed=1)}")
+    migrate(at_once)
+    assert schema(stepwise) == schema(at_once)
+
+def test_database_without_items_is_left_alone(tmp_path):
+    assert migrate(create_engine(f"sqlite:///{tmp_path / 'empty.db'}")) == 0
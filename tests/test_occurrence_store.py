@@ -0,0 +1,80 @@
+from datetime import date, time, timedelta
+import pytest
+from sqlalchemy import create_engine
+from occurrences import OccurrenceStore
+from sqldb import SQLDBOperator
+
+def occurrence_rows(connection):
+    return connection.exec_driver_sql(
+        "SELECT item_id, schedule_id, occurrence_start, occurrence_end FROM occurrence ORDER BY schedule_id, occurrence_start"
+    ).all()
+
+def test_rolled_horizon_matches_a_full_rebuild(config, items_db):
+    db_operator = SQLDBOperator(config)
+    store = db_operator.occurrence_store
+    tomorrow = date.today() + timedelta(days=1)
+    with db_operator.engine.begin() as connection:
+        # only the day that enters the horizon is generated, the day that leaves it is dropped
+        store.roll(connection, today=tomorrow)
+        rolled = occurrence_rows(connection)
+        connection.exec_driver_sql("DELETE FROM occurrence_horizon")
+        store.roll(connection, today=tomorrow)
+        assert occurrence_rows(connection) == rolled
+        start, end = store.target(tomorrow)
+        assert min(row[2] for row in rolled) >= start.isoformat()
+        assert max(row[2] for row in rolled) < (end + timedelta(days=1)).isoformat()
+
+def test_windows_past_the_horizon_edge_expand_the_same_occurrences(config, items_db):
+    materialized = SQLDBOperator(config)
+    window = materialized.get_search_window("in 30 days")
+    assert materialized.occurrence_store.covers(*window)
+    key = lambda row: (row["start_date"], row["start_time"], row["item_id"])
+    rows = materialized.get_items(search_time_frame="in 30 days")["data"]
+    assert rows and rows == sorted(rows, key=key)
+
+    # the same window reaches past a horizon of 3 days
+    config['occurrence_table'] = {"past_days": 0, "horizon_days": 3}
+    expanded = SQLDBOperator(config)
+    assert not expanded.occurrence_store.covers(*window)
+    assert rows == sorted(expanded.get_items(search_time_frame="in 30 days")["data"], key=key)
+
+def test_reads_only_sync_when_something_changed(config, items_db, monkeypatch):
+    db_operator = SQLDBOperator(config)
+    synced = []
+    sync = db_operator.occurrence_store.sync
+    monkeypatch.setattr(db_operator.occurrence_store, "sync", lambda connection: synced.append(1) or sync(connection))
+    assert db_operator.get_items(search_time_frame="in 7 days")["status"] == 1
+    assert synced == []
+
+    # a write that did not refresh the occurrences itself, like generated sql
+    with db_operator.engine.begin() as connection:
+        item_id = connection.exec_driver_sql("SELECT item_id FROM schedule LIMIT 1").scalar()
+        connection.exec_driver_sql("UPDATE schedule SET start_date = ?, end_date = ? WHERE item_id = ?",
+                                   ((date.today() + timedelta(days=2)).isoformat(),) * 2 + (item_id,))
+    rows = db_operator.get_items(item_id=item_id, search_time_frame="in 7 days")["data"]
+    assert synced == [1]
+    assert date.today() + timedelta(days=2) in {row["start_date"] for row in rows}
+
+SCHEMA = [
+    "CREATE TABLE recurrence (recurrence_id INTEGER PRIMARY KEY, recurrence_pattern TEXT, recurrence_rule INTEGER)",
+    "CREATE TABLE item (item_id INTEGER PRIMARY KEY, recurrence_id INTEGER)",
+    "CREATE TABLE schedule (schedule_id INTEGER PRIMARY KEY, item_id INTEGER, start_date DATE, start_time TIME, end_date DATE, end_time TIME)",
+    "CREATE TABLE occurrence (occurrence_id INTEGER PRIMARY KEY, item_id INTEGER, schedule_id INTEGER, occurrence_start TEXT, occurrence_end TEXT)",
+    "CREATE TABLE occurrence_dirty (item_id INTEGER PRIMARY KEY)",
+]
+
+def test_schedule_rows_without_times(config, items_db):
+    engine = create_engine("sqlite://")
+    with engine.begin() as connection:
+        for statement in SCHEMA:
+            connection.exec_driver_sql(statement)
+        connection.exec_driver_sql("INSERT INTO recurrence VALUES (1, 'DAILY', 1)")
+        connection.exec_driver_sql("INSERT INTO item VALUES (1, 1), (2, NULL)")
+        connection.exec_driver_sql("INSERT INTO schedule VALUES (1, 1, '2024-03-01', NULL, NULL, NULL), "
+                                   "(2, 2, '2024-03-02', '09:30:00.000000', '2024-03-02', NULL)")
+        OccurrenceStore().generate(connection, date(2024, 3, 1), date(2024, 3, 2))
+        rows = occurrence_rows(connection)
+    assert rows == [(1, 1, "2024-03-01", "2024-03-01"), (1, 1, "2024-03-02", "2024-03-02"), (2, 2, "2024-03-02 09:30:00", "2024-03-02")]
+
+    row = SQLDBOperator(config).occurrence_row((2, "t", "c", "ACTIVE", rows[2][2], rows[2][3], None, None))
+    assert (row["start_date"], row["start_time"], row["end_date"], row["end_time"]) == (date(2024, 3, 2), time(9, 30), date(2024, 3, 2), None)
@@ -0,0 +1,48 @@
+import calendar
+import random
+from datetime import date, timedelta
+import pytest
+from occurrences import expand
+
+def reference(pattern, rule, anchor, window_start, window_end):
+    """Occurrence dates of one schedule row, one day at a time."""
+    dates = []
+    day = anchor
+    while day <= window_end:
+        if pattern == "DAILY":
+            match = (day - anchor).days % max(rule, 1) == 0
+        elif pattern in ("WEEKLY", "BIWEEKLY"):
+            first = anchor + timedelta(days=(rule - 1 - anchor.weekday()) % 7)
+            match = day >= first and (day - first).days % (7 if pattern == "WEEKLY" else 14) == 0
+        elif pattern == "MONTHLY":
+            match = day.day == min(rule, calendar.monthrange(day.year, day.month)[1])
+        else:
+            match = day == anchor
+        if match and day >= window_start:
+            dates.append(day)
+        day += timedelta(days=1)
+    return dates
+
+def test_expand_matches_day_by_day_reference():
+    rng = random.Random(7)
+    recurrences = [(None, None), ("DAILY", 1), ("DAILY", 3), ("WEEKLY", 1), ("WEEKLY", 7), ("BIWEEKLY", 4),
+                   ("MONTHLY", 1), ("MONTHLY", 15), ("MONTHLY", 31)]
+    rows = [(*rng.choice(recurrences), date(2024, 1, 1) + timedelta(days=rng.randint(0, 400))) for _ in range(300)]
+    window_start, window_end = date(2024, 6, 1), date(2024, 9, 30)
+    index, dates = expand(*zip(*rows), window_start, window_end)
+    for i, (pattern, rule, anchor) in enumerate(rows):
+        expected = reference(pattern, rule, anchor, window_start, window_end)
+        assert dates[index == i].astype(object).tolist() == expected, (pattern, rule, anchor)
+
+@pytest.mark.parametrize("pattern, rule, expected", [
+    ("MONTHLY", 31, [date(2024, 1, 31), date(2024, 2, 29), date(2024, 3, 31)]),
+    ("MONTHLY", 30, [date(2024, 1, 30), date(2024, 2, 29), date(2024, 3, 30)]),
+    ("WEEKLY", 5, [date(2024, 1, 5) + timedelta(weeks=k) for k in range(13)]),
+])
+def test_month_ends_and_weekdays(pattern, rule, expected):
+    _, dates = expand([pattern], [rule], [date(2024, 1, 1)], date(2024, 1, 1), date(2024, 3, 31))
+    assert dates.astype(object).tolist() == expected
+
+def test_window_before_the_anchor_is_empty():
+    index, _ = expand(["DAILY", None], [1, None], [date(2024, 5, 1)] * 2, date(2024, 1, 1), date(2024, 4, 30))
+    assert len(index) == 0
@@ -0,0 +1,35 @@
+import pytest
+from datetime import date, timedelta
+from sqldb import SQLDBOperator
+
+def test_invalid_records_do_not_roll_back_the_batch(config, items_db):
+    db_operator = SQLDBOperator(config)
+    records = [
+        {"content": "weekly team sync", "start_date": "next monday", "start_time": "10 am", "end_time": "11 am",
+         "recurrence_pattern": "WEEKLY", "recurrence_rule": 1},
+        None,
+        {"content": "yoga", "start_date": "tomorrow", "recurrence_pattern": "WEEKLY", "recurrence_rule": "often"},
+        {"content": "", "start_date": None},
+        {"content": "groceries list", "start_date": None},
+    ]
+    response = db_operator.create_items(records)
+    assert response["status"] == 1
+    assert sorted(response["errors"]) == [1, 2, 3]
+    assert [row["content"] for row in response["items"]] == ["weekly team sync", "groceries list"]
+    created = db_operator.get_item_texts([row["item_id"] for row in response["items"]])
+    assert sorted(row["content"] for row in created) == ["groceries list", "weekly team sync"]
+
+def test_all_invalid_records_fail(config, items_db):
+    response = SQLDBOperator(config).create_items([{"content": None}])
+    assert response["status"] == 0 and response["items"] == [] and 0 in response["errors"]
+
+@pytest.mark.parametrize("horizon_days", [365, 3])
+def test_week_view_finds_a_one_off_event(config, items_db, horizon_days):
+    # the 3 day horizon does not cover the week, its items are expanded on the fly
+    config['occurrence_table'] = {"past_days": 0, "horizon_days": horizon_days}
+    db_operator = SQLDBOperator(config)
+    response = db_operator.create_items([{"content": "dentist appointment", "start_date": "in 5 days", "start_time": "9 am"}])
+    item_id = response["items"][0]["item_id"]
+    rows = [row for row in db_operator.get_items(search_time_frame="in 7 days")["data"] if row["item_id"] == item_id]
+    assert len(rows) == 1
+    assert rows[0]["start_date"] == date.today() + timedelta(days=5) and rows[0]["recurrence_pattern"] is None
@@ -0,0 +1,63 @@
+import json
+import asyncio
+import pytest
+import tracing
+from tracing import JSONLExporter, Span, traced, span
+
+class ListExporter:
+    def __init__(self):
+        self.spans = []
+
+    def export(self, span):
+        self.spans.append(span)
+
+@pytest.fixture
+def exported(monkeypatch):
+    exporter = ListExporter()
+    monkeypatch.setattr(tracing, "_exporter", exporter)
+    return exporter.spans
+
+@traced("stream")
+def stream():
+    with span("child"):
+        yield 1
+    yield 2
+
+@traced("astream")
+async def astream():
+    yield 1
+    yield 2
+
+def test_closed_generator_ends_its_span(exported):
+    generator = stream()
+    assert next(generator) == 1
+    generator.close()
+    assert [s.name for s in exported] == ["child", "stream"]
+    assert all(s.duration is not None and s.status == "OK" for s in exported)
+    assert exported[0].parent_id == exported[1].span_id
+
+def test_closed_async_generator_ends_its_span(exported):
+    async def consume():
+        generator = astream()
+        assert await generator.__anext__() == 1
+        await generator.aclose()
+    asyncio.run(consume())
+    assert [s.name for s in exported] == ["astream"] and exported[0].duration is not None
+
+def test_span_duration_is_monotonic(monkeypatch):
+    current = Span("wall clock jump")
+    # a wall clock step backwards does not affect the duration
+    monkeypatch.setattr(tracing.time, "time_ns", lambda: 0)
+    current.end()
+    assert current.duration >= 0 and current.end_ns >= current.start_ns
+
+def test_exporter_buffers_until_flushed(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    exporter = JSONLExporter(str(path), flush_interval=3600)
+    for name in ("a", "b"):
+        current = Span(name)
+        current.end()
+        exporter.export(current)
+    assert path.read_text() == ""
+    exporter.close()
+    assert [json.loads(line)["name"] for line in path.read_text().splitlines()] == ["a", "b"]
@@ -0,0 +1,80 @@
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import event
+from sqldb import SQLDBOperator
+from vectordb import VectorDBOperator
+from vector_sync import VectorSync
+
+def open_stores(config, embeddings):
+    db_operator = SQLDBOperator(config)
+    vector_db_operator = VectorDBOperator(db_operator, "faiss", config, embeddings=embeddings)
+    return db_operator, vector_db_operator, VectorSync(db_operator, vector_db_operator, config)
+
+def test_synced_update_survives_reload(config, embeddings, items_db):
+    db_operator, vector_db_operator, sync = open_stores(config, embeddings)
+    sync.drain()
+    db_operator.update_items([3], {"title": "Dentist", "content": "moved to friday"})
+    assert sync.drain() == 1
+    assert sync.lag()[0] == 0
+
+    # the changelog rows are gone, the update has to come back from the index snapshot and its log
+    _, reloaded, _ = open_stores(config, embeddings)
+    doc = reloaded.vector_db.get_doc("3")
+    assert doc.page_content == "Dentist moved to friday"
+    vector = reloaded.vector_db.faiss_db.index.reconstruct(reloaded.vector_db.get_positions()["3"])
+    np.testing.assert_allclose(vector, embeddings.embed("Dentist moved to friday"), atol=1e-6)
+
+def test_synced_delete_survives_reload(config, embeddings, items_db):
+    db_operator, _, sync = open_stores(config, embeddings)
+    sync.drain()
+    db_operator.delete_items([4])
+    sync.drain()
+
+    _, reloaded, _ = open_stores(config, embeddings)
+    assert reloaded.vector_db.get_doc("4") is None
+    assert len(reloaded.vector_db.get_positions()) == 49
+
+def test_lazy_docstore_reads_search_results_in_one_query(config, embeddings, items_db):
+    db_operator, vector_db_operator, sync = open_stores(config, embeddings)
+    sync.drain()
+    vector_db_operator.vector_db.compact()
+
+    _, reloaded, _ = open_stores(config, embeddings)
+    statements = []
+    event.listen(reloaded.sql_operator.engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    docs = reloaded.vector_db.get_by_ids(["1", "2", "3", "999"])
+    found = reloaded.vector_db.search_documents("meeting", k=5, score_type="distance")
+    assert len(statements) == 2
+    # flat indexes are read into memory despite faiss_storage.mmap and need no copy before writes
+    assert not reloaded.vector_db.mmapped
+    assert docs[3] is None and docs[0].page_content.endswith("#1")
+    assert len(found) == 5 and all(doc.page_content for doc, _ in found)
+
+def test_search_embeds_the_query_outside_the_lock(config, embeddings, items_db, monkeypatch):
+    _, vector_db_operator, sync = open_stores(config, embeddings)
+    sync.drain()
+    free = []
+    embed_query = vector_db_operator.embeddings.embed_query
+    def try_lock():
+        if vector_db_operator.lock.acquire(timeout=0):
+            vector_db_operator.lock.release()
+            return True
+        return False
+    def probe(query):
+        # a writer in another thread can take the lock while the query is embedded
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            free.append(executor.submit(try_lock).result())
+        return embed_query(query)
+    monkeypatch.setattr(vector_db_operator.embeddings, "embed_query", probe)
+    vector_db_operator.search("meeting")
+    assert free == [True]
+
+def test_update_reembeds_from_the_item_table(config, embeddings, items_db):
+    db_operator, vector_db_operator, sync = open_stores(config, embeddings)
+    sync.drain()
+    db_operator.update_items([3], {"title": "Dentist", "content": "moved to friday"})
+    vector_db_operator.update(["3"])
+    assert vector_db_operator.vector_db.get_doc("3").page_content == "Dentist moved to friday"
+    # the changelog entry of the same change leaves the same document
+    sync.drain()
+    assert vector_db_operator.vector_db.get_doc("3").page_content == "Dentist moved to friday"
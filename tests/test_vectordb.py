@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from vectordb import FAISSVectorDB
+
+def open_db(config, embeddings, index_type="flat"):
+    config['faiss_index']['type'] = index_type
+    return FAISSVectorDB(embeddings, config)
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw"])
+def test_replay_keeps_updated_document(config, embeddings, index_type):
+    vector_db = open_db(config, embeddings, index_type)
+    vector_db.add_documents([Document(id="1", page_content="dentist at 9 am"), Document(id="2", page_content="buy milk")])
+    vector_db.compact()
+    # replaces the document in the snapshot, only the mutation log has the new text
+    vector_db.add_documents([Document(id="1", page_content="dentist moved to 11 am")])
+
+    reloaded = open_db(config, embeddings, index_type)
+    assert reloaded.get_doc("1").page_content == "dentist moved to 11 am"
+    docs_and_scores = reloaded.search_documents_by_vector(embeddings.embed("dentist moved to 11 am"), k=2, score_type="distance")
+    assert [doc.page_content for doc, _ in docs_and_scores] == ["dentist moved to 11 am", "buy milk"]
+    assert docs_and_scores[0][1] == pytest.approx(0.0, abs=1e-5)
+
+def test_hnsw_delete_leaves_tombstones_until_compaction(config, embeddings):
+    vector_db = open_db(config, embeddings, "hnsw")
+    vector_db.add_documents([Document(id=str(i), page_content=f"note {i}", metadata={"item_status": "ACTIVE"}) for i in range(20)])
+    vector_db.delete_documents(["3", "7", "11"])
+    assert vector_db.faiss_db.index.ntotal == 20
+
+    for filter in (None, {"item_status": "ACTIVE"}):
+        found = vector_db.search_documents_by_vector(embeddings.embed("note 3"), k=20, filter=filter, score_type="distance")
+        assert sorted(doc.page_content for doc, _ in found) == sorted(f"note {i}" for i in range(20) if i not in (3, 7, 11))
+
+    vector_db.compact()
+    assert vector_db.faiss_db.index.ntotal == 17
+    assert not vector_db.tombstones
+    found = vector_db.search_documents_by_vector(embeddings.embed("note 12"), k=1, score_type="distance")
+    assert found[0][0].page_content == "note 12"
+
+    # deletes after the snapshot are replayed as tombstones
+    vector_db.delete_documents(["12"])
+    reloaded = open_db(config, embeddings, "hnsw")
+    assert reloaded.get_doc("12") is None
+    found = reloaded.search_documents_by_vector(embeddings.embed("note 12"), k=20, score_type="distance")
+    assert "note 12" not in {doc.page_content for doc, _ in found} and len(found) == 16
@@ -2,31 +2,27 @@ import os
 import logging
 import yaml
 import re
-from langchain_ollama.llms import OllamaLLM
 from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_core.prompts import ChatPromptTemplate
 from sqldb import SQLDBOperator
 from vectordb import VectorDBOperator
-
-os.environ["LANGCHAIN_TRACING_V2"] = "false"
-logging.basicConfig(level=logging.INFO)
+from ollama_client import get_ollama_clients
+from tracing import span, TokenUsageHandler
 
 class TextToSQL:
-    def __init__(self, input_query, operation_type=None, task_type=None):
-        self.config = self.load_config('config.yaml')
-        self.db_manager = SQLDBOperator()
-        self.llm = OllamaLLM(model=self.config['text2sql_llm_model'], temperature=0.6)
-        self.input_query = input_query
-        self.operation_type = operation_type
-        self.task_type = task_type
-        self.setup_prompt()
+    def __init__(self, config=None, llm=None, db_manager=None):
+        # config, llm and db_manager can be injected so one converter is shared by all chat turns
+        self.config = config if config is not None else self.load_config('config.yaml')
+        self.db_manager = db_manager if db_manager is not None else SQLDBOperator(config=self.config)
+        self.llm = llm if llm is not None else get_ollama_clients(self.config).llm(self.config['text2sql_llm_model'], temperature=0.6, callbacks=[TokenUsageHandler()])
+        self.chains = {}
 
     def load_config(self, config_file):
         with open(config_file, 'r') as file:
             return yaml.safe_load(file)
     
-    def get_db_schema(self):
-        if self.task_type == "memo":
+    def get_db_schema(self, task_type):
+        if task_type == "memo":
             return """
             CREATE TABLE `memo` (
                     memo_id INT AUTO_INCREMENT PRIMARY KEY,
@@ -36,7 +32,7 @@ class TextToSQL:
                     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP -- Timestamp when record is updated
                 );
             """
-        elif self.task_type == "schedule":
+        elif task_type == "schedule":
             return """
             CREATE TABLE `event` (
                 event_id INT AUTO_INCREMENT PRIMARY KEY,               -- Unique identifier for the event
@@ -60,7 +56,7 @@ class TextToSQL:
             );
             """
     
-    def setup_prompt(self):
+    def setup_prompt(self, operation_type, task_type):
         
         sql_keywords = {
             "create": "INSERT",
@@ -68,17 +64,17 @@ class TextToSQL:
             "update": "UPDATE",
             "search": "SELECT"
         }
-        db_schema = self.get_db_schema()
-        clause_type = sql_keywords[self.operation_type]
+        db_schema = self.get_db_schema(task_type)
+        clause_type = sql_keywords[operation_type]
         sys_prompt = f"""You are a SQL expert, convert the user query to {clause_type} SQL clause statement, given the following database schema:{db_schema}"""
         
-        if self.task_type == "memo":
+        if task_type == "memo":
             human_prompt = """
                 User Query: {user_query}.
                 No preamble and explanation. Just the SQL.
                 SQL statement:
                 """
-        elif self.task_type == "schedule":
+        elif task_type == "schedule":
             human_prompt = """
                 ### Instructions:
                 You should operate on two tables: `event` and `schedule`. Include columns as much as possible.
@@ -88,11 +84,19 @@ class TextToSQL:
                 """
                 
         messages = [("system", sys_prompt), ("human", human_prompt)]
-        self.prompt = ChatPromptTemplate.from_messages(messages)
-        self.chain = self.prompt | self.llm
-
-    def convert_to_sql(self):
-        response = self.chain.invoke({"user_query":self.input_query})
+        prompt = ChatPromptTemplate.from_messages(messages)
+        return prompt | self.llm
+    
+    def get_chain(self, operation_type, task_type):
+        # prompts only depend on the operation and task, build each one once
+        key = (operation_type, task_type)
+        if key not in self.chains:
+            self.chains[key] = self.setup_prompt(operation_type, task_type)
+        return self.chains[key]
+
+    def convert_to_sql(self, input_query, operation_type, task_type):
+        with span("llm.text2sql", operation_type=operation_type, task_type=task_type):
+            response = self.get_chain(operation_type, task_type).invoke({"user_query": input_query})
         return self.extract_sql(response)
     
     def extract_sql(self, sql_text):
@@ -105,6 +109,9 @@ class TextToSQL:
             return sql_statements[0] 
 
 if __name__ == "__main__":
+    os.environ["LANGCHAIN_TRACING_V2"] = "false"
+    logging.basicConfig(level=logging.INFO)
+    
     # example 1
     # input_query = "i will have a meeting tomorrow 3 pm with my team, add to schedule"
     # operation_type = "create"
@@ -115,8 +122,8 @@ if __name__ == "__main__":
     operation_type = "search"
     task_type = "schedule"
     
-    converter = TextToSQL(input_query, operation_type, task_type)
-    sql_statement = converter.convert_to_sql()
+    converter = TextToSQL()
+    sql_statement = converter.convert_to_sql(input_query, operation_type, task_type)
     print(sql_statement)
 
     
@@ -132,7 +139,7 @@ if __name__ == "__main__":
 #         with open(config_file, 'r') as file:
 #             return yaml.safe_load(file)
         
-#     def setup_prompt(self):
+#     def setup_prompt(self, operation_type, task_type):
         
 #         sys_prompt = """You are a SQL query generator. Given the following database schema:{schema}"""
 
@@ -0,0 +1,279 @@
+import os
+import sys
+import json
+import time
+import uuid
+import atexit
+import inspect
+import logging
+import threading
+import contextvars
+from functools import wraps
+from contextlib import contextmanager
+from langchain_core.callbacks import BaseCallbackHandler
+
+# the span of the code that is currently running, children attach to it
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+_exporter = None
+
+class Span:
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = dict(attributes or {})
+        self.status = "OK"
+        # wall clock time only stamps the span, durations come from the monotonic counter
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.start_perf_ns = time.perf_counter_ns()
+        self.end_perf_ns = None
+
+    @property
+    def duration(self):
+        """Duration in seconds, None while the span is open."""
+        return (self.end_perf_ns - self.start_perf_ns) / 1e9 if self.end_perf_ns else None
+
+    def end(self):
+        self.end_perf_ns = time.perf_counter_ns()
+        self.end_ns = self.start_ns + self.end_perf_ns - self.start_perf_ns
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add(self, key, value):
+        """Accumulate a numeric attribute, e.g. token counts over several calls."""
+        self.attributes[key] = self.attributes.get(key, 0) + value
+
+    def to_dict(self):
+        # field names follow the OpenTelemetry span JSON encoding
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "durationSeconds": self.duration,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+class JSONLExporter:
+    """Append finished spans to a JSONL file, one span per line.
+
+    Spans are buffered in memory and written by a background thread every flush_interval
+    seconds, so the request path never waits for the file. close flushes what is left.
+    """
+
+    def __init__(self, path, flush_interval=1.0):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.file = open(path, 'a')
+        self.flush_interval = flush_interval
+        self.buffer = []
+        self.lock = threading.Lock()
+        # one writer at a time, flush may also be called from other threads
+        self.file_lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="trace-export", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def export(self, span):
+        with self.lock:
+            self.buffer.append(span)
+
+    def run(self):
+        while not self.stopping.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                logging.exception(f"Writing spans to {self.path} failed")
+
+    def flush(self):
+        with self.lock:
+            spans, self.buffer = self.buffer, []
+        if not spans:
+            return
+        lines = "".join(json.dumps(span.to_dict(), default=str) + "\n" for span in spans)
+        with self.file_lock:
+            self.file.write(lines)
+            self.file.flush()
+
+    def close(self):
+        if self.stopping.is_set():
+            return
+        self.stopping.set()
+        self.thread.join()
+        self.flush()
+        self.file.close()
+        atexit.unregister(self.close)
+
+def configure(config):
+    """Set up span export from the tracing section of config.yaml."""
+    global _exporter
+    if _exporter is not None:
+        _exporter.close()
+    tracing_config = config.get('tracing', {})
+    if tracing_config.get('enabled', False):
+        _exporter = JSONLExporter(config['paths']['trace_file'], flush_interval=tracing_config.get('flush_interval', 1.0))
+    else:
+        _exporter = None
+
+def current_span():
+    return _current_span.get()
+
+def start_span(name, **attributes):
+    """Open a span as a child of the current one, returns the span and the token to restore the parent."""
+    span = Span(name, parent=_current_span.get(), attributes=attributes)
+    token = _current_span.set(span)
+    return span, token
+
+def end_span(span, token=None, error=None):
+    span.end()
+    if error is not None:
+        span.status = "ERROR"
+        span.set(error=repr(error))
+    if token is not None:
+        _current_span.reset(token)
+    logging.debug(f"{span.name} finished, time elapsed: {span.duration}")
+    if _exporter is not None:
+        _exporter.export(span)
+
+@contextmanager
+def span(name, **attributes):
+    current, token = start_span(name, **attributes)
+    try:
+        yield current
+    except GeneratorExit:
+        # a generator closed early by its consumer, not a failure
+        end_span(current, token)
+        raise
+    except BaseException as e:
+        end_span(current, token, error=e)
+        raise
+    end_span(current, token)
+
+def traced(name=None):
+    """Decorator that runs a function in a span, generators are traced until they are exhausted or closed."""
+    def decorator(func):
+        span_name = name or func.__name__
+        if inspect.isasyncgenfunction(func):
+            @wraps(func)
+            async def async_stream_wrapper(*args, **kwargs):
+                current = Span(span_name, parent=_current_span.get())
+                generator = func(*args, **kwargs)
+                error = None
+                try:
+                    while True:
+                        token = _current_span.set(current)
+                        try:
+                            value = await generator.__anext__()
+                        except StopAsyncIteration:
+                            break
+                        except BaseException as e:
+                            error = e
+                            raise
+                        finally:
+                            _current_span.reset(token)
+                        yield value
+                finally:
+                    # also reached when the consumer stops early and closes the stream
+                    await generator.aclose()
+                    end_span(current, error=error)
+            return async_stream_wrapper
+
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        if inspect.isgeneratorfunction(func):
+            @wraps(func)
+            def stream_wrapper(*args, **kwargs):
+                current = Span(span_name, parent=_current_span.get())
+                generator = func(*args, **kwargs)
+                error = None
+                try:
+                    while True:
+                        # the span is current only while the generator runs, it may be resumed from another context
+                        token = _current_span.set(current)
+                        try:
+                            value = next(generator)
+                        except StopIteration:
+                            break
+                        except BaseException as e:
+                            error = e
+                            raise
+                        finally:
+                            _current_span.reset(token)
+                        yield value
+                finally:
+                    # also reached when the consumer stops early and closes the stream
+                    generator.close()
+                    end_span(current, error=error)
+            return stream_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def submit(executor, func, *args, **kwargs):
+    """Submit to a thread pool, keeping the caller's span as the parent of spans opened by func."""
+    return executor.submit(contextvars.copy_context().run, func, *args, **kwargs)
+
+class TokenUsageHandler(BaseCallbackHandler):
+    """LangChain callback that adds Ollama token counts to the current span."""
+
+    def on_llm_end(self, response, **kwargs):
+        current = _current_span.get()
+        if current is None:
+            return
+        for generations in response.generations:
+            for generation in generations:
+                info = generation.generation_info or {}
+                current.add("prompt_tokens", info.get("prompt_eval_count") or 0)
+                current.add("completion_tokens", info.get("eval_count") or 0)
+        current.add("llm_calls", 1)
+
+def percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, int(round(q / 100 * (len(values) - 1)))))
+    return values[index]
+
+def summarize(trace_file):
+    """Aggregate exported spans into count and p50/p95/p99 durations per span name."""
+    durations = {}
+    with open(trace_file, 'r') as file:
+        for line in file:
+            if line.strip():
+                record = json.loads(line)
+                if record.get("durationSeconds") is not None:
+                    durations.setdefault(record["name"], []).append(record["durationSeconds"])
+    return {
+        name: {
+            "count": len(values),
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+        }
+        for name, values in sorted(durations.items())
+    }
+
+if __name__ == "__main__":
+    trace_file = sys.argv[1] if len(sys.argv) > 1 else "logs/traces.jsonl"
+    report = summarize(trace_file)
+    print(f"{'stage':<40} {'count':>7} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for name, stats in report.items():
+        print(f"{name:<40} {stats['count']:>7} {stats['p50']:>9.4f} {stats['p95']:>9.4f} {stats['p99']:>9.4f}")
@@ -0,0 +1,107 @@
+import time
+import logging
+import threading
+from sqlalchemy import event
+from sqlalchemy.sql import text
+from tracing import span
+from admission import BACKGROUND, set_priority
+
+class VectorSync:
+    """Background consumer of item_changelog that keeps the vector index in line with the item table.
+
+    Triggers record every item insert, text update and delete in item_changelog (see migrations.py),
+    so writers return as soon as SQL commits. The consumer wakes on every commit or after
+    poll_interval seconds, re-embeds a batch of changed items at once and deletes the changelog
+    entries it applied. Applying a change twice is harmless, a crash in between only repeats work.
+    """
+
+    def __init__(self, db_operator, vector_db_operator, config):
+        self.db_operator = db_operator
+        self.vector_db_operator = vector_db_operator
+        sync_config = config.get('vector_sync', {})
+        self.batch_size = sync_config.get('batch_size', 256)
+        self.poll_interval = sync_config.get('poll_interval', 2.0)
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        # one batch at a time, drain may also be called from other threads
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stats_counts = {"applied": 0, "batches": 0, "errors": 0}
+        self.last_batch_seconds = None
+        for engine in (db_operator.engine, db_operator.async_engine.sync_engine):
+            event.listen(engine, "commit", self.on_commit)
+            event.listen(engine, "checkin", self.on_checkin)
+
+    def on_commit(self, connection):
+        # the commit event fires before the transaction is committed, wake up once the connection is returned
+        connection.info["committed"] = True
+
+    def on_checkin(self, dbapi_connection, connection_record):
+        if connection_record.info.pop("committed", False):
+            self.wakeup.set()
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name="vector-sync", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def run(self):
+        # syncing is deferred work, interactive model calls go first
+        set_priority(BACKGROUND)
+        while not self.stopping.is_set():
+            self.wakeup.wait(self.poll_interval)
+            self.wakeup.clear()
+            try:
+                self.drain()
+            except Exception:
+                logging.exception("Applying item changes to the vector index failed")
+                self.stats_counts["errors"] += 1
+
+    def apply_batch(self):
+        """Apply the oldest batch of pending changes, returns the number of changelog entries consumed."""
+        with self.db_operator.engine.connect() as connection:
+            changes = connection.execute(
+                text("SELECT change_id, item_id, changed_at FROM item_changelog ORDER BY change_id LIMIT :limit"),
+                {"limit": self.batch_size}
+            ).all()
+        if not changes:
+            return 0
+        start_t = time.time()
+        # several changes to one item collapse into one re-read of its current row
+        item_ids = list(dict.fromkeys(item_id for _, item_id, _ in changes))
+        with span("vector.sync", changes=len(changes), items=len(item_ids), lag=start_t - changes[0][2]):
+            self.vector_db_operator.apply_changes(item_ids)
+            with self.db_operator.engine.begin() as connection:
+                connection.execute(text("DELETE FROM item_changelog WHERE change_id <= :last"), {"last": changes[-1][0]})
+        self.stats_counts["applied"] += len(changes)
+        self.stats_counts["batches"] += 1
+        self.last_batch_seconds = time.time() - start_t
+        return len(changes)
+
+    def drain(self):
+        """Apply pending changes until the changelog is empty, returns the number of entries consumed."""
+        consumed = 0
+        with self.lock:
+            while True:
+                count = self.apply_batch()
+                if not count:
+                    return consumed
+                consumed += count
+
+    def lag(self):
+        """Return (pending changelog entries, age in seconds of the oldest one)."""
+        with self.db_operator.engine.connect() as connection:
+            pending, oldest = connection.execute(text("SELECT COUNT(*), MIN(changed_at) FROM item_changelog")).one()
+        return pending, time.time() - oldest if oldest is not None else 0.0
+
+    def stats(self):
+        """Return the consumer counters and the current lag, without waiting for a running batch."""
+        pending, lag_seconds = self.lag()
+        return {**self.stats_counts, "pending": pending, "lag_seconds": lag_seconds, "last_batch_seconds": self.last_batch_seconds}
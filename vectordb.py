@@ -1,100 +1,691 @@
 import pandas as pd
 import yaml
 import os
+import copy
 import shutil
 import logging
-from langchain_ollama import OllamaEmbeddings
+import threading
+import asyncio
+import json
+import base64
+import uuid
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from langchain_core.documents import Document
+from langchain_community.docstore.base import Docstore, AddableMixin
 from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
-from sqldb import SQLDBOperator
+from sqlalchemy import select
+from sqldb import SQLDBOperator, item, ITEM_METADATA
+from embedding_cache import CachedEmbeddings
+from ollama_client import get_ollama_clients
+from tracing import span, traced, submit
+from admission import BACKGROUND, priority
 import faiss
+import numpy as np
 from langchain_chroma import Chroma
 
 class BaseVectorDB:
     def add_documents(self, docs: list[Document]):
         raise NotImplementedError
 
+    def add_embeddings(self, texts: list[str], vectors: list[list[float]], metadatas: list[dict], ids: list[str]):
+        """add_documents for texts that are already embedded, re-adding an id replaces the document."""
+        raise NotImplementedError
+
     def delete_documents(self, doc_ids: list[int]):
         raise NotImplementedError
     
+    def shadow(self, path: str, fresh: bool = True):
+        """A separate, empty store of the same kind to rebuild into, or the partial one of an interrupted rebuild."""
+        raise NotImplementedError
+    
+    def swap(self, shadow):
+        """Replace the contents of this store with a completed shadow store."""
+        raise NotImplementedError
+    
     def search_documents(self, query: str, k: int=5, filter: dict=None, score_type: str="relevance", score_threshold: float=None):
         raise NotImplementedError
     
+    def search_documents_by_vector(self, embedding: list[float], k: int=5, filter: dict=None, score_type: str="relevance", score_threshold: float=None):
+        """search_documents for a query that is already embedded."""
+        raise NotImplementedError
+    
+    def to_relevance(self, store, docs_and_scores, score_threshold=None):
+        """Convert store distances to relevance scores, as the similarity_search_with_relevance_scores methods do."""
+        relevance_score_fn = store._select_relevance_score_fn()
+        docs_and_scores = [(doc, relevance_score_fn(score)) for doc, score in docs_and_scores]
+        if score_threshold is not None:
+            docs_and_scores = [(doc, score) for doc, score in docs_and_scores if score >= score_threshold]
+        return docs_and_scores
+    
     def save(self):
         raise NotImplementedError
     
+    def compact(self):
+        """Write a full snapshot, stores without incremental persistence just save."""
+        return self.save()
+    
     def reset(self):
         raise NotImplementedError
 
 
+class MutationLog:
+    """Append-only JSONL log of vector index mutations (adds and tombstones)."""
+    
+    def __init__(self, path):
+        self.path = path
+        self.size = 0
+        if os.path.exists(path):
+            with open(path, 'r') as file:
+                self.size = sum(1 for _ in file)
+    
+    def append(self, entries: list[dict]):
+        if not entries:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, 'a') as file:
+            for entry in entries:
+                file.write(json.dumps(entry) + "\n")
+            file.flush()
+        self.size += len(entries)
+    
+    def read(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r') as file:
+            for line in file:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # a torn last line from an interrupted write, the mutation never completed
+                    logging.warning(f"Skipping unreadable entry in {self.path}")
+    
+    def truncate(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.size = 0
+    
+    @staticmethod
+    def encode_vector(vector):
+        return base64.b64encode(array("f", vector).tobytes()).decode("ascii")
+    
+    @staticmethod
+    def decode_vector(data):
+        return array("f", base64.b64decode(data)).tolist()
+
+
+class SQLDocstore(Docstore, AddableMixin):
+    """Docstore that keeps only metadata per vector and reads the item text lazily from SQL.
+    
+    Documents without an item_id in their metadata keep their text inline.
+    """
+    
+    def __init__(self, sql_operator: SQLDBOperator, entries: dict = None):
+        self.sql_operator = sql_operator
+        # doc id -> {"metadata": ...} (plus "page_content" for non-item documents)
+        self._dict = entries if entries is not None else {}
+    
+    def add(self, texts: dict[str, Document]):
+        for id, doc in texts.items():
+            entry = {"metadata": dict(doc.metadata)}
+            if "item_id" not in doc.metadata:
+                entry["page_content"] = doc.page_content
+            self._dict[id] = entry
+    
+    def delete(self, ids: list):
+        for id in ids:
+            self._dict.pop(id, None)
+    
+    def search(self, search: str):
+        doc = self.search_many([search])[0]
+        return doc if doc is not None else f"ID {search} not found."
+    
+    def search_many(self, ids: list):
+        """Return the documents of ids in order (None for unknown ids), reading their item text in one query."""
+        entries = [self._dict.get(id) for id in ids]
+        item_ids = list({entry["metadata"]["item_id"] for entry in entries if entry is not None and "page_content" not in entry})
+        page_contents = {}
+        with self.sql_operator.engine.connect() as connection:
+            # query in chunks to stay below the SQLite bound parameter limit
+            for i in range(0, len(item_ids), 500):
+                rows = connection.execute(
+                    select(item.item_id, item.title, item.content).where(item.item_id.in_(item_ids[i:i + 500]))
+                )
+                # same page content as VectorDBOperator.create_documents
+                page_contents.update({row.item_id: f"{row.title or ''} {row.content or ''}" for row in rows})
+        docs = []
+        for id, entry in zip(ids, entries):
+            if entry is None:
+                docs.append(None)
+            else:
+                page_content = entry["page_content"] if "page_content" in entry else page_contents.get(entry["metadata"]["item_id"], "")
+                docs.append(Document(id=id, page_content=page_content, metadata=entry["metadata"]))
+        return docs
+    
+    def save(self, path, index_to_docstore_id):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump({
+                "index_to_docstore_id": [index_to_docstore_id[i] for i in range(len(index_to_docstore_id))],
+                "docs": self._dict
+            }, file)
+        os.replace(tmp_path, path)
+    
+    @classmethod
+    def load(cls, path, sql_operator):
+        """Return the docstore and the index_to_docstore_id mapping stored at path."""
+        with open(path, 'r') as file:
+            data = json.load(file)
+        index_to_docstore_id = dict(enumerate(data["index_to_docstore_id"]))
+        return cls(sql_operator, data["docs"]), index_to_docstore_id
+
+
 class FAISSVectorDB(BaseVectorDB):
-    def __init__(self, embeddings, config):
+    def __init__(self, embeddings, config, sql_operator: SQLDBOperator = None):
         self.config = config
-        index = faiss.IndexFlatL2(len(embeddings.embed_query("hello world")))
         self.embeddings = embeddings
+        self.sql_operator = sql_operator
+        self.dim = len(embeddings.embed_query("hello world"))
+        
+        # on-disk format, see faiss_storage in config.yaml
+        storage_config = config.get('faiss_storage', {})
+        self.use_mmap = storage_config.get('mmap', False)
+        self.lazy_docstore = storage_config.get('lazy_docstore', False) and sql_operator is not None
+        self.mmapped = False
+        
+        # index type and tunables, see faiss_index in config.yaml
+        self.index_config = config.get('faiss_index', {})
+        self.index_type = self.index_config.get('type', 'flat')
+        nlist = self.index_config.get('nlist', 100)
+        self.min_train_size = self.index_config.get('min_train_size', max(39 * nlist, 256))
+        
         self.faiss_db = FAISS(
             embedding_function=embeddings,
-            index=index,
-            docstore=InMemoryDocstore(),
+            index=self.build_index(self.get_target_index_type(0)),
+            docstore=self.new_docstore(),
             index_to_docstore_id={}
         )
         # Load the faiss db if it exists
-        if os.path.exists(config['paths']['faiss_db']):
-            if "index.faiss" in os.listdir(config['paths']['faiss_db']):
-                self.faiss_db = self.faiss_db.load_local(config['paths']['faiss_db'], embeddings=embeddings, allow_dangerous_deserialization=True)
+        self.load()
+        self.build_filter_index()
+        
+        # mutations since the last snapshot are kept in a log and replayed on load
+        self.compact_every = config.get('faiss_log', {}).get('compact_every', 1000)
+        self.mutation_log = MutationLog(os.path.join(config['paths']['faiss_db'], "mutations.log"))
+        self.replay(self.mutation_log.read())
+        
+        # rebuild transparently if the configured index type changed since the snapshot
+        if self.sync_index_type():
+            self.compact()
+        self.configure_search()
+    
+    def new_docstore(self):
+        return SQLDocstore(self.sql_operator) if self.lazy_docstore else InMemoryDocstore()
+    
+    def load(self):
+        """Load the latest snapshot, either the compact format or a langchain save_local one."""
+        path = self.config['paths']['faiss_db']
+        index_file = os.path.join(path, "index.faiss")
+        docstore_file = os.path.join(path, "docstore.json")
+        if not os.path.exists(index_file):
+            return
+        
+        if os.path.exists(docstore_file) and self.sql_operator is not None:
+            docstore, index_to_docstore_id = SQLDocstore.load(docstore_file, self.sql_operator)
+            self.faiss_db = FAISS(
+                embedding_function=self.embeddings,
+                index=self.read_index(index_file),
+                docstore=docstore,
+                index_to_docstore_id=index_to_docstore_id
+            )
+        elif os.path.exists(os.path.join(path, "index.pkl")):
+            self.faiss_db = FAISS.load_local(path, embeddings=self.embeddings, allow_dangerous_deserialization=True)
+            if self.lazy_docstore:
+                # migrate to the compact docstore, written out at the next compaction
+                docstore = SQLDocstore(self.sql_operator)
+                docstore.add(self.faiss_db.docstore._dict)
+                self.faiss_db.docstore = docstore
+    
+    def read_index(self, index_file):
+        if self.use_mmap:
+            # only the inverted lists of ivf indexes are mapped, their vectors stay on disk and are paged in
+            # on demand. flat and hnsw indexes are read into memory with or without the flag
+            index = faiss.read_index(index_file, faiss.IO_FLAG_MMAP)
+            self.mmapped = self.get_index_type(index) in ("ivf_flat", "ivf_pq")
+            return index
+        return faiss.read_index(index_file)
+    
+    def ensure_writable(self):
+        """Copy an mmap-loaded index into memory before its first mutation."""
+        if self.mmapped:
+            self.faiss_db.index = faiss.clone_index(self.faiss_db.index)
+            self.mmapped = False
+            self.configure_search()
+    
+    def get_doc(self, doc_id: str):
+        if doc_id not in self.faiss_db.docstore._dict:
+            return None
+        return self.faiss_db.docstore.search(doc_id)
+    
+    def get_docs(self, doc_ids: list[str]):
+        """Return the documents of doc_ids in order, None for unknown ids."""
+        if isinstance(self.faiss_db.docstore, SQLDocstore):
+            return self.faiss_db.docstore.search_many(doc_ids)
+        return [self.get_doc(id) for id in doc_ids]
+    
+    def get_index_type(self, index):
+        if isinstance(index, faiss.IndexHNSWFlat):
+            return "hnsw"
+        if isinstance(index, faiss.IndexIVFPQ):
+            return "ivf_pq"
+        if isinstance(index, faiss.IndexIVFFlat):
+            return "ivf_flat"
+        return "flat"
+    
+    def get_target_index_type(self, num_vectors):
+        # ivf indexes need enough vectors to train their coarse quantizer, use flat until then
+        if self.index_type in ("ivf_flat", "ivf_pq") and num_vectors < self.min_train_size:
+            return "flat"
+        return self.index_type
+    
+    def build_index(self, index_type):
+        """Create an empty (untrained) faiss index of the given type."""
+        nlist = self.index_config.get('nlist', 100)
+        if index_type == "hnsw":
+            index = faiss.IndexHNSWFlat(self.dim, self.index_config.get('hnsw_m', 32))
+            index.hnsw.efConstruction = self.index_config.get('ef_construction', 40)
+        elif index_type == "ivf_flat":
+            quantizer = faiss.IndexFlatL2(self.dim)
+            index = faiss.IndexIVFFlat(quantizer, self.dim, nlist)
+        elif index_type == "ivf_pq":
+            quantizer = faiss.IndexFlatL2(self.dim)
+            index = faiss.IndexIVFPQ(quantizer, self.dim, nlist, self.index_config.get('pq_m', 16), self.index_config.get('pq_nbits', 8))
+        else:
+            index = faiss.IndexFlatL2(self.dim)
+        return index
+    
+    def configure_search(self):
+        """Apply the search-time tunables (nprobe, efSearch) to the current index."""
+        index = self.faiss_db.index
+        index_type = self.get_index_type(index)
+        if index_type in ("ivf_flat", "ivf_pq"):
+            faiss.extract_index_ivf(index).nprobe = self.index_config.get('nprobe', 8)
+        elif index_type == "hnsw":
+            index.hnsw.efSearch = self.index_config.get('ef_search', 64)
+    
+    def get_vectors(self):
+        """Return all vectors in index position order."""
+        index = self.faiss_db.index
+        if index.ntotal == 0:
+            return np.zeros((0, self.dim), dtype="float32")
+        if self.get_index_type(index) == "ivf_pq":
+            # pq codes are lossy, re-embed the stored text instead of reconstructing
+            texts = [doc.page_content for doc in self.get_docs([self.faiss_db.index_to_docstore_id[i] for i in range(index.ntotal)])]
+            return np.array(self.embeddings.embed_documents(texts), dtype="float32")
+        if self.get_index_type(index) == "ivf_flat":
+            faiss.extract_index_ivf(index).make_direct_map()
+        return index.reconstruct_n(0, index.ntotal)
+    
+    @traced("vector.rebuild")
+    def rebuild(self, index_type):
+        """Move every vector into a new index of the given type, keeping positions and ids."""
+        self.purge_tombstones()
+        vectors = self.get_vectors()
+        index = self.build_index(index_type)
+        if not index.is_trained:
+            index.train(vectors)
+        if len(vectors):
+            index.add(vectors)
+        self.faiss_db.index = index
+        self.mmapped = False
+        self.configure_search()
+        logging.info(f"Rebuilt faiss index as {index_type} with {index.ntotal} vectors")
+    
+    def sync_index_type(self):
+        """Rebuild the index if it does not match the configured type, return True if rebuilt."""
+        current = self.get_index_type(self.faiss_db.index)
+        if current == self.index_type:
+            return False
+        target = self.get_target_index_type(self.faiss_db.index.ntotal)
+        if current == target:
+            return False
+        self.rebuild(target)
+        return True
+    
+    def has_ids(self, doc_ids: list[str]):
+        return {id for id in doc_ids if id in self.faiss_db.docstore._dict}
+    
+    def apply_add(self, texts, vectors, metadatas, ids):
+        self.ensure_writable()
+        start = self.faiss_db.index.ntotal
+        self.faiss_db.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas, ids=ids)
+        for position, (id, metadata) in enumerate(zip(ids, metadatas), start):
+            self.add_postings(id, metadata)
+            if self.positions is not None:
+                self.positions[id] = position
+        self.selectors = {}
+    
+    def apply_delete(self, doc_ids):
+        # deleting is idempotent, ids that are not in the index are ignored
+        existing = self.has_ids(doc_ids)
+        if not existing:
+            return
+        for id in existing:
+            self.remove_postings(id, self.get_metadata(id))
+        self.selectors = {}
+        index_type = self.get_index_type(self.faiss_db.index)
+        if index_type == "hnsw":
+            # hnsw graphs do not support removal, the vectors stay in the graph as tombstones that
+            # every search excludes, the next compaction rebuilds the graph without them
+            positions = self.get_positions()
+            for id in existing:
+                self.tombstones.add(positions.pop(id))
+            self.faiss_db.docstore.delete(list(existing))
+            return
+        # the remaining vectors move down, positions are rebuilt on the next filtered search
+        self.positions = None
+        self.ensure_writable()
+        if index_type in ("ivf_flat", "ivf_pq"):
+            removed = np.array(sorted(p for p, id in self.faiss_db.index_to_docstore_id.items() if id in existing), dtype="int64")
+            self.faiss_db.delete([id for id in doc_ids if id in existing])
+            self.renumber_ivf(removed)
+        else:
+            self.faiss_db.delete([id for id in doc_ids if id in existing])
+    
+    @traced("vector.purge")
+    def purge_tombstones(self):
+        """Rebuild the hnsw graph without its deleted vectors, renumbering the remaining positions."""
+        if not self.tombstones:
+            return
+        index = self.faiss_db.index
+        keep = np.setdiff1d(np.arange(index.ntotal, dtype="int64"), np.array(sorted(self.tombstones), dtype="int64"))
+        purged = self.build_index(self.get_index_type(index))
+        if len(keep):
+            purged.add(index.reconstruct_batch(keep))
+        self.faiss_db.index = purged
+        self.faiss_db.index_to_docstore_id = {i: self.faiss_db.index_to_docstore_id[int(position)] for i, position in enumerate(keep)}
+        self.tombstones = set()
+        self.positions = None
+        self.selectors = {}
+        self.configure_search()
+        logging.info(f"Purged deleted vectors from the faiss index, {purged.ntotal} vectors left")
+    
+    def renumber_ivf(self, removed):
+        """Shift the ids stored in the inverted lists down to the compacted positions of index_to_docstore_id.
+        
+        Flat indexes renumber on removal, ivf indexes keep the ids of the remaining vectors.
+        """
+        invlists = faiss.extract_index_ivf(self.faiss_db.index).invlists
+        for list_no in range(invlists.nlist):
+            size = invlists.list_size(list_no)
+            if size:
+                ids = faiss.rev_swig_ptr(invlists.get_ids(list_no), size)
+                ids -= np.searchsorted(removed, ids)
+    
+    def replay(self, entries):
+        """Apply logged mutations on top of the loaded snapshot."""
+        count = 0
+        for entry in entries:
+            if entry["op"] == "add":
+                # an add replaces the document, also one that made it into the snapshot before an interrupted compaction
+                self.apply_delete([entry["id"]])
+                self.apply_add([entry["text"]], [MutationLog.decode_vector(entry["vector"])], [entry["metadata"]], [entry["id"]])
+            elif entry["op"] == "delete":
+                self.apply_delete(entry["ids"])
+            count += 1
+        if count:
+            logging.info(f"Replayed {count} mutations from the faiss mutation log")
 
     def add_documents(self, docs: list[Document]):
-        return self.faiss_db.add_documents(docs)
+        texts = [doc.page_content for doc in docs]
+        metadatas = [doc.metadata for doc in docs]
+        ids = [str(doc.id) if doc.id is not None else str(uuid.uuid4()) for doc in docs]
+        vectors = self.embeddings.embed_documents(texts)
+        return self.add_embeddings(texts, vectors, metadatas, ids)
+    
+    def add_embeddings(self, texts: list[str], vectors: list[list[float]], metadatas: list[dict], ids: list[str]):
+        # re-adding an id replaces the previous document, the log records the delete so a replay does the same
+        replaced = self.has_ids(ids)
+        self.apply_delete(ids)
+        self.apply_add(texts, vectors, metadatas, ids)
+        self.mutation_log.append(([{"op": "delete", "ids": [id for id in ids if id in replaced]}] if replaced else []) + [
+            {"op": "add", "id": id, "text": text, "metadata": metadata, "vector": MutationLog.encode_vector(vector)}
+            for id, text, metadata, vector in zip(ids, texts, metadatas, vectors)
+        ])
+        
+        # train and switch to the configured ivf index once enough vectors exist
+        if self.sync_index_type():
+            self.compact()
+        return ids
 
     def delete_documents(self, doc_ids: list[str]):
-        return self.faiss_db.delete(doc_ids)
+        doc_ids = [str(id) for id in doc_ids]
+        self.apply_delete(doc_ids)
+        self.mutation_log.append([{"op": "delete", "ids": doc_ids}])
+        return True
+    
+    def get_metadata(self, doc_id: str):
+        entry = self.faiss_db.docstore._dict[doc_id]
+        return entry["metadata"] if isinstance(entry, dict) else entry.metadata
+    
+    def add_postings(self, doc_id, metadata):
+        for key in ITEM_METADATA:
+            if metadata.get(key) is not None:
+                self.postings.setdefault((key, metadata[key]), set()).add(doc_id)
+    
+    def remove_postings(self, doc_id, metadata):
+        for key in ITEM_METADATA:
+            self.postings.get((key, metadata.get(key)), set()).discard(doc_id)
+    
+    def build_filter_index(self):
+        """Rebuild the (metadata key, value) -> doc ids postings used by filtered search."""
+        self.postings = {}
+        for doc_id in self.faiss_db.docstore._dict:
+            self.add_postings(doc_id, self.get_metadata(doc_id))
+        # doc id -> index position, built on demand
+        self.positions = None
+        # filter -> (positions, id selector), until the next mutation
+        self.selectors = {}
+        # positions of the deleted vectors still in an hnsw graph, until the next compaction
+        self.tombstones = set()
+    
+    def get_positions(self):
+        """Return doc id -> index position of the live documents."""
+        if self.positions is None:
+            self.positions = {id: position for position, id in self.faiss_db.index_to_docstore_id.items() if position not in self.tombstones}
+        return self.positions
+    
+    def get_selector(self, filter: dict):
+        """Return (positions, id selector) for filter, positions is None for an empty filter that only excludes tombstones."""
+        key = json.dumps(filter, sort_keys=True)
+        if key not in self.selectors:
+            if filter:
+                positions = self.select_positions(filter)
+                selector = faiss.IDSelectorBatch(positions) if len(positions) else None
+            else:
+                positions = None
+                excluded = faiss.IDSelectorBatch(np.array(sorted(self.tombstones), dtype="int64"))
+                selector = faiss.IDSelectorNot(excluded)
+                # the wrapper does not own the wrapped selector, keep it alive with it
+                selector.excluded = excluded
+            self.selectors[key] = (positions, selector)
+        return self.selectors[key]
+    
+    def select_positions(self, filter: dict):
+        """Index positions of the documents matching every key of filter, a list value matches any of its values."""
+        doc_ids = None
+        for key, values in filter.items():
+            values = values if isinstance(values, (list, tuple, set)) else [values]
+            matches = set().union(*(self.postings.get((key, value), ()) for value in values))
+            doc_ids = matches if doc_ids is None else doc_ids & matches
+        positions = self.get_positions()
+        return np.array(sorted(positions[id] for id in doc_ids), dtype="int64")
+    
+    def search_filtered(self, embedding: list[float], k: int, filter: dict):
+        """Search only the vectors matching filter, with an id selector instead of filtering the top results.
+        
+        An empty filter searches every live vector.
+        """
+        index = self.faiss_db.index
+        vector = np.array([embedding], dtype="float32")
+        if self.faiss_db._normalize_L2:
+            faiss.normalize_L2(vector)
+        index_type = self.get_index_type(index)
+        if not filter and not self.tombstones:
+            distances, indices = index.search(vector, min(k, index.ntotal)) if index.ntotal else ([[]], [[]])
+            return self.to_docs_and_scores(distances[0], indices[0])
+        
+        positions, selector = self.get_selector(filter)
+        count = len(positions) if positions is not None else index.ntotal - len(self.tombstones)
+        if selector is None or count == 0:
+            return []
+        k = min(k, count)
+        
+        if index_type == "hnsw" and positions is not None and count <= self.index_config.get('filter_exact_max', 2048):
+            # the graph walk rarely reaches a few scattered vectors, compare against them directly
+            distances, indices = faiss.knn(vector, index.reconstruct_batch(positions), k)
+            indices = positions[indices]
+        else:
+            if index_type in ("ivf_flat", "ivf_pq"):
+                params = faiss.SearchParametersIVF(sel=selector, nprobe=self.index_config.get('nprobe', 8))
+            elif index_type == "hnsw":
+                # widen the search in proportion to the share of vectors the filter excludes
+                ef_search = self.index_config.get('ef_search', 64)
+                params = faiss.SearchParametersHNSW(sel=selector, efSearch=min(max(ef_search, k * index.ntotal // count), 4096))
+            else:
+                params = faiss.SearchParameters(sel=selector)
+            distances, indices = index.search(vector, k, params=params)
+        return self.to_docs_and_scores(distances[0], indices[0])
+    
+    def to_docs_and_scores(self, distances, positions):
+        """Pair the documents at the given index positions with their distances, skipping -1 (no result)."""
+        hits = [(int(position), float(distance)) for distance, position in zip(distances, positions) if position != -1]
+        docs = self.get_docs([self.faiss_db.index_to_docstore_id[position] for position, _ in hits])
+        return [(doc, distance) for doc, (_, distance) in zip(docs, hits)]
     
     def search_documents(self, query: str, k: int = 5, filter: dict = None, score_type: str = "relevance", score_threshold: float = None):
+        return self.search_documents_by_vector(self.embeddings.embed_query(query), k=k, filter=filter, score_type=score_type, score_threshold=score_threshold)
+    
+    def search_documents_by_vector(self, embedding: list[float], k: int = 5, filter: dict = None, score_type: str = "relevance", score_threshold: float = None):
+        docs_and_scores = self.search_filtered(embedding, k, filter or {})
         if score_type == "relevance":
-            return self.faiss_db.similarity_search_with_relevance_scores(query, k=k, filter=filter, score_threshold=score_threshold)
-        elif score_type == "distance":
-            return self.faiss_db.similarity_search_with_score(query, k=k, filter=filter)
+            return self.to_relevance(self.faiss_db, docs_and_scores, score_threshold)
+        return docs_and_scores
     
     def get_by_ids(self, doc_ids: list[str]):
-        return [self.faiss_db.docstore._dict.get(id, None) for id in doc_ids]
+        return self.get_docs(doc_ids)
+    
+    def shadow(self, path: str, fresh: bool = True):
+        config = copy.deepcopy(self.config)
+        config['paths']['faiss_db'] = path
+        # the shadow's mutation log is its checkpoint, snapshots every compact_every adds would rewrite the growing index
+        config.setdefault('faiss_log', {})['compact_every'] = float('inf')
+        if fresh and os.path.exists(path):
+            shutil.rmtree(path)
+        return FAISSVectorDB(self.embeddings, config, sql_operator=self.sql_operator)
+    
+    def swap(self, shadow):
+        self.faiss_db = shadow.faiss_db
+        self.mmapped = shadow.mmapped
+        self.postings, self.positions, self.tombstones, self.selectors = shadow.postings, shadow.positions, shadow.tombstones, {}
+        self.sync_index_type()
+        self.configure_search()
+        # the new snapshot replaces the old one together with its mutation log
+        self.compact()
     
     def save(self):
-        self.faiss_db.save_local(self.config['paths']['faiss_db'])
+        # mutations are already durable in the log, only fold them into a snapshot once it grows
+        if self.mutation_log.size >= self.compact_every:
+            self.compact()
+    
+    @traced("vector.compact")
+    def compact(self):
+        """Write a full snapshot of the index and clear the mutation log."""
+        path = self.config['paths']['faiss_db']
+        os.makedirs(path, exist_ok=True)
+        self.purge_tombstones()
+        if self.lazy_docstore:
+            # compact format: raw faiss index plus item_id metadata, no pickled text
+            tmp_file = os.path.join(path, "index.faiss.tmp")
+            faiss.write_index(self.faiss_db.index, tmp_file)
+            os.replace(tmp_file, os.path.join(path, "index.faiss"))
+            self.faiss_db.docstore.save(os.path.join(path, "docstore.json"), self.faiss_db.index_to_docstore_id)
+            stale_file = os.path.join(path, "index.pkl")
+        else:
+            if isinstance(self.faiss_db.docstore, SQLDocstore):
+                doc_ids = list(self.faiss_db.docstore._dict)
+                self.faiss_db.docstore = InMemoryDocstore(dict(zip(doc_ids, self.get_docs(doc_ids))))
+            self.faiss_db.save_local(path)
+            stale_file = os.path.join(path, "docstore.json")
+        if os.path.exists(stale_file):
+            os.remove(stale_file)
+        self.mutation_log.truncate()
+        logging.info("Compacted the faiss mutation log into a snapshot")
     
     def reset(self):
         if os.path.exists(self.config['paths']['faiss_db']):
             shutil.rmtree(self.config['paths']['faiss_db'])
             os.mkdir(self.config['paths']['faiss_db'])
             print("Deleted existing faiss db")
+        self.mutation_log.truncate()
         
         # Reinitialize the faiss db
         self.faiss_db = FAISS(
             embedding_function=self.embeddings,
-            index=faiss.IndexFlatL2(len(self.embeddings.embed_query("hello world"))),
-            docstore=InMemoryDocstore(),
+            index=self.build_index(self.get_target_index_type(0)),
+            docstore=self.new_docstore(),
             index_to_docstore_id={}
         )
+        self.mmapped = False
+        self.build_filter_index()
+        self.configure_search()
 
 
 class ChromaVectorDB(BaseVectorDB):
-    def __init__(self, embeddings, config):
+    def __init__(self, embeddings, config, collection_name="langchain"):
         self.config = config
-        self.chroma_db = Chroma(persist_directory=config['paths']['chroma_db'], embedding_function=embeddings)
+        self.embeddings = embeddings
+        self.collection_name = collection_name
+        self.chroma_db = Chroma(collection_name=collection_name, persist_directory=config['paths']['chroma_db'], embedding_function=embeddings)
         
     def add_documents(self, docs: list[Document]):
         return self.chroma_db.add_documents(docs)
+    
+    def add_embeddings(self, texts: list[str], vectors: list[list[float]], metadatas: list[dict], ids: list[str]):
+        self.chroma_db._collection.upsert(ids=ids, embeddings=vectors, metadatas=metadatas, documents=texts)
+        return ids
 
     def delete_documents(self, doc_ids: list[str]):
         return self.chroma_db.delete(doc_ids)
     
+    def to_where(self, filter: dict):
+        """Turn a metadata filter ({key: value or list of values}) into a chroma where clause."""
+        if not filter:
+            return None
+        clauses = [
+            {key: {"$in": list(values)}} if isinstance(values, (list, tuple, set)) else {key: values}
+            for key, values in filter.items()
+        ]
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+    
     def search_documents(self, query: str, k: int = 5, filter: dict = None, score_type: str = "relevance", score_threshold: float = None):
         if score_type == "relevance":
-            res = self.chroma_db.similarity_search_with_relevance_scores(query, k=k, filter=filter, score_threshold=score_threshold)
+            res = self.chroma_db.similarity_search_with_relevance_scores(query, k=k, filter=self.to_where(filter), score_threshold=score_threshold)
         elif score_type == "distance":
-            res = self.chroma_db.similarity_search_with_score(query, k=k, filter=filter)
+            res = self.chroma_db.similarity_search_with_score(query, k=k, filter=self.to_where(filter))
         return res
     
+    def search_documents_by_vector(self, embedding: list[float], k: int = 5, filter: dict = None, score_type: str = "relevance", score_threshold: float = None):
+        docs_and_scores = self.chroma_db.similarity_search_by_vector_with_relevance_scores(embedding, k=k, filter=self.to_where(filter))
+        if score_type == "relevance":
+            return self.to_relevance(self.chroma_db, docs_and_scores, score_threshold)
+        return docs_and_scores
+    
     def get_doc_ids(self, filter: dict):
         res = self.chroma_db.get(where=filter)
         return res['ids']
@@ -102,6 +693,19 @@ class ChromaVectorDB(BaseVectorDB):
     def get_by_ids(self, doc_ids: list[str]):
         return self.chroma_db.get_by_ids(doc_ids)
     
+    def shadow(self, path: str, fresh: bool = True):
+        # a second collection in the same persistent client, chroma persists every upsert itself
+        shadow = ChromaVectorDB(self.embeddings, self.config, collection_name=self.collection_name + "_rebuild")
+        if fresh:
+            shadow.chroma_db.delete_collection()
+            shadow = ChromaVectorDB(self.embeddings, self.config, collection_name=self.collection_name + "_rebuild")
+        return shadow
+    
+    def swap(self, shadow):
+        self.chroma_db.delete_collection()
+        shadow.chroma_db._collection.modify(name=self.collection_name)
+        self.chroma_db = Chroma(collection_name=self.collection_name, persist_directory=self.config['paths']['chroma_db'], embedding_function=self.embeddings)
+    
     def save(self):
         pass
     
@@ -111,23 +715,43 @@ class ChromaVectorDB(BaseVectorDB):
             shutil.rmtree(self.config['paths']['chroma_db'])
             os.mkdir(self.config['paths']['chroma_db'])
             print("Deleted existing chroma db")
-        self.chroma_db = Chroma(persist_directory=self.config['paths']['chroma_db'], embedding_function=self.embeddings)
+        self.chroma_db = Chroma(collection_name=self.collection_name, persist_directory=self.config['paths']['chroma_db'], embedding_function=self.embeddings)
 
 
 class VectorDBOperator:
-    def __init__(self, sql_operator: SQLDBOperator, vector_db_type="chroma"):
+    def __init__(self, sql_operator: SQLDBOperator, vector_db_type="chroma", config=None, embeddings=None):
         self.sql_operator = sql_operator  # Store the SQLDBOperator instance
-        self.config = self.load_config('config.yaml')
-        self.embeddings = OllamaEmbeddings(model=self.config['embed_model'])
+        self.config = config if config is not None else self.load_config('config.yaml')
+        self.embeddings = embeddings if embeddings is not None else get_ollama_clients(self.config).embeddings(self.config['embed_model'])
+        cache_config = self.config.get('embedding_cache', {})
+        if cache_config.get('enabled', False):
+            # repeated queries and unchanged item text are served from the cache
+            self.embeddings = CachedEmbeddings(
+                self.embeddings,
+                model_name=self.config['embed_model'],
+                db_path=self.config['paths']['embedding_cache'],
+                max_memory_entries=cache_config.get('max_memory_entries', 10000),
+                max_stored_entries=cache_config.get('max_stored_entries', 200000)
+            )
         self.top_k = self.config['semantic_search_k']
         self.tbl_name = 'item'
+        # the vector stores are not thread-safe, serialize access when shared across chat turns
+        self.lock = threading.RLock()
         
         # select the vector database type
         if vector_db_type == "faiss":
-            self.vector_db = FAISSVectorDB(self.embeddings, self.config)
+            self.vector_db = FAISSVectorDB(self.embeddings, self.config, sql_operator=self.sql_operator)
         elif vector_db_type == "chroma":
             self.vector_db = ChromaVectorDB(self.embeddings, self.config)
         
+        # streaming re-index, see reindex in config.yaml
+        self.reindex_config = self.config.get('reindex', {})
+        self.reindex_dir = self.config['paths'].get('reindex_dir', "reindex/")
+        self.reindex_lock = threading.Lock()
+        # while a rebuild is running or interrupted, the ids touched by live writes are logged and
+        # re-read into the shadow index before it is swapped in
+        self.dirty_log = MutationLog(os.path.join(self.reindex_dir, "dirty.log")) if self.load_checkpoint() else None
+        
         # Set up logging
         logging.basicConfig(filename=self.config['paths']['logging_file'], level=logging.INFO)
 
@@ -144,11 +768,11 @@ class VectorDBOperator:
             content = entry.get("content", "")
             id = entry['item_id']
             
-            # Create a Document instance with the current entry's data
+            # Create a Document instance with the current entry's data, with the metadata search filters use
             doc = Document(
-                id = id,
+                id = str(id),
                 page_content=title+" "+content,
-                metadata={"item_id": id}
+                metadata={"item_id": id, **{key: entry[key] for key in ITEM_METADATA if entry.get(key) is not None}}
             )
             docs.append(doc)
         return docs
@@ -157,58 +781,208 @@ class VectorDBOperator:
         return [str(doc.metadata['item_id']) for doc in docs]
     
     def get_doc_by_id(self, doc_ids: list[str]):
-        return self.vector_db.get_by_ids(doc_ids)
+        with self.lock:
+            return self.vector_db.get_by_ids(doc_ids)
+    
+    def load_checkpoint(self):
+        path = os.path.join(self.reindex_dir, "checkpoint.json")
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r') as file:
+            return json.load(file)
+    
+    def save_checkpoint(self, checkpoint):
+        path = os.path.join(self.reindex_dir, "checkpoint.json")
+        with open(path + ".tmp", 'w') as file:
+            json.dump(checkpoint, file)
+        os.replace(path + ".tmp", path)
+    
+    def mark_dirty(self, doc_ids):
+        """Log ids changed in the live index while a rebuild is in progress, call with the lock held."""
+        if self.dirty_log is not None:
+            self.dirty_log.append([{"op": "dirty", "ids": [str(id) for id in doc_ids]}])
+    
+    def embed_items(self, rows: list[dict]):
+        docs = self.create_documents(rows)
+        return docs, self.embeddings.embed_documents([doc.page_content for doc in docs])
     
-    def init_vector_db(self):
-        """Initialize the vector database with the data from the SQL database."""
+    def add_embedded(self, store, docs, vectors):
+        store.add_embeddings([doc.page_content for doc in docs], vectors, [doc.metadata for doc in docs], [doc.id for doc in docs])
+    
+    def refresh_shadow(self, shadow, entries):
+        """Re-read the items changed during the rebuild from SQL, deleted items are dropped from the shadow."""
+        doc_ids = list({id for entry in entries for id in entry["ids"]})
+        if not doc_ids:
+            return
+        shadow.delete_documents(doc_ids)
+        rows = self.sql_operator.get_item_texts([int(id) for id in doc_ids if id.isdigit()])
+        if rows:
+            self.add_embedded(shadow, *self.embed_items(rows))
+    
+    def apply_changes(self, item_ids: list[int]):
+        """Bring the documents of the given items in line with the item table.
         
-        # Clear the vector database
-        self.vector_db.reset()
+        Items that still exist are re-embedded and replace their documents, the others are
+        deleted. Applying the same ids twice leaves the same index.
+        """
+        rows = self.sql_operator.get_item_texts(item_ids)
+        docs, vectors = self.embed_items(rows) if rows else ([], [])
+        gone = [str(id) for id in set(item_ids) - {row["item_id"] for row in rows}]
+        with self.lock:
+            if gone:
+                self.vector_db.delete_documents(gone)
+            if docs:
+                self.add_embedded(self.vector_db, docs, vectors)
+            self.mark_dirty([str(id) for id in item_ids])
+            self.vector_db.save()
+    
+    @traced("vector.init")
+    def init_vector_db(self, resume=True):
+        """Re-index the item table into a shadow index and swap it in when complete.
         
-        # Load data from sql database
-        print(f"Loading data from item table in SQL database")
-        result = self.sql_operator.select(self.tbl_name, '*', None)
-        if result['status'] == 1:
-            data = result['data']
-            data = self.sql_operator.object_list_as_dict(data)
-            docs = self.create_documents(data)
-            self.vector_db.add_documents(docs)
-            logging.info(f"Data from {self.tbl_name} inserted into the vector database")
-        else:
-            logging.error(f"Error fetching data from {self.tbl_name}: {result['message']}")
+        Items are paged by item_id and embedded in batches on a worker pool with a bounded
+        read-ahead, so memory does not grow with the table. The live index keeps serving until
+        the swap. Progress is checkpointed under paths.reindex_dir and an interrupted rebuild
+        continues from its last checkpoint unless resume is False.
+        """
+        batch_size = self.reindex_config.get('batch_size', 256)
+        workers = self.reindex_config.get('workers', 4)
+        checkpoint_every = self.reindex_config.get('checkpoint_every', 10)
         
-        self.vector_db.save()
-        logging.info("Vector database initialized")
+        with self.reindex_lock:
+            checkpoint = self.load_checkpoint() if resume else None
+            fresh = checkpoint is None
+            with self.lock:
+                if fresh:
+                    shutil.rmtree(self.reindex_dir, ignore_errors=True)
+                    os.makedirs(self.reindex_dir)
+                    checkpoint = {"after_id": 0, "indexed": 0}
+                    self.save_checkpoint(checkpoint)
+                # live writes from here on are re-read before the swap
+                self.dirty_log = MutationLog(os.path.join(self.reindex_dir, "dirty.log"))
+            shadow = self.vector_db.shadow(os.path.join(self.reindex_dir, "shadow"), fresh=fresh)
+            print(f"{'Starting' if fresh else 'Resuming'} re-index of the {self.tbl_name} table after item {checkpoint['after_id']}")
+            
+            # batches are added in item_id order, so the checkpoint covers every item up to after_id
+            pending = deque()
+            batches = 0
+            def drain(limit):
+                nonlocal batches
+                while len(pending) > limit:
+                    last_id, future = pending.popleft()
+                    docs, vectors = future.result()
+                    self.add_embedded(shadow, docs, vectors)
+                    checkpoint["after_id"] = last_id
+                    checkpoint["indexed"] += len(docs)
+                    batches += 1
+                    if batches % checkpoint_every == 0:
+                        self.save_checkpoint(checkpoint)
+            
+            # re-indexing embeds every item, interactive turns go first
+            with priority(BACKGROUND), ThreadPoolExecutor(max_workers=workers, thread_name_prefix="reindex") as executor:
+                for rows in self.sql_operator.iter_item_texts(batch_size, checkpoint["after_id"]):
+                    pending.append((rows[-1]["item_id"], submit(executor, self.embed_items, rows)))
+                    drain(workers)
+                drain(0)
+                self.save_checkpoint(checkpoint)
+                
+                # catch up on live writes, most of them before taking the lock
+                entries = list(self.dirty_log.read())
+                self.refresh_shadow(shadow, entries)
+                with self.lock:
+                    self.refresh_shadow(shadow, list(self.dirty_log.read())[len(entries):])
+                    self.vector_db.swap(shadow)
+                    self.dirty_log = None
+                    shutil.rmtree(self.reindex_dir, ignore_errors=True)
+        logging.info(f"Vector database initialized with {checkpoint['indexed']} items from {self.tbl_name}")
         print("Vector database initialized")
         
         
+    @traced("vector.insert")
     def insert(self, docs: list[Document]):
         """Insert data into the vector database."""
-        self.vector_db.add_documents(docs)
-        self.vector_db.save()
+        with self.lock:
+            self.vector_db.add_documents(docs)
+            self.mark_dirty([doc.id for doc in docs if doc.id is not None])
+            self.vector_db.save()
         logging.info("Documents inserted into the vector database")
         print("Documents inserted into the vector database")
     
+    @traced("vector.delete")
     def delete(self, doc_ids: list[str]):
         """Delete documents from the vector database."""
-        self.vector_db.delete_documents(doc_ids)
-        self.vector_db.save()
+        with self.lock:
+            self.vector_db.delete_documents(doc_ids)
+            self.mark_dirty(doc_ids)
+            self.vector_db.save()
         logging.info("Documents deleted from the vector database")
         print("Documents deleted from the vector database")
     
-    def update(self, doc_ids, new_data):
-        """Update documents in the vector database."""
-        self.delete(doc_ids)
-        self.insert(new_data)
-        self.vector_db.save()
+    @traced("vector.update")
+    def update(self, doc_ids: list[str]):
+        """Re-embed documents from their rows in the item table, through apply_changes like the changelog sync."""
+        self.apply_changes([int(doc_id) for doc_id in doc_ids])
         logging.info("Documents updated in the vector database")
         print("Documents updated in the vector database")
     
-    def search(self, query: str):
-        """Search for similar documents in the vector database."""
-        results = self.vector_db.search_documents(query, k=self.top_k, score_threshold=0.3)
+    def get_filter(self, filter: dict = None):
+        """The retrieval.filter of config.yaml with the keys of filter added or replaced."""
+        return {**self.config.get('retrieval', {}).get('filter', {}), **(filter or {})}
+    
+    def search(self, query: str, filter: dict = None):
+        """Search for similar documents in the vector database, among the documents matching the filter."""
+        filter = self.get_filter(filter)
+        with span("vector.search", k=self.top_k, filter=filter) as current:
+            # the query is embedded outside the lock, only the index lookup is serialized
+            results = self.search_by_vector(self.embeddings.embed_query(query), filter)
+            current.set(results=len(results))
+        return results
+    
+    async def asearch(self, query: str, filter: dict = None):
+        """Async search, only the query embedding is awaited."""
+        filter = self.get_filter(filter)
+        with span("vector.search", k=self.top_k, filter=filter) as current:
+            embedding = await self.embeddings.aembed_query(query)
+            # the index lookup itself is short, but a writer may hold the lock while it embeds
+            results = await asyncio.to_thread(self.search_by_vector, embedding, filter)
+            current.set(results=len(results))
         return results
     
+    def search_by_vector(self, embedding, filter: dict = None):
+        with self.lock:
+            return self.vector_db.search_documents_by_vector(embedding, k=self.top_k, filter=filter, score_threshold=0.3)
+    
+    def hybrid_search(self, query: str, filter: dict = None):
+        """Fuse vector and BM25 keyword rankings with reciprocal rank fusion, return ranked item ids."""
+        return self.hybrid_search_by_vector(query, self.embeddings.embed_query(query), filter)
+    
+    @traced("vector.hybrid_search")
+    def hybrid_search_by_vector(self, query: str, embedding, filter: dict = None):
+        """hybrid_search for a query that is already embedded, the text is still needed for the keyword ranking."""
+        keyword_k = self.config.get('retrieval', {}).get('keyword_k', self.top_k)
+        vector_ids = self.get_id_by_doc([record[0] for record in self.search_by_vector(embedding, self.get_filter(filter))])
+        keyword_ids = [str(item_id) for item_id, _ in self.sql_operator.keyword_search(query, k=keyword_k, filter=self.get_filter(filter))]
+        return self.fuse_rankings(vector_ids, keyword_ids)
+    
+    @traced("vector.hybrid_search")
+    async def ahybrid_search(self, query: str, filter: dict = None):
+        keyword_k = self.config.get('retrieval', {}).get('keyword_k', self.top_k)
+        vector_results, keyword_results = await asyncio.gather(
+            self.asearch(query, filter), self.sql_operator.akeyword_search(query, k=keyword_k, filter=self.get_filter(filter))
+        )
+        vector_ids = self.get_id_by_doc([record[0] for record in vector_results])
+        keyword_ids = [str(item_id) for item_id, _ in keyword_results]
+        return self.fuse_rankings(vector_ids, keyword_ids)
+    
+    def fuse_rankings(self, vector_ids, keyword_ids):
+        """Reciprocal rank fusion of the vector and keyword rankings."""
+        rrf_k = self.config.get('retrieval', {}).get('rrf_k', 60)
+        scores = {}
+        for ranking in (vector_ids, keyword_ids):
+            for rank, item_id in enumerate(ranking):
+                scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (rrf_k + rank + 1)
+        return sorted(scores, key=scores.get, reverse=True)[:self.top_k]
+    
         
 # Example usage
 if __name__ == "__main__":
@@ -240,14 +1014,8 @@ if __name__ == "__main__":
     # print(doc_to_update)
     # doc_id_to_update = vector_db_operator.get_doc_ids([doc_to_update])
     # print(doc_id_to_update)
-    # new_data = [
-    #     {
-    #         "item_id": 1,
-    #         "title": "Updated meeting",
-    #         "content": "Updated meeting content"
-    #     }
-    # ]
-    # vector_db_operator.update(doc_id_to_update, new_data)
+    # db_operator.update_items([int(doc_id) for doc_id in doc_id_to_update], {"title": "Updated meeting"})
+    # vector_db_operator.update(doc_id_to_update)
     
     # test insert
     # new_data = [